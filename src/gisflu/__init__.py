@@ -1,10 +1,45 @@
 from .login import login
+from .credentials import credentials
 from .utils import log
-from .browse import search
-from .download import download
+from .browse import search, count
+from .download import download, downloadRecords, parallelDownload
+from .pool import sessionPool
+from .scheduler import scheduler
+from .batch import loadJobs, runBatch
+from .warehouse import warehouse, localSearch, diff
+from .metadata import metadataChunks
+from .sequences import sequenceStore
+from .cassette import cassette
+from .deadline import cancelToken, cancelledError
+from .workqueue import workQueue, splitByDate, splitByIds, runWorker
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-__all__ = ["log", "login", "search", "download"]
+__all__ = [
+    "log",
+    "login",
+    "credentials",
+    "search",
+    "count",
+    "download",
+    "downloadRecords",
+    "parallelDownload",
+    "sessionPool",
+    "scheduler",
+    "loadJobs",
+    "runBatch",
+    "warehouse",
+    "localSearch",
+    "diff",
+    "metadataChunks",
+    "sequenceStore",
+    "cassette",
+    "cancelToken",
+    "cancelledError",
+    "workQueue",
+    "splitByDate",
+    "splitByIds",
+    "runWorker",
+]
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .browse import search
+from .download import download
+from .compress import openOutput
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+
+def loadJobs(path: str) -> dict:
+    """
+    Load a query file of batch jobs.
+
+    The file is JSON, or YAML if its extension is `.yaml`/`.yml` (requires `pyyaml`).
+    It holds a `jobs` list, each job with a `name` and exactly one of `search` or
+    `download`, whose value is the keyword arguments of `gisflu.search()` or
+    `gisflu.download()`. Search jobs write `<name>.csv`, or the file named by an
+    optional `output` key, compressed if it ends with `.gz`, `.bgz` or `.zst`
+    (download jobs take a `filename` the same way). Optional top-level
+    `concurrency` and `outdir` keys give defaults for the command line.
+
+    Args:
+        path (str): Path of the query file.
+
+    Return:
+        dict: The parsed query file.
+
+    Example:
+        ```
+        # jobs.yaml
+        concurrency: 4
+        outdir: results
+        jobs:
+          - name: h3n2-2024
+            search: {type: [A], HA: ["3"], NA: ["2"], collectDateFrom: "2024-01-01"}
+            output: h3n2-2024.csv.gz
+          - name: h3n2-seqs
+            download: {isolateIds: [EPI_ISL_19185107], segments: [HA, NA]}
+        ```
+    """
+
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML query files requires pyyaml")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    assert isinstance(config, dict) and "jobs" in config, "Query file needs a jobs list"
+
+    for i, job in enumerate(config["jobs"]):
+        actions = [k for k in ["search", "download"] if k in job]
+        assert len(actions) == 1, f"Job {i} needs exactly one of search|download"
+        job.setdefault("name", f"job{i + 1}")
+
+    names = [job["name"] for job in config["jobs"]]
+    assert len(names) == len(set(names)), "Job names must be unique"
+
+    return config
+
+
+def runJob(cred, job: dict, outdir: str) -> dict:
+    name = job["name"]
+    start = time.perf_counter()
+
+    if "search" in job:
+        params = dict(job["search"])
+        df = search(cred, **params)
+        filename = os.path.join(outdir, job.get("output", f"{name}.csv"))
+        with openOutput(filename, "wt") as f:
+            df.to_csv(f, index=False)
+        action, rows = "search", df.shape[0]
+    else:
+        params = dict(job["download"])
+        if "filename" in params:
+            filename = os.path.join(outdir, params["filename"])
+        else:
+            extension = "xls" if params.get("downloadType") == "metadata" else "fasta"
+            filename = os.path.join(outdir, f"{name}.{extension}")
+        params["filename"] = filename
+        download(cred, **params)
+        action, rows = "download", len(params["isolateIds"])
+
+    return {
+        "name": name,
+        "action": action,
+        "status": "ok",
+        "rows": rows,
+        "bytes": os.path.getsize(filename),
+        "seconds": time.perf_counter() - start,
+        "output": filename,
+    }
+
+
+def runBatch(
+    pool, jobs: list[dict], outdir: str, concurrency: int | None = None
+) -> dict:
+    """
+    Run batch jobs concurrently over a session pool.
+
+    Args:
+        pool (sessionPool): The sessions to run the jobs on.
+        jobs (list[dict]): Jobs as returned in `loadJobs()["jobs"]`.
+        outdir (str): Directory of the output files, created if missing.
+        concurrency (int, optional): The number of jobs in flight. Defaults to the pool size.
+
+    Return:
+        dict: A summary with per-job results and overall timings.
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+    concurrency = concurrency or pool.size
+
+    def worker(job):
+        waitStart = time.perf_counter()
+        with pool.session() as cred:
+            waited = time.perf_counter() - waitStart
+            logger.debug(f"Run job {job['name']} on {cred}")
+            try:
+                result = runJob(cred, job, outdir)
+            except Exception as e:
+                logger.error(f"Job {job['name']} failed: {e!r}")
+                action = "search" if "search" in job else "download"
+                result = {"name": job["name"], "action": action, "status": "failed"}
+                result["error"] = repr(e)
+        result["waited"] = waited
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, jobs))
+    elapsed = time.perf_counter() - start
+
+    done = [r for r in results if r["status"] == "ok"]
+    totalRows = sum(r["rows"] for r in done)
+    totalBytes = sum(r["bytes"] for r in done)
+
+    return {
+        "jobs": results,
+        "succeeded": len(done),
+        "failed": len(results) - len(done),
+        "seconds": elapsed,
+        "rows": totalRows,
+        "bytes": totalBytes,
+        "rowsPerSecond": totalRows / elapsed if elapsed > 0 else 0.0,
+        "bytesPerSecond": totalBytes / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def formatSummary(summary: dict) -> str:
+    lines = [
+        f"{'job':<24} {'action':<9} {'status':<7} {'rows':>9} {'bytes':>12} {'wait s':>8} {'run s':>8}"
+    ]
+    for r in summary["jobs"]:
+        if r["status"] == "ok":
+            lines.append(
+                f"{r['name']:<24} {r['action']:<9} {r['status']:<7} {r['rows']:>9} "
+                f"{r['bytes']:>12} {r['waited']:>8.2f} {r['seconds']:>8.2f}"
+            )
+        else:
+            lines.append(
+                f"{r['name']:<24} {r['action']:<9} {r['status']:<7} {r['error']}"
+            )
+    lines.append(
+        f"{summary['succeeded']} succeeded, {summary['failed']} failed "
+        f"in {summary['seconds']:.2f}s: "
+        f"{summary['rowsPerSecond']:.1f} rows/s, "
+        f"{summary['bytesPerSecond'] / 1024:.1f} KiB/s"
+    )
+
+    return "\n".join(lines)
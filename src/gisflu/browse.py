@@ -1,14 +1,26 @@
 import re
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from .utils import (
     buildCommand,
     buildRequestBody,
-    buildBrowseCommand,
-    buildBatch,
+    buildSearchCommand,
+    parseCount,
+    resetCommand,
+    browseToResultPage,
     resultToBrowsePage,
-    httpGet,
     httpPost,
+    checkToken,
+    tokenScope,
 )
+from .deadline import cancelToken
 from .credentials import credentials
+from .paging import pageSizeTuner
+from .warehouse import warehouse
 from tqdm import tqdm
 import pandas as pd
 import logging
@@ -18,13 +30,124 @@ logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.NullHandler())
 
 
+dropLabels = ["__toggle__", "edit", "HE", "P3"]
+htmlLabels = ["Name", "PB2", "PB1", "PA", "HA", "NP", "NA", "MP", "NS"]
+htmlPattern = re.compile(r"^.+?>(.+?)</.+$")
+
+
+def resultColumnsOf(cred):
+    # an empty list per kept result column, keyed by the server-side key
+    resultColumns = {
+        key: []
+        for key, label in cred.resultHeaderDict.items()
+        if label not in dropLabels
+    }
+    htmlKeys = {
+        key for key, label in cred.resultHeaderDict.items() if label in htmlLabels
+    }
+
+    return resultColumns, htmlKeys
+
+
+def stripHtml(value):
+    if isinstance(value, str):
+        return htmlPattern.sub(r"\1", value)
+    return value
+
+
+def projectRecords(records, resultColumns, htmlKeys):
+    """
+    Append result records to the column lists, keeping only the kept columns and
+    stripping HTML wrappers, so that the full record dicts can be released page by page.
+    """
+    for record in records:
+        for key, values in resultColumns.items():
+            value = record.get(key)
+            values.append(stripHtml(value) if key in htmlKeys else value)
+
+    return None
+
+
+def projectPage(records, resultColumns, htmlKeys):
+    # project one page into new column lists, runs in a parse worker process
+    pageColumns = {key: [] for key in resultColumns}
+    projectRecords(records, pageColumns, htmlKeys)
+
+    return pageColumns
+
+
+def fetchPages(cred, tuner, total, pages, stop):
+    """
+    Fetch result pages into the pages queue, ending with None, or with the exception that stopped the fetching.
+    """
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        start = 0
+        while start < total and not stop.is_set():
+            checkToken()
+            count = min(tuner.size, total - start)
+            cmdPipe = [
+                buildCommand(
+                    CompId=cred.resultPage["resultCompId"],
+                    cmd="SetPaginating",
+                    params={"start_index": start, "rows_per_page": count},
+                ),
+                buildCommand(CompId=cred.resultPage["resultCompId"], cmd="GetData"),
+            ]
+
+            body = buildRequestBody(
+                cred.sessionId, cred.windowId, cred.resultPage["pid"], cmdPipe
+            )
+            requestStart = time.perf_counter()
+            res = httpPost(
+                cred.url, data=body, headers=cred.headers, httpClient=cred.client
+            )
+            elapsed = time.perf_counter() - requestStart
+
+            try:
+                records = res.json()["records"]
+            except (ValueError, KeyError):
+                records = None
+
+            if res.status_code >= 400 or records is None:
+                assert tuner.fail(count), f"Failed to fetch records from {start}"
+                continue
+
+            if len(records) == 0:
+                # fewer records than counted, the results end here
+                logger.warning(f"No records returned from {start}, of {total}")
+                break
+            tuner.record(count, len(records), elapsed)
+            start += len(records)
+            if not put(records):
+                return None
+    except BaseException as e:
+        put(e)
+        return None
+
+    put(None)
+
+    return None
+
+
 def search(
     cred: credentials,
     searchPattern: str | None = None,
     type: list[str] | None = None,
     HA: list[str] | None = None,
     NA: list[str] | None = None,
+    lineage: list[str] | None = None,
     host: list[str] | None = None,
+    location: str | None = None,
     collectDateFrom: str | None = None,
     collectDateTo: str | None = None,
     submitDateFrom: str | None = None,
@@ -32,6 +155,10 @@ def search(
     requestSegments: list[str] | None = None,
     onlyComplete: bool = False,
     recordLimit: int = 50,
+    pageSize: int | None = None,
+    store: warehouse | None = None,
+    parseWorkers: int | None = None,
+    token: cancelToken | None = None,
 ) -> pd.DataFrame:
     """
     Search for records in the GISAID Flu database based on specified criteria.
@@ -42,7 +169,9 @@ def search(
         type (list[str], optional): A list of virus types to filter the search results. Defaults to None.
         HA (list[str], optional): A list of hemagglutinin (HA) subtypes to filter the search results. Defaults to None.
         NA (list[str], optional): A list of neuraminidase (NA) subtypes to filter the search results. Defaults to None.
+        lineage (list[str], optional): A list of lineages to filter the search results. Defaults to None.
         host (list[str], optional): A list of host species to filter the search results. Defaults to None.
+        location (str, optional): A location to filter the search results, such as "Asia / China". Defaults to None.
         collectDateFrom (str, optional): The starting date for the collection date filter. Defaults to None.
         collectDateTo (str, optional): The ending date for the collection date filter. Defaults to None.
         submitDateFrom (str, optional): The starting date for the submission date filter. Defaults to None.
@@ -50,6 +179,10 @@ def search(
         requestSegments (list[str], optional): A list of requested segments to filter the search results. Defaults to None.
         onlyComplete (bool, optional): Whether to only return records with complete sequences of requested segments. Defaults to False.
         recordLimit (int, optional): The maximum number of records to return. Defaults to 50.
+        pageSize (int, optional): The number of records fetched per request. If not provided, it is tuned at runtime and remembered for the session.
+        store (warehouse, optional): A local warehouse to sync the results into. Defaults to None.
+        parseWorkers (int, optional): The number of processes parsing result pages. Defaults to None, pages are parsed in this process while the next page is fetched.
+        token (cancelToken, optional): A deadline and cancellation token, checked between result pages. Defaults to None.
 
     Return:
         pd.DataFrame: A DataFrame containing the search results.
@@ -62,117 +195,194 @@ def search(
         ```
     """
 
-    # search by command pipeline
-    cmdPipe = []
-    if searchPattern:
-        cmdPipe += buildBrowseCommand(cred, "searchPattern", searchPattern)
-    if type:
-        cmdPipe += buildBrowseCommand(cred, "type", type)
-    if HA:
-        cmdPipe += buildBrowseCommand(cred, "HA", HA)
-    if NA:
-        cmdPipe += buildBrowseCommand(cred, "NA", NA)
-    if host:
-        cmdPipe += buildBrowseCommand(cred, "host", host)
-    if collectDateFrom:
-        cmdPipe += buildBrowseCommand(cred, "collectDateFrom", collectDateFrom)
-    if collectDateTo:
-        cmdPipe += buildBrowseCommand(cred, "collectDateTo", collectDateTo)
-    if submitDateFrom:
-        cmdPipe += buildBrowseCommand(cred, "submitDateFrom", submitDateFrom)
-    if submitDateTo:
-        cmdPipe += buildBrowseCommand(cred, "submitDateTo", submitDateTo)
-    if requestSegments:
-        cmdPipe += buildBrowseCommand(cred, "requestSegments", requestSegments)
-        if onlyComplete is True:
-            cmdPipe += buildBrowseCommand(cred, "onlyComplete", ["y"])
+    with tokenScope(cred, token):
+        # search by command pipeline
+        cmdPipe = buildSearchCommand(
+            cred,
+            searchPattern=searchPattern,
+            type=type,
+            HA=HA,
+            NA=NA,
+            lineage=lineage,
+            host=host,
+            location=location,
+            collectDateFrom=collectDateFrom,
+            collectDateTo=collectDateTo,
+            submitDateFrom=submitDateFrom,
+            submitDateTo=submitDateTo,
+            requestSegments=requestSegments,
+            onlyComplete=onlyComplete,
+        )
 
-    body = buildRequestBody(
-        cred.sessionId, cred.windowId, cred.browsePage["pid"], cmdPipe
-    )
+        # leave the previous result page, filter and search in one request
+        preResultText, resultPageText = browseToResultPage(cred, cmdPipe)
 
-    res = httpPost(cred.url, data=body, headers=cred.headers)
+        # records count in the browse page
+        recordCount, recordSeqCount = parseCount(preResultText)
 
-    # records count in the browse page
-    preResultText = res.text
+        logger.info(f"{recordCount} records, {recordSeqCount} seqs found")
 
-    recordCount, recordSeqCount = [
-        int(i.replace(",", ""))
-        for i in re.search(
-            r"Total: ([\d,]+) viruses \(([\d,]+) sequences\)", preResultText
-        ).group(1, 2)
-    ]
+        cred.resultPage["resultCompId"] = re.search(
+            r"sys\.createComponent\(\'(c_\w+?)\',\'IsolateResultListComponent\'",
+            resultPageText,
+        ).group(1)
 
-    logger.info(f"{recordCount} records, {recordSeqCount} seqs found")
+        logger.debug("Fetch result records...")
+        # fetch records
+        if recordCount > 0:
+            resultColumns, htmlKeys = resultColumnsOf(cred)
+            tuner = pageSizeTuner(cred, pageSize)
+            total = min(recordCount, recordLimit)
 
-    # refresh result page id
-    cmdPipe = [buildCommand(CompId=cred.browsePage["searchButtonCompId"], cmd="search")]
-    body = buildRequestBody(
-        cred.sessionId, cred.windowId, cred.browsePage["pid"], cmdPipe
-    )
-    res = httpPost(cred.url, data=body, headers=cred.headers)
-    resultPagePid = re.search(r"sys.goPage\(\'(.+?)\'\)", res.text).group(1)
-    cred.resultPage["pid"] = resultPagePid
-
-    logger.debug("Parse result page...")
-    # go to result page
-    res = httpGet(
-        f"{cred.url}?sid={cred.sessionId}&pid={resultPagePid}", headers=cred.headers
-    )
-    resultPageText = res.text
-    cred.resultPage["resultCompId"] = re.search(
-        r"sys\.createComponent\(\'(c_\w+?)\',\'IsolateResultListComponent\'",
-        resultPageText,
-    ).group(1)
-
-    logger.debug("Fetch result records...")
-    # fetch records
-    if recordCount > 0:
-        resultJson = []
-
-        batches = buildBatch(0, min(recordCount, recordLimit) - 1, batchSize=27)
-        for batch in tqdm(batches):
-            cmdPipe = [
-                buildCommand(
-                    CompId=cred.resultPage["resultCompId"],
-                    cmd="SetPaginating",
-                    params={
-                        "start_index": batch["start"],
-                        "rows_per_page": batch["count"],
-                    },
-                ),
-                buildCommand(CompId=cred.resultPage["resultCompId"], cmd="GetData"),
-            ]
+            # spawned workers, a forked child could inherit locks held by the producer thread
+            executor = (
+                ProcessPoolExecutor(parseWorkers, mp_context=get_context("spawn"))
+                if parseWorkers
+                else None
+            )
 
-            body = buildRequestBody(
-                cred.sessionId, cred.windowId, cred.resultPage["pid"], cmdPipe
+            # fetch page N+1 while page N is parsed
+            pages = queue.Queue(maxsize=2)
+            stop = threading.Event()
+            # the producer runs under the token of this call
+            producer = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(fetchPages, cred, tuner, total, pages, stop),
+                daemon=True,
             )
-            res = httpPost(cred.url, data=body, headers=cred.headers)
+            producer.start()
 
-            resultJson += res.json()["records"]
+            futures = []
+            try:
+                with tqdm(total=total) as progress:
+                    while True:
+                        records = pages.get()
+                        if records is None:
+                            break
+                        if isinstance(records, BaseException):
+                            raise records
 
-        # records dataframe
-        reslutDF = pd.DataFrame(resultJson)
+                        if executor is not None:
+                            futures.append(
+                                executor.submit(
+                                    projectPage, records, resultColumns, htmlKeys
+                                )
+                            )
+                        else:
+                            projectRecords(records, resultColumns, htmlKeys)
+                        progress.update(len(records))
 
-        reslutDF = reslutDF.drop(
-            [s for s in reslutDF.columns if s not in cred.resultHeaderDict.keys()],
-            axis=1,
-        )
+                for future in futures:
+                    for key, values in future.result().items():
+                        resultColumns[key] += values
+            finally:
+                stop.set()
+                producer.join()
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
 
-        reslutDF = reslutDF.rename(columns=cred.resultHeaderDict)
+            tuner.finish()
 
-        reslutDF = reslutDF.drop(["__toggle__", "edit", "HE", "P3"], axis=1)
-
-        for col in ["Name", "PB2", "PB1", "PA", "HA", "NP", "NA", "MP", "NS"]:
-            reslutDF[col] = reslutDF[col].str.replace(
-                r"^.+?>(.+?)</.+$", r"\1", regex=True
+            # records dataframe
+            reslutDF = pd.DataFrame(
+                {
+                    cred.resultHeaderDict[key]: values
+                    for key, values in resultColumns.items()
+                }
             )
-    else:
-        reslutDF = pd.DataFrame()
+        else:
+            reslutDF = pd.DataFrame()
 
-    resultToBrowsePage(cred)
+    # the session stays on the result page until the next operation
+    if store is not None:
+        store.sync(reslutDF)
 
     nrow = reslutDF.shape[0]
     logger.debug(f"Search completed: return {nrow} rows")
 
     return reslutDF
+
+
+def count(
+    cred: credentials,
+    searchPattern: str | None = None,
+    type: list[str] | None = None,
+    HA: list[str] | None = None,
+    NA: list[str] | None = None,
+    lineage: list[str] | None = None,
+    host: list[str] | None = None,
+    location: str | None = None,
+    collectDateFrom: str | None = None,
+    collectDateTo: str | None = None,
+    submitDateFrom: str | None = None,
+    submitDateTo: str | None = None,
+    requestSegments: list[str] | None = None,
+    onlyComplete: bool = False,
+    token: cancelToken | None = None,
+) -> dict:
+    """
+    Count the records matching the criteria of `search()`, without fetching them.
+
+    The browse page is reset, then the filters are set and counted in a single request.
+    The filters stay on the browse page until the next operation resets it.
+
+    Args:
+        cred (credentials): The credentials object containing session information.
+        searchPattern (str, optional): The search pattern, can be isolate id, isolate name, segement id and so on. Defaults to None.
+        type (list[str], optional): A list of virus types to filter the search results. Defaults to None.
+        HA (list[str], optional): A list of hemagglutinin (HA) subtypes to filter the search results. Defaults to None.
+        NA (list[str], optional): A list of neuraminidase (NA) subtypes to filter the search results. Defaults to None.
+        lineage (list[str], optional): A list of lineages to filter the search results. Defaults to None.
+        host (list[str], optional): A list of host species to filter the search results. Defaults to None.
+        location (str, optional): A location to filter the search results, such as "Asia / China". Defaults to None.
+        collectDateFrom (str, optional): The starting date for the collection date filter. Defaults to None.
+        collectDateTo (str, optional): The ending date for the collection date filter. Defaults to None.
+        submitDateFrom (str, optional): The starting date for the submission date filter. Defaults to None.
+        submitDateTo (str, optional): The ending date for the submission date filter. Defaults to None.
+        requestSegments (list[str], optional): A list of requested segments to filter the search results. Defaults to None.
+        onlyComplete (bool, optional): Whether to only count records with complete sequences of requested segments. Defaults to False.
+        token (cancelToken, optional): A deadline and cancellation token. Defaults to None.
+
+    Return:
+        dict: The number of matched "records" and their "sequences".
+
+    Example:
+        ```
+        cred = gisflu.login()
+        gisflu.count(cred, type=["A"], HA=["1"], NA=["1"], lineage=["pdm09"],
+            location="Europe")
+        ```
+    """
+
+    # the Reset answers the unfiltered total, so it goes before the filters
+    cmdPipe = [resetCommand(cred)] + buildSearchCommand(
+        cred,
+        searchPattern=searchPattern,
+        type=type,
+        HA=HA,
+        NA=NA,
+        lineage=lineage,
+        host=host,
+        location=location,
+        collectDateFrom=collectDateFrom,
+        collectDateTo=collectDateTo,
+        submitDateFrom=submitDateFrom,
+        submitDateTo=submitDateTo,
+        requestSegments=requestSegments,
+        onlyComplete=onlyComplete,
+    )
+
+    body = buildRequestBody(
+        cred.sessionId, cred.windowId, cred.browsePage["pid"], cmdPipe
+    )
+
+    with tokenScope(cred, token):
+        resultToBrowsePage(cred, reset=False)
+        res = httpPost(
+            cred.url, data=body, headers=cred.headers, httpClient=cred.client
+        )
+
+    recordCount, recordSeqCount = parseCount(res.text)
+    logger.info(f"{recordCount} records, {recordSeqCount} seqs found")
+
+    return {"records": recordCount, "sequences": recordSeqCount}
@@ -0,0 +1,257 @@
+import re
+import json
+import time
+import base64
+import threading
+import urllib.parse
+import httpx
+from .utils import timeout
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# values never written to a cassette, replaced consistently wherever they appear
+secretPatterns = [
+    re.compile(r'"login": "(.+?)"'),
+    re.compile(r'"hash": "(.+?)"'),
+    re.compile(r"name=\"sid\" value='(.+?)'"),
+]
+secretHeaders = ["cookie", "set-cookie", "authorization"]
+keptHeaders = ["content-type", "content-disposition", "set-cookie"]
+# secrets shorter than this are only redacted where they are not part of a word
+shortSecret = 4
+
+
+def encodeBody(content: bytes) -> dict:
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def decodeBody(body: dict) -> bytes:
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body["text"].encode("utf-8")
+
+
+class cassetteTransport(httpx.BaseTransport):
+    def __init__(self, tape):
+        self.tape = tape
+
+    def handle_request(self, request):
+        request.read()
+        if self.tape.mode == "record":
+            response = self.tape.record(request)
+        else:
+            response = self.tape.replay(request)
+
+        with self.tape.lock:
+            self.tape.requests += 1
+            self.tape.bytesSent += len(request.content)
+            self.tape.bytesReceived += len(response.content)
+
+        return response
+
+
+class cassette:
+    """
+    Records HTTP exchanges of gisflu sessions to a file, and replays them offline.
+
+    In record mode, requests go through `transport` (the real network by default),
+    and each exchange is kept with its elapsed time. Credentials, session ids and
+    cookies are redacted on `save()`: every occurrence of them is replaced with a
+    placeholder, so a replayed session stays self-consistent.
+
+    In replay mode, requests are answered in recorded order without any network.
+    Each request must match the method and path of the next recorded one. Responses
+    are delayed by the recorded time multiplied by `timeScale`.
+
+    Counters `requests`, `bytesSent` and `bytesReceived` accumulate over both modes.
+
+    Args:
+        path (str): The cassette file.
+        mode (str, optional): "record" or "replay". Defaults to "replay".
+        transport (httpx.BaseTransport, optional): The transport to record from. Defaults to the real network.
+        timeScale (float, optional): The factor of recorded response times in replay, 0 for no delay. Defaults to 1.0.
+
+    Example:
+        ```
+        with gisflu.cassette("session.json", mode="record") as tape:
+            cred = gisflu.login(httpClient=tape.client())
+            gisflu.search(cred, HA=["3"], recordLimit=100)
+
+        tape = gisflu.cassette("session.json", timeScale=0)
+        cred = gisflu.login("user", "password", httpClient=tape.client())
+        gisflu.search(cred, HA=["3"], recordLimit=100)
+        ```
+    """
+
+    def __init__(self, path, mode="replay", transport=None, timeScale=1.0):
+        assert mode in ["record", "replay"], "mode must be record|replay"
+
+        self.path = path
+        self.mode = mode
+        self.timeScale = timeScale
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+
+        if mode == "record":
+            self.transport = transport or httpx.HTTPTransport()
+            self.interactions = []
+        else:
+            with open(path) as f:
+                self.interactions = json.load(f)["interactions"]
+        self.position = 0
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=cassetteTransport(self), timeout=timeout)
+
+    def record(self, request):
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        content = response.read()
+        elapsed = time.perf_counter() - start
+
+        headers = [
+            [k, v] for k, v in response.headers.multi_items() if k in keptHeaders
+        ]
+        interaction = {
+            "request": {
+                "method": request.method,
+                "url": str(request.url),
+                "headers": [
+                    [k, v]
+                    for k, v in request.headers.multi_items()
+                    if k in secretHeaders
+                ],
+                "body": encodeBody(request.content),
+            },
+            "response": {
+                "status": response.status_code,
+                "headers": headers,
+                "body": encodeBody(content),
+            },
+            "elapsed": elapsed,
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+
+        # the content is decoded already
+        return httpx.Response(
+            response.status_code,
+            headers=[
+                (k, v)
+                for k, v in response.headers.multi_items()
+                if k not in ["content-encoding", "content-length", "transfer-encoding"]
+            ],
+            content=content,
+        )
+
+    def replay(self, request):
+        with self.lock:
+            assert self.position < len(self.interactions), (
+                f"Cassette {self.path} has no response for request "
+                f"{self.position + 1}: {request.method} {request.url.path}"
+            )
+            interaction = self.interactions[self.position]
+            self.position += 1
+
+        recorded = httpx.URL(interaction["request"]["url"])
+        assert (
+            request.method == interaction["request"]["method"]
+            and request.url.path == recorded.path
+        ), (
+            f"Request {self.position} {request.method} {request.url.path} does not "
+            f"match the cassette: {interaction['request']['method']} {recorded.path}"
+        )
+
+        if self.timeScale:
+            time.sleep(interaction["elapsed"] * self.timeScale)
+
+        response = interaction["response"]
+        return httpx.Response(
+            response["status"],
+            headers=[tuple(h) for h in response["headers"]],
+            content=decodeBody(response["body"]),
+        )
+
+    def secrets(self):
+        # collect secret values from credentials, session ids and cookies
+        found = set()
+        for interaction in self.interactions:
+            texts = [
+                urllib.parse.unquote_plus(
+                    interaction["request"]["body"].get("text", "")
+                ),
+                interaction["response"]["body"].get("text", ""),
+            ]
+            for text in texts:
+                for pattern in secretPatterns:
+                    found.update(pattern.findall(text))
+
+            headers = (
+                interaction["request"]["headers"] + interaction["response"]["headers"]
+            )
+            for name, value in headers:
+                if name == "set-cookie":
+                    value = value.split(";")[0]
+                if name in ["cookie", "set-cookie"]:
+                    for cookie in value.split(";"):
+                        found.add(cookie.partition("=")[2].strip())
+                elif name in secretHeaders:
+                    found.add(value)
+
+        # replace longer values first, in case one contains another
+        return sorted((s for s in found if s), key=len, reverse=True)
+
+    def redact(self, text, placeholders):
+        for secret, placeholder in placeholders.items():
+            # secrets also appear url-encoded in request bodies
+            for value in {secret, urllib.parse.quote_plus(secret)}:
+                if len(value) >= shortSecret:
+                    text = text.replace(value, placeholder)
+                else:
+                    # a short value is only replaced as a whole, not inside words,
+                    # it may follow a url-encoded quote such as "%22"
+                    text = re.sub(
+                        rf"(?:(?<=%[0-9A-F]{{2}})|(?<![\w%])){re.escape(value)}(?!\w)",
+                        placeholder,
+                        text,
+                    )
+
+        return text
+
+    def save(self):
+        assert self.mode == "record", "Only recorded cassettes can be saved"
+
+        placeholders = {
+            secret: f"REDACTED{i}" for i, secret in enumerate(self.secrets())
+        }
+        content = self.redact(
+            json.dumps({"version": 1, "interactions": self.interactions}, indent=1),
+            placeholders,
+        )
+        with open(self.path, "w") as f:
+            f.write(content)
+
+        logger.debug(
+            f"Saved {len(self.interactions)} exchanges to {self.path}, "
+            f"{len(placeholders)} values redacted"
+        )
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *args):
+        if self.mode == "record" and excType is None:
+            self.save()
+
+    def __repr__(self):
+        return f"cassette(path={self.path}, mode={self.mode})"
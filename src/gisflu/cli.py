@@ -0,0 +1,170 @@
+import sys
+import json
+import logging
+import argparse
+from .pool import sessionPool
+from .batch import loadJobs, runBatch, formatSummary
+from .workqueue import workQueue, splitByDate, splitByIds, runWorker
+from .utils import log
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(
+        prog="gisflu", description="Access the GISAID Flu database"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="print debug logs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batchParser = subparsers.add_parser(
+        "batch", help="run the searches and downloads of a query file"
+    )
+    batchParser.add_argument("queryFile", help="JSON or YAML file of jobs")
+    batchParser.add_argument(
+        "-o", "--outdir", help="output directory (default: query file outdir or .)"
+    )
+    batchParser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        help="number of sessions and concurrent jobs (default: query file concurrency or 2)",
+    )
+    batchParser.add_argument(
+        "--summary-json", dest="summaryJson", help="also write the summary as JSON"
+    )
+
+    queueParser = subparsers.add_parser(
+        "queue", help="split a large query over workers on several machines"
+    )
+    queueCommands = queueParser.add_subparsers(dest="queueCommand", required=True)
+
+    planParser = queueCommands.add_parser("plan", help="add slices to a queue")
+    planParser.add_argument(
+        "queueDir", help="queue directory, on storage shared by all machines"
+    )
+    planParser.add_argument("action", choices=["search", "download"], help="the action")
+    planParser.add_argument(
+        "--params",
+        default="{}",
+        help="JSON keyword arguments of the action, shared by all slices",
+    )
+    planParser.add_argument(
+        "--date-range",
+        dest="dateRange",
+        nargs=2,
+        metavar=("FROM", "TO"),
+        help="split by collection date",
+    )
+    planParser.add_argument(
+        "--days", type=int, default=30, help="days per date slice (default: 30)"
+    )
+    planParser.add_argument(
+        "--ids-file",
+        dest="idsFile",
+        help="split a download by the isolate IDs of this file, one per line",
+    )
+    planParser.add_argument(
+        "--chunk-size",
+        dest="chunkSize",
+        type=int,
+        default=1000,
+        help="isolate IDs per slice (default: 1000)",
+    )
+
+    workParser = queueCommands.add_parser(
+        "work", help="run slices with GISAID_USERNAME/GISAID_PASSWORD until done"
+    )
+    workParser.add_argument(
+        "queueDir", help="queue directory, on storage shared by all machines"
+    )
+    workParser.add_argument(
+        "-o",
+        "--outdir",
+        default=".",
+        help="output directory, readable by the coordinator (default: .)",
+    )
+    workParser.add_argument(
+        "--lease", type=float, default=600, help="lease seconds (default: 600)"
+    )
+    workParser.add_argument("--worker", help="worker name (default: host-pid)")
+
+    statusParser = queueCommands.add_parser("status", help="print queue progress")
+    statusParser.add_argument(
+        "queueDir", help="queue directory, on storage shared by all machines"
+    )
+
+    mergeParser = queueCommands.add_parser(
+        "merge", help="merge slice outputs without duplicates"
+    )
+    mergeParser.add_argument(
+        "queueDir", help="queue directory, on storage shared by all machines"
+    )
+    mergeParser.add_argument(
+        "action", choices=["search", "download"], help="the action"
+    )
+    mergeParser.add_argument("output", help="merged output file")
+
+    return parser
+
+
+def runQueueCommand(args):
+    with workQueue(args.queueDir) as queue:
+        if args.queueCommand == "plan":
+            params = json.loads(args.params)
+            if args.dateRange:
+                slices = splitByDate(params, *args.dateRange, days=args.days)
+            elif args.idsFile:
+                with open(args.idsFile) as f:
+                    isolateIds = [line.strip() for line in f if line.strip()]
+                slices = splitByIds(params, isolateIds, chunkSize=args.chunkSize)
+            else:
+                slices = [params]
+            ids = queue.submit(args.action, slices)
+            print(f"{len(ids)} slices added")
+        elif args.queueCommand == "work":
+            summary = runWorker(
+                queue, outdir=args.outdir, worker=args.worker, leaseSeconds=args.lease
+            )
+            print(f"{summary['completed']} completed, {summary['failed']} failed")
+            return 0 if summary["failed"] == 0 else 1
+        elif args.queueCommand == "status":
+            progress = queue.progress()
+            print(", ".join(f"{v} {k}" for k, v in progress.items()))
+            return 0 if progress["failed"] == 0 else 1
+        elif args.queueCommand == "merge":
+            n = queue.merge(args.action, args.output)
+            print(f"{n} records merged into {args.output}")
+
+    return 0
+
+
+def runBatchCommand(args):
+    config = loadJobs(args.queryFile)
+    outdir = args.outdir or config.get("outdir", ".")
+    concurrency = args.concurrency or config.get("concurrency", 2)
+    concurrency = min(concurrency, len(config["jobs"])) or 1
+
+    with sessionPool(size=concurrency) as pool:
+        summary = runBatch(pool, config["jobs"], outdir, concurrency=concurrency)
+
+    print(formatSummary(summary))
+    if args.summaryJson:
+        with open(args.summaryJson, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+
+    if args.verbose:
+        log(logging.DEBUG)
+
+    if args.command == "batch":
+        return runBatchCommand(args)
+    elif args.command == "queue":
+        return runQueueCommand(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
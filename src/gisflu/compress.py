@@ -0,0 +1,243 @@
+import io
+import os
+import gzip
+import zlib
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# uncompressed bytes per BGZF block, as bgzip writes them
+bgzfBlockSize = 0xFF00
+bgzfEOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compressionOf(filename: str) -> str | None:
+    """
+    Return the compression chosen by the filename extension: gzip (.gz), bgzip (.bgz), zstd (.zst) or None.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return {".gz": "gzip", ".bgz": "bgzip", ".zst": "zstd"}.get(extension)
+
+
+def splitExtension(filename: str) -> tuple[str, str]:
+    """
+    Split a filename into its stem and its extension, a compression extension joining the one before it.
+
+    "records.fasta.bgz" -> ("records", ".fasta.bgz")
+    """
+    stem, extension = os.path.splitext(filename)
+    if compressionOf(filename) is not None:
+        stem, inner = os.path.splitext(stem)
+        extension = inner + extension
+    return stem, extension
+
+
+def importZstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading or writing .zst files requires zstandard")
+    return zstandard
+
+
+class compressedWriter(io.RawIOBase):
+    """
+    A binary file object that compresses while it writes.
+
+    `seek(0)` followed by `truncate()` restarts the file, as `httpDownload()` does
+    when a download is retried. With bgzip, block offsets are collected for the
+    `.gzi` index written on close.
+    """
+
+    def __init__(self, filename, compression, level=6):
+        self.filename = filename
+        self.compression = compression
+        self.level = level
+        if compression == "zstd":
+            # fail before creating the file
+            importZstd()
+        self.raw = open(filename, "wb")
+        self.start()
+
+    def start(self):
+        self.size = 0
+        if self.compression == "gzip":
+            # wbits 31 writes the gzip header and trailer
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        elif self.compression == "zstd":
+            zstandard = importZstd()
+            self.compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        else:
+            self.buffer = bytearray()
+            self.blocked = 0
+            self.offsets = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.size += len(data)
+        if self.compression == "bgzip":
+            self.buffer += data
+            while len(self.buffer) >= bgzfBlockSize:
+                self.writeBlock(bytes(self.buffer[:bgzfBlockSize]))
+                del self.buffer[:bgzfBlockSize]
+        else:
+            self.raw.write(self.compressor.compress(data))
+        return len(data)
+
+    def writeBlock(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        if len(deflated) > 0xFFFF - 26:
+            # incompressible data, store it
+            compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+            deflated = compressor.compress(data) + compressor.flush()
+
+        header = struct.pack(
+            "<4BI2BH2BHH",
+            0x1F,
+            0x8B,
+            8,
+            4,
+            0,
+            0,
+            0xFF,
+            6,
+            ord("B"),
+            ord("C"),
+            2,
+            len(deflated) + 25,
+        )
+        trailer = struct.pack("<II", zlib.crc32(data), len(data))
+        self.raw.write(header + deflated + trailer)
+        self.blocked += len(data)
+        # the next block starts at these compressed/uncompressed offsets
+        self.offsets.append((self.raw.tell(), self.blocked))
+
+    def tell(self):
+        return self.size
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        assert offset == 0 and whence == os.SEEK_SET, "Can only seek to the start"
+        if self.size > 0:
+            self.raw.seek(0)
+            self.raw.truncate()
+            self.start()
+        return 0
+
+    def truncate(self, size=None):
+        return self.size
+
+    def close(self):
+        if self.closed:
+            return None
+        if self.compression == "bgzip":
+            self.closeBgzf()
+        else:
+            self.raw.write(self.compressor.flush())
+        self.raw.close()
+        super().close()
+        return None
+
+    def closeBgzf(self):
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer = bytearray()
+            self.writeBlock(data)
+        if self.offsets:
+            # no block starts after the last one
+            self.offsets.pop()
+        self.raw.write(bgzfEOF)
+
+        # the .gzi index, as written by bgzip -i
+        with open(self.filename + ".gzi", "wb") as f:
+            f.write(struct.pack("<Q", len(self.offsets)))
+            for coffset, uoffset in self.offsets:
+                f.write(struct.pack("<QQ", coffset, uoffset))
+
+        return None
+
+
+def openOutput(filename: str, mode: str = "wb"):
+    """
+    Open an output file, compressed while streaming according to its extension.
+
+    Args:
+        filename (str): The output file. ".gz" writes gzip, ".bgz" writes bgzip (BGZF) with a ".gzi" index, ".zst" writes zstd (requires `zstandard`), other extensions are not compressed.
+        mode (str, optional): "wb" or "wt". Defaults to "wb".
+
+    Return:
+        A file object.
+    """
+    assert mode in ["wb", "wt"], "mode must be wb|wt"
+
+    compression = compressionOf(filename)
+    if compression is None:
+        return open(filename, mode)
+
+    f = compressedWriter(filename, compression)
+    if mode == "wt":
+        return io.TextIOWrapper(io.BufferedWriter(f), encoding="utf-8", newline="")
+    return f
+
+
+def openInput(filename: str, mode: str = "rb"):
+    """
+    Open a file written by `openOutput()`, decompressed according to its extension.
+    """
+    assert mode in ["rb", "rt"], "mode must be rb|rt"
+
+    compression = compressionOf(filename)
+    if compression in ["gzip", "bgzip"]:
+        return gzip.open(filename, mode)
+    if compression == "zstd":
+        zstandard = importZstd()
+        f = zstandard.open(filename, mode)
+        return f
+    return open(filename, mode)
+
+
+def readBgzf(filename: str, offset: int, size: int) -> bytes:
+    """
+    Read size uncompressed bytes from offset of a bgzip file, decompressing only the blocks holding them with its ".gzi" index.
+
+    Args:
+        filename (str): The bgzip file, with a ".gzi" index next to it.
+        offset (int): The uncompressed offset.
+        size (int): The number of bytes to read.
+
+    Return:
+        bytes
+    """
+
+    with open(filename + ".gzi", "rb") as f:
+        (n,) = struct.unpack("<Q", f.read(8))
+        blocks = [(0, 0)] + [struct.unpack("<QQ", f.read(16)) for _ in range(n)]
+
+    # the last block starting at or before offset
+    coffset, uoffset = max((b for b in blocks if b[1] <= offset), key=lambda b: b[1])
+
+    out = bytearray()
+    with open(filename, "rb") as f:
+        f.seek(coffset)
+        while len(out) < offset - uoffset + size:
+            header = f.read(18)
+            if len(header) < 18:
+                break
+            (blockSize,) = struct.unpack("<H", header[16:18])
+            block = f.read(blockSize + 1 - 18)
+            data = zlib.decompress(block[:-8], -15)
+            if not data:
+                break
+            out += data
+
+    start = offset - uoffset
+
+    return bytes(out[start : start + size])
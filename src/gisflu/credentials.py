@@ -1,3 +1,7 @@
+import copy
+from . import utils
+
+
 class credentials:
     def __init__(self):
         self.url = "https://platform.epicov.org/epi3/frontend"
@@ -5,9 +9,12 @@ class credentials:
             "accept": "application/json, text/javascript, */*; q=0.01",
             "content-type": "application/x-www-form-urlencoded; charset=UTF-8",
         }
+        self.client = None
         self.sessionId = None
         self.windowId = None
         self.downloadWindowId = None
+        # the page a session is left on, browse|result|download
+        self.currentPage = "browse"
         self.loginPage = {"pid": None, "loginCompId": None}
         self.firstPage = {"pid": None, "dbSwitchCompId": None}
         self.homePage = {"pid": None, "browseCompId": None}
@@ -48,6 +55,9 @@ class credentials:
             "Mammals": "790",
         }
         self.resultHeaderDict = {}
+        self.pageSize = 27
+        self.pageSizeTuned = False
+        self.pageSizeStats = {}
         self.downloadParamsCeid = {}
         self.segmentCheck = [
             "NP",
@@ -80,5 +90,78 @@ class credentials:
         }
         self.downloadWaitCeid = {}
 
+    def toDict(self) -> dict:
+        """
+        Export the session as a JSON-serializable dict, including the cookies of its HTTP client.
+
+        A session keeps page state on the server, so it should still be used by one
+        process at a time.
+
+        Return:
+            dict
+
+        Example:
+            ```
+            cred = gisflu.login()
+            state = cred.toDict()
+            # in a worker process or on another machine
+            cred = gisflu.credentials.fromDict(state)
+            ```
+        """
+
+        state = copy.deepcopy({k: v for k, v in self.__dict__.items() if k != "client"})
+        state["pageSizeStats"] = {str(k): v for k, v in self.pageSizeStats.items()}
+
+        client = self.client or utils.client
+        state["cookies"] = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+            }
+            for cookie in client.cookies.jar
+        ]
+
+        return state
+
+    @classmethod
+    def fromDict(cls, state: dict, httpClient=None) -> "credentials":
+        """
+        Attach to a session exported by `toDict()`, without logging in again.
+
+        Args:
+            state (dict): The exported session.
+            httpClient (httpx.Client, optional): The HTTP client to attach with. Defaults to a new client.
+
+        Return:
+            credentials
+        """
+
+        cred = cls()
+        state = copy.deepcopy(state)
+        cookies = state.pop("cookies", [])
+        state["pageSizeStats"] = {
+            int(k): v for k, v in state.get("pageSizeStats", {}).items()
+        }
+        cred.__dict__.update(state)
+
+        cred.client = httpClient or utils.newClient()
+        for cookie in cookies:
+            cred.client.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie["domain"],
+                path=cookie["path"],
+            )
+
+        return cred
+
+    def __getstate__(self):
+        return self.toDict()
+
+    def __setstate__(self, state):
+        self.__dict__.update(self.fromDict(state).__dict__)
+
     def __repr__(self):
         return f"credentials(sid={self.sessionId})"
@@ -0,0 +1,113 @@
+import time
+import threading
+import contextvars
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# the token of the running call, read by the HTTP helpers
+currentToken = contextvars.ContextVar("gisflu.currentToken", default=None)
+
+
+class cancelledError(TimeoutError):
+    """
+    Raised when a call is cancelled, or runs past the deadline of its token.
+    """
+
+
+class cancelToken:
+    """
+    A deadline and cancellation token for gisflu calls.
+
+    Entry points such as `login()`, `search()` and `download()` accept a token.
+    It is checked before every HTTP request (so also between retries), between
+    result pages and at each tick of the metadata wait loop, and it caps the
+    timeout of each request to the remaining time. Cancellation is cooperative:
+    a request already sent is not interrupted by `cancel()`.
+
+    An aborted call raises `cancelledError` and brings the session back to the
+    browse page, so it can be used again.
+
+    Args:
+        seconds (float, optional): The time budget from now. Defaults to None, no deadline.
+        parent (cancelToken, optional): A token whose cancellation and deadline also apply to this one. Defaults to None.
+
+    Example:
+        ```
+        token = gisflu.cancelToken(300)
+        df = gisflu.search(cred, HA=["3"], recordLimit=100000, token=token)
+
+        # from another thread
+        token.cancel()
+        ```
+    """
+
+    def __init__(self, seconds: float | None = None, parent=None):
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.event = threading.Event()
+        self.children = []
+        if parent is not None:
+            if parent.deadline is not None:
+                self.deadline = min(self.deadline or parent.deadline, parent.deadline)
+            parent.children.append(self)
+            if parent.cancelled:
+                self.event.set()
+
+    def cancel(self):
+        # cancelling a token cancels the tokens made from it
+        self.event.set()
+        for child in self.children:
+            child.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def remaining(self) -> float | None:
+        """
+        Return the seconds left before the deadline, or None without deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check(self):
+        """
+        Raise `cancelledError` if the token is cancelled or past its deadline.
+        """
+        if self.cancelled:
+            raise cancelledError("Cancelled")
+        if self.remaining() == 0:
+            raise cancelledError("Deadline exceeded")
+
+    def sleep(self, seconds: float):
+        """
+        Sleep up to seconds, waking up on cancellation or at the deadline, then check.
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self.event.wait(seconds)
+        self.check()
+
+    def timeout(self, base: httpx.Timeout) -> httpx.Timeout:
+        # cap each phase of a request to the remaining time
+        remaining = self.remaining()
+        if remaining is None:
+            return base
+
+        def cap(value):
+            return remaining if value is None else min(value, remaining)
+
+        return httpx.Timeout(
+            connect=cap(base.connect),
+            read=cap(base.read),
+            write=cap(base.write),
+            pool=cap(base.pool),
+        )
+
+    def __repr__(self):
+        return f"cancelToken(remaining={self.remaining()}, cancelled={self.cancelled})"
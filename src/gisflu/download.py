@@ -1,13 +1,32 @@
+import os
 import re
+import shutil
+import tempfile
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
 from .utils import (
     buildCommand,
     buildRequestBody,
     httpGet,
     httpPost,
+    httpDownload,
+    httpStream,
     downloadToResultPage,
-    resultToBrowsePage,
+    browseToResultPage,
+    buildSearchCommand,
+    parseCount,
+    checkToken,
+    pause,
+    tokenScope,
 )
+from .deadline import cancelToken, cancelledError
 from .credentials import credentials
+from .pool import sessionPool
+from .warehouse import warehouse
+from .metadata import metadataChunks
+from .sequences import sequenceStore, readFasta, parseHeader
+from .compress import openOutput, splitExtension
 import logging
 from datetime import datetime
 import urllib
@@ -17,6 +36,42 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.NullHandler())
 
+# polling of the metadata wait page, and its bound
+metadataPollSeconds = 5
+metadataWaitSeconds = 3600
+
+
+def selectCommands(cred, isolateIds):
+    # select records on the result page
+    return [
+        buildCommand(
+            CompId=cred.resultPage["resultCompId"],
+            cmd="ChangeValue",
+            params={
+                "row_id": acc.replace("EPI_ISL_", ""),
+                "col_name": "c",
+                "value": True,
+            },
+        )
+        for acc in isolateIds
+    ]
+
+
+def checkDownloadParams(cred, downloadType, segments):
+    assert downloadType in [
+        "metadata",
+        "protein",
+        "dna",
+    ], "downloadType must be metadata|protein|dna"
+
+    unknownSegments = [
+        segment for segment in segments if segment not in cred.segmentCheck
+    ]
+    unknownSegmentStr = ", ".join(unknownSegments)
+    assert len(unknownSegments) == 0, f"Unknown segment(s): {unknownSegmentStr}"
+
+    return None
+
 
 def download(
     cred: credentials,
@@ -24,6 +79,9 @@ def download(
     downloadType: str = "protein",
     segments: list[str] = ["HA", "NA"],
     filename: str | None = None,
+    store: warehouse | None = None,
+    seqStore: sequenceStore | None = None,
+    token: cancelToken | None = None,
 ) -> None:
     """
     Downloads records for the given isolate IDs.
@@ -33,7 +91,10 @@ def download(
         isolateIds (list): list of isolate IDs to download data for.
         downloadType (str, optional): The type of data to download. Defaults to "protein".
         segments (list, optional): list of segments to download. Defaults to ["HA", "NA"].
-        filename (str, optional): The name of the file to save the downloaded data. If not provided, a default filename will be generated.
+        filename (str, optional): The name of the file to save the downloaded data, compressed while streaming if it ends with ".gz", ".bgz" or ".zst". If not provided, a default filename will be generated.
+        store (warehouse, optional): A local warehouse to sync downloaded metadata into. Defaults to None.
+        seqStore (sequenceStore, optional): A local sequence store to sync downloaded sequences into. Defaults to None.
+        token (cancelToken, optional): A deadline and cancellation token. Defaults to None.
 
     Return:
         None
@@ -51,64 +112,340 @@ def download(
         id.startswith("EPI_ISL_") for id in isolateIds
     ), 'isolateId must start with "EPI_ISL_"'
 
-    assert downloadType in [
-        "metadata",
-        "protein",
-        "dna",
-    ], "downloadType must be metadata|protein|dna"
+    checkDownloadParams(cred, downloadType, segments)
+
+    with tokenScope(cred, token):
+        logger.debug("Go to result page...")
+        browseToResultPage(cred)
+
+        exportSelection(
+            cred,
+            selectCommands(cred, isolateIds),
+            downloadType,
+            segments,
+            filename,
+            len(isolateIds),
+            store,
+            seqStore,
+        )
 
-    unknownSegments = [
-        segment for segment in segments if segment not in cred.segmentCheck
-    ]
-    unknownSegmentStr = ", ".join(unknownSegments)
-    assert len(unknownSegments) == 0, f"Unknown segment(s): {unknownSegmentStr}"
+    return None
 
-    logger.debug("Go to result page...")
-    # fetch result page id
-    cmdPipe = [buildCommand(CompId=cred.browsePage["searchButtonCompId"], cmd="search")]
-    body = buildRequestBody(
-        cred.sessionId, cred.windowId, cred.browsePage["pid"], cmdPipe
+
+def downloadRecords(
+    cred: credentials,
+    isolateIds: list[str],
+    downloadType: str = "protein",
+    segments: list[str] = ["HA", "NA"],
+    asDataFrame: bool = False,
+    token: cancelToken | None = None,
+) -> Iterator[dict] | pd.DataFrame:
+    """
+    Downloads records for the given isolate IDs into memory, without writing a file.
+
+    Sequences are parsed while the fasta export streams, each record with the keys
+    "Isolate ID", "Segment" (the gene name of proteins), "Accession", "Name",
+    "Type", "Collection Date" and "Sequence". Metadata rows have the columns of
+    `search()`. Both can be joined with `search()` results on "Isolate ID".
+
+    Args:
+        cred (credentials): The credentials object.
+        isolateIds (list): list of isolate IDs to download data for.
+        downloadType (str, optional): The type of data to download. Defaults to "protein".
+        segments (list, optional): list of segments to download. Defaults to ["HA", "NA"].
+        asDataFrame (bool, optional): Return a DataFrame instead of an iterator of records. Defaults to False.
+        token (cancelToken, optional): A deadline and cancellation token, also checked while the records are iterated. Defaults to None.
+
+    Return:
+        Iterator[dict] | pd.DataFrame: The records.
+
+    Example:
+        ```
+        for record in gisflu.downloadRecords(cred, isolateIds, segments=["HA"]):
+            print(record["Isolate ID"], len(record["Sequence"]))
+
+        df = gisflu.downloadRecords(cred, isolateIds, downloadType="dna", asDataFrame=True)
+        df.merge(gisflu.search(cred, searchPattern="EPI_ISL_19185107"), on="Isolate ID")
+        ```
+    """
+
+    assert all(
+        id.startswith("EPI_ISL_") for id in isolateIds
+    ), 'isolateId must start with "EPI_ISL_"'
+
+    checkDownloadParams(cred, downloadType, segments)
+
+    with tokenScope(cred, token):
+        logger.debug("Go to result page...")
+        browseToResultPage(cred)
+        downloadLink = exportLink(
+            cred, selectCommands(cred, isolateIds), downloadType, segments
+        )
+
+        # the link does not need the download page, close it before streaming
+        downloadToResultPage(cred)
+
+    records = iterRecords(cred, downloadLink, downloadType, token)
+    if asDataFrame:
+        return pd.DataFrame(records)
+
+    return records
+
+
+def iterRecords(cred, downloadLink, downloadType, token=None):
+    if downloadType == "metadata":
+        # parsed while it streams, unless it is a real workbook
+        chunks = httpStream(
+            downloadLink,
+            headers=cred.headers,
+            httpClient=cred.client,
+            lines=False,
+            token=token,
+        )
+        for df in metadataChunks(chunks):
+            yield from df.to_dict(orient="records")
+        return None
+
+    lines = httpStream(
+        downloadLink, headers=cred.headers, httpClient=cred.client, token=token
     )
-    res = httpPost(cred.url, data=body, headers=cred.headers)
-    resultPagePid = re.search(r"sys.goPage\(\'(.+?)\'\)", res.text).group(1)
-    cred.resultPage["pid"] = resultPagePid
+    for header, sequence in readFasta(lines):
+        fields = parseHeader(header)
+        yield {
+            "Isolate ID": fields["Isolate ID"],
+            "Segment": fields["Segment"],
+            "Accession": fields["Accession"],
+            "Name": fields["Isolate name"],
+            "Type": fields["Type"],
+            "Collection Date": fields["Date"],
+            "Sequence": sequence,
+        }
 
-    # go to result page
-    res = httpGet(
-        f"{cred.url}?sid={cred.sessionId}&pid={resultPagePid}", headers=cred.headers
+    return None
+
+
+def downloadQuery(
+    cred: credentials,
+    searchPattern: str | None = None,
+    type: list[str] | None = None,
+    HA: list[str] | None = None,
+    NA: list[str] | None = None,
+    lineage: list[str] | None = None,
+    host: list[str] | None = None,
+    location: str | None = None,
+    collectDateFrom: str | None = None,
+    collectDateTo: str | None = None,
+    submitDateFrom: str | None = None,
+    submitDateTo: str | None = None,
+    requestSegments: list[str] | None = None,
+    onlyComplete: bool = False,
+    downloadType: str = "protein",
+    segments: list[str] = ["HA", "NA"],
+    filename: str | None = None,
+    store: warehouse | None = None,
+    seqStore: sequenceStore | None = None,
+    token: cancelToken | None = None,
+) -> int:
+    """
+    Downloads all records matching the criteria of `search()`, without listing their isolate IDs.
+
+    The records are selected on the server with the select-all of the result page, so the request size does not grow with the number of records.
+
+    Experimental: the select-all command is only answered by the mock frontend of the
+    tests, its name and parameters are not verified against the live service yet. So
+    this function is not exported by `gisflu`, import it from `gisflu.download`.
+
+    Args:
+        cred (credentials): The credentials object containing session information.
+        searchPattern (str, optional): The search pattern, can be isolate id, isolate name, segement id and so on. Defaults to None.
+        type (list[str], optional): A list of virus types to filter the records. Defaults to None.
+        HA (list[str], optional): A list of hemagglutinin (HA) subtypes to filter the records. Defaults to None.
+        NA (list[str], optional): A list of neuraminidase (NA) subtypes to filter the records. Defaults to None.
+        lineage (list[str], optional): A list of lineages to filter the records. Defaults to None.
+        host (list[str], optional): A list of host species to filter the records. Defaults to None.
+        location (str, optional): A location to filter the records, such as "Asia / China". Defaults to None.
+        collectDateFrom (str, optional): The starting date for the collection date filter. Defaults to None.
+        collectDateTo (str, optional): The ending date for the collection date filter. Defaults to None.
+        submitDateFrom (str, optional): The starting date for the submission date filter. Defaults to None.
+        submitDateTo (str, optional): The ending date for the submission date filter. Defaults to None.
+        requestSegments (list[str], optional): A list of requested segments to filter the records. Defaults to None.
+        onlyComplete (bool, optional): Whether to only download records with complete sequences of requested segments. Defaults to False.
+        downloadType (str, optional): The type of data to download. Defaults to "protein".
+        segments (list, optional): list of segments to download. Defaults to ["HA", "NA"].
+        filename (str, optional): The name of the file to save the downloaded data, compressed while streaming if it ends with ".gz", ".bgz" or ".zst". If not provided, a default filename will be generated.
+        store (warehouse, optional): A local warehouse to sync downloaded metadata into. Defaults to None.
+        seqStore (sequenceStore, optional): A local sequence store to sync downloaded sequences into. Defaults to None.
+        token (cancelToken, optional): A deadline and cancellation token. Defaults to None.
+
+    Return:
+        int: The number of downloaded records.
+
+    Example:
+        ```
+        from gisflu.download import downloadQuery
+
+        cred = gisflu.login()
+        downloadQuery(cred, type=["A"], HA=["3"], NA=["2"],
+            collectDateFrom="2024-01-01", downloadType="dna", segments=["HA"],
+            filename="h3n2-ha.fasta")
+        ```
+    """
+
+    checkDownloadParams(cred, downloadType, segments)
+
+    # set filters on the browse page
+    cmdPipe = buildSearchCommand(
+        cred,
+        searchPattern=searchPattern,
+        type=type,
+        HA=HA,
+        NA=NA,
+        lineage=lineage,
+        host=host,
+        location=location,
+        collectDateFrom=collectDateFrom,
+        collectDateTo=collectDateTo,
+        submitDateFrom=submitDateFrom,
+        submitDateTo=submitDateTo,
+        requestSegments=requestSegments,
+        onlyComplete=onlyComplete,
     )
+    assert len(cmdPipe) > 0, "At least one filter is required"
+
+    with tokenScope(cred, token):
+        logger.debug("Go to result page...")
+        searchText, _ = browseToResultPage(cred, cmdPipe)
+
+        recordCount, recordSeqCount = parseCount(searchText)
+        logger.info(f"{recordCount} records, {recordSeqCount} seqs found")
+
+        if recordCount == 0:
+            return 0
+
+        # select the whole result on the server
+        # NOTE: "SelectAll" is only answered by the mock frontend so far, it is not
+        # verified against a recording of the real service yet
+        selectPipe = [
+            buildCommand(CompId=cred.resultPage["resultCompId"], cmd="SelectAll")
+        ]
+
+        exportSelection(
+            cred,
+            selectPipe,
+            downloadType,
+            segments,
+            filename,
+            recordCount,
+            store,
+            seqStore,
+        )
+
+    return recordCount
+
 
-    # select records, get download page id
-    cmdPipe = [
+def parseDownloadPage(cred, downloadPageText):
+    """
+    Parse element ids of the download overlay, on the first download of a session.
+    """
+    logger.debug("Parse download page...")
+    cred.downloadPage["resultDownloadCompId"] = re.search(
+        r"sys\.createComponent\(\'(c_\w+?)\',\'IsolateResultDownloadComponent\'",
+        downloadPageText,
+    ).group(1)
+
+    # fetch download item ceid
+    downloadItemText = re.findall(r"createFI\(.+?function", downloadPageText)
+
+    downloadItemDict = {}
+    for s in downloadItemText:
+        ident = re.search(r"Widget\',\'(.+?)\',function", s).group(1)
+        ceid = re.search(r"createFI\(\'(.+?)\',", s).group(1)
+        downloadItemDict[ident] = ceid
+
+    cred.downloadParamsCeid["downloadFormat"] = downloadItemDict["format"]
+    cred.downloadParamsCeid["downloadConfirm"] = downloadItemDict["download"]
+
+    return None
+
+
+def formatCommands(resultDownloadCompId, downloadFormatCeid, typeCvalue):
+    # select proteins|dna on the download page
+    return [
         buildCommand(
-            CompId=cred.resultPage["resultCompId"],
+            CompId=resultDownloadCompId,
+            cmd="setTarget",
+            params={
+                "cvalue": typeCvalue,
+                "ceid": downloadFormatCeid,
+            },
+            equiv=f"ST{downloadFormatCeid}",
+        ),
+        buildCommand(
+            CompId=resultDownloadCompId,
             cmd="ChangeValue",
             params={
-                "row_id": acc.replace("EPI_ISL_", ""),
-                "col_name": "c",
-                "value": True,
+                "cvalue": typeCvalue,
+                "ceid": downloadFormatCeid,
             },
-        )
-        for acc in isolateIds
+            equiv=f"CV{downloadFormatCeid}",
+        ),
+        buildCommand(
+            CompId=resultDownloadCompId,
+            cmd="ShowProteins",
+            params={"ceid": downloadFormatCeid},
+        ),
+    ]
+
+
+def parseDownloadFormats(cred, formatText):
+    # segment ceids of both formats, and the fasta header ceid only shown for dna
+    for typeCvalue, segmentField in [
+        ("proteins", "proteinSegment"),
+        ("dna", "dnaSegment"),
+    ]:
+        cred.downloadParamsCeid[segmentField] = re.search(
+            rf"createFI\(\'(\w+?)\',\'CheckboxWidget\',\'{typeCvalue}\'", formatText
+        ).group(1)
+
+    fastaHeader = re.search(
+        r"createFI\(\'(\w+?)\',\'EntryWidget\',\'header\'", formatText
+    )
+    assert fastaHeader is not None, "Failed to parse the fasta header of download page"
+    cred.downloadParamsCeid["fastaHeader"] = fastaHeader.group(1)
+
+    return None
+
+
+def exportLink(cred, selectPipe, downloadType, segments):
+    """
+    Export the records selected by selectPipe on the current result page, return the download link. The download page stays open.
+    """
+
+    # get download page id
+    cmdPipe = selectPipe + [
+        buildCommand(CompId=cred.resultPage["downloadCompId"], cmd="Download")
     ]
-    cmdPipe += [buildCommand(CompId=cred.resultPage["downloadCompId"], cmd="Download")]
 
     body = buildRequestBody(
         cred.sessionId, cred.windowId, cred.resultPage["pid"], cmdPipe
     )
 
-    res = httpPost(cred.url, data=body, headers=cred.headers)
+    res = httpPost(cred.url, data=body, headers=cred.headers, httpClient=cred.client)
 
     cred.downloadWindowId, cred.downloadPage["pid"] = re.search(
         r"sys.openOverlay\(\'(\w+?)\',\'(\w+?)\'", res.text
     ).group(1, 2)
+    cred.currentPage = "download"
 
     logger.debug("Go to download page...")
     # go to download overlay page
     res = httpGet(
         f'{cred.url}?sid={cred.sessionId}&pid={cred.downloadPage["pid"]}',
         headers=cred.headers,
+        httpClient=cred.client,
     )
+    if cred.downloadPage["resultDownloadCompId"] is None:
+        parseDownloadPage(cred, res.text)
     resultDownloadCompId = cred.downloadPage["resultDownloadCompId"]
 
     logger.debug("Set download params...")
@@ -121,7 +458,9 @@ def download(
             cred.sessionId, cred.downloadWindowId, cred.downloadPage["pid"], cmdPipe
         )
 
-        res = httpPost(cred.url, data=body, headers=cred.headers)
+        res = httpPost(
+            cred.url, data=body, headers=cred.headers, httpClient=cred.client
+        )
 
         # wait for a big metadata download
         if "sys.openOverlay" in res.text:
@@ -135,6 +474,7 @@ def download(
             res = httpGet(
                 f"{cred.url}?sid={cred.sessionId}&wid={cred.downloadWaitWindowId}&pid={downloadWaitPagePid}",
                 headers=cred.headers,
+                httpClient=cred.client,
             )
 
             waitCompId = re.search(
@@ -148,10 +488,15 @@ def download(
             ).group(1)
             cred.downloadWaitCeid["pingerWidget"] = pingerWidgetCeid
 
-            # wait
+            # wait, bounded and checking the token at each tick
+            waitStart = time.monotonic()
             while True:
+                if time.monotonic() - waitStart > metadataWaitSeconds:
+                    raise cancelledError(
+                        f"No metadata download link after {metadataWaitSeconds} s"
+                    )
                 logger.debug("Wait for the metadata download link...")
-                time.sleep(5)
+                pause(metadataPollSeconds)
                 cmdPipe = [
                     buildCommand(
                         CompId=waitCompId,
@@ -169,7 +514,9 @@ def download(
                     cmdPipe,
                 )
 
-                res = httpPost(cred.url, data=body, headers=cred.headers)
+                res = httpPost(
+                    cred.url, data=body, headers=cred.headers, httpClient=cred.client
+                )
 
                 if "sys.downloadFile" in res.text:
                     break
@@ -180,44 +527,41 @@ def download(
     elif downloadType in ["protein", "dna"]:
         if downloadType == "protein":
             typeCvalue = "proteins"
-            downloadSegmentCeid = cred.downloadParamsCeid["proteinSegment"]
+            segmentField = "proteinSegment"
             faHeader = "Protein Accession no.|Gene name|Isolate name|Isolate ID|Type@Collection date"
         else:
             typeCvalue = "dna"
-            downloadSegmentCeid = cred.downloadParamsCeid["dnaSegment"]
+            segmentField = "dnaSegment"
             faHeader = (
                 "DNA Accession no.|Segment|Isolate name|Isolate ID|Type@Collection date"
             )
 
-        resultDownloadCompId = cred.downloadPage["resultDownloadCompId"]
         downloadFormatCeid = cred.downloadParamsCeid["downloadFormat"]
+
+        formatPipe = formatCommands(
+            resultDownloadCompId, downloadFormatCeid, typeCvalue
+        )
+
+        formatFields = {"proteinSegment", "dnaSegment", "fastaHeader"}
+        if not formatFields <= cred.downloadParamsCeid.keys():
+            # the segment fields appear once a format is chosen, and the fasta
+            # header only with dna, so both formats are shown on first use
+            body = buildRequestBody(
+                cred.sessionId,
+                cred.downloadWindowId,
+                cred.downloadPage["pid"],
+                formatCommands(resultDownloadCompId, downloadFormatCeid, "proteins")
+                + formatCommands(resultDownloadCompId, downloadFormatCeid, "dna"),
+            )
+            res = httpPost(
+                cred.url, data=body, headers=cred.headers, httpClient=cred.client
+            )
+            parseDownloadFormats(cred, res.text)
+
+        downloadSegmentCeid = cred.downloadParamsCeid[segmentField]
         fastaHeaderCeid = cred.downloadParamsCeid["fastaHeader"]
 
-        cmdPipe = [
-            # select protein|dna
-            buildCommand(
-                CompId=resultDownloadCompId,
-                cmd="setTarget",
-                params={
-                    "cvalue": typeCvalue,
-                    "ceid": downloadFormatCeid,
-                },
-                equiv=f"ST{downloadFormatCeid}",
-            ),
-            buildCommand(
-                CompId=resultDownloadCompId,
-                cmd="ChangeValue",
-                params={
-                    "cvalue": typeCvalue,
-                    "ceid": downloadFormatCeid,
-                },
-                equiv=f"CV{downloadFormatCeid}",
-            ),
-            buildCommand(
-                CompId=resultDownloadCompId,
-                cmd="ShowProteins",
-                params={"ceid": downloadFormatCeid},
-            ),
+        cmdPipe = formatPipe + [
             # check segment
             buildCommand(
                 CompId=resultDownloadCompId,
@@ -262,14 +606,27 @@ def download(
             cred.sessionId, cred.downloadWindowId, cred.downloadPage["pid"], cmdPipe
         )
 
-        res = httpPost(cred.url, data=body, headers=cred.headers)
+        res = httpPost(
+            cred.url, data=body, headers=cred.headers, httpClient=cred.client
+        )
 
         api = re.search(r"sys\.downloadFile\(\\\"(.+?)\\\"", res.text).group(1)
 
+    return "https://" + urllib.parse.urlparse(cred.url).hostname + api
+
+
+def exportSelection(
+    cred, selectPipe, downloadType, segments, filename, count, store, seqStore=None
+):
+    """
+    Export the records selected by selectPipe on the current result page, save it to filename and close the download page.
+    """
+
+    downloadLink = exportLink(cred, selectPipe, downloadType, segments)
+
     # download
     logger.debug("Downloading...")
     now = datetime.now().strftime("%Y%m%d-%H%M%S")
-    count = len(isolateIds)
     if filename is None:
         if downloadType == "metadata":
             extension = "xls"
@@ -277,13 +634,137 @@ def download(
             extension = "fasta"
         filename = f"gisflu-{downloadType}-{count}records-{now}.{extension}"
 
-    downloadLink = "https://" + urllib.parse.urlparse(cred.url).hostname + api
-    res = httpGet(downloadLink, headers=cred.headers)
-
-    with open(filename, "wb") as f:
-        f.write(res.content)
+    with openOutput(filename) as f:
+        httpDownload(
+            downloadLink, headers=cred.headers, fileobj=f, httpClient=cred.client
+        )
 
+    # the session stays on the result page until the next operation
     downloadToResultPage(cred)
-    resultToBrowsePage(cred)
+
+    if store is not None and downloadType == "metadata":
+        store.syncMetadata(filename)
+    if seqStore is not None and downloadType in ["protein", "dna"]:
+        seqStore.syncFasta(filename)
 
     return None
+
+
+def parallelDownload(
+    pool: sessionPool,
+    isolateIds: list[str],
+    downloadType: str = "protein",
+    segments: list[str] = ["HA", "NA"],
+    chunkSize: int | None = None,
+    merge: str = "combined",
+    filename: str | None = None,
+    seqStore: sequenceStore | None = None,
+    token: cancelToken | None = None,
+) -> list[str]:
+    """
+    Downloads sequences as one export per segment (and per chunk of isolate IDs), running the exports concurrently over a session pool.
+
+    Finished parts are appended to the output files in order as soon as all parts before them are done, so the merge streams from disk to disk and never holds a whole file in memory.
+    If a part fails or the token is cancelled, the queued parts are skipped, the running ones are stopped and the partial outputs are removed.
+
+    Args:
+        pool (sessionPool): The sessions to run the exports on.
+        isolateIds (list): list of isolate IDs to download data for.
+        downloadType (str, optional): The type of data to download, protein|dna. Defaults to "protein".
+        segments (list, optional): list of segments to download. Defaults to ["HA", "NA"].
+        chunkSize (int, optional): The maximum number of isolate IDs per export. Defaults to None, one export per segment.
+        merge (str, optional): Write one "combined" file, or one file per "segment". Defaults to "combined".
+        filename (str, optional): The name of the combined file. With merge="segment", the segment name is inserted before the extension, such as "records-HA.fasta.gz". If not provided, a default filename will be generated.
+        seqStore (sequenceStore, optional): A local sequence store to sync downloaded sequences into. Defaults to None.
+        token (cancelToken, optional): A deadline and cancellation token shared by all parts. Defaults to None.
+
+    Return:
+        list[str]: The written filenames.
+
+    Example:
+        ```
+        pool = gisflu.sessionPool(size=4)
+        gisflu.parallelDownload(pool, isolateIds, segments=["HA", "NA", "PB2", "PB1"],
+            chunkSize=5000, merge="segment", filename="records.fasta")
+        ```
+    """
+
+    assert downloadType in ["protein", "dna"], "downloadType must be protein|dna"
+    assert merge in ["combined", "segment"], "merge must be combined|segment"
+    assert len(isolateIds) > 0, "isolateIds must not be empty"
+
+    if filename is None:
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        count = len(isolateIds)
+        filename = f"gisflu-{downloadType}-{count}records-{now}.fasta"
+
+    if merge == "combined":
+        outputs = {segment: filename for segment in segments}
+    else:
+        stem, extension = splitExtension(filename)
+        outputs = {segment: f"{stem}-{segment}{extension}" for segment in segments}
+
+    chunkSize = chunkSize or len(isolateIds)
+    chunks = [
+        isolateIds[i : i + chunkSize] for i in range(0, len(isolateIds), chunkSize)
+    ]
+    parts = [(segment, chunk) for segment in segments for chunk in chunks]
+    logger.debug(f"Split download into {len(parts)} parts")
+
+    tempdir = tempfile.mkdtemp(prefix="gisflu-", dir=os.path.dirname(filename) or ".")
+    partFiles = [os.path.join(tempdir, f"part{i}.fasta") for i in range(len(parts))]
+
+    # cancelled when a part fails, so that running parts stop early
+    partsToken = cancelToken(parent=token)
+
+    def worker(i):
+        segment, chunk = parts[i]
+        checkToken(partsToken)
+        with pool.session() as cred:
+            download(
+                cred,
+                chunk,
+                downloadType,
+                [segment],
+                filename=partFiles[i],
+                seqStore=seqStore,
+                token=partsToken,
+            )
+        return i
+
+    # outputs stay open, parts are appended in order
+    files = {output: openOutput(output) for output in set(outputs.values())}
+
+    done = set()
+    nextPart = 0
+    executor = ThreadPoolExecutor(max_workers=pool.size)
+    try:
+        futures = [executor.submit(worker, i) for i in range(len(parts))]
+        for future in as_completed(futures):
+            done.add(future.result())
+            while nextPart in done:
+                out = files[outputs[parts[nextPart][0]]]
+                with open(partFiles[nextPart], "rb") as part:
+                    shutil.copyfileobj(part, out)
+                    # keep records of the next part on their own lines
+                    if part.tell() > 0:
+                        part.seek(-1, os.SEEK_END)
+                        if part.read(1) != b"\n":
+                            out.write(b"\n")
+                os.remove(partFiles[nextPart])
+                nextPart += 1
+    except BaseException:
+        # skip the queued parts, stop the running ones and drop the partial outputs
+        partsToken.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for output, f in files.items():
+            f.close()
+            os.remove(output)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        for f in files.values():
+            f.close()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    return sorted(set(outputs.values()), key=list(outputs.values()).index)
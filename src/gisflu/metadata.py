@@ -0,0 +1,269 @@
+import csv
+import importlib
+import codecs
+import itertools
+import tempfile
+from html.parser import HTMLParser
+from typing import Iterable, Iterator
+import pandas as pd
+from .compress import openInput
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# bytes read before choosing a parser
+sniffSize = 4096
+# a workbook is spooled to disk above this size
+spoolSize = 64 * 1024 * 1024
+
+ole2Magic = bytes.fromhex("d0cf11e0a1b11ae1")
+zipMagic = b"PK\x03\x04"
+
+# columns of the metadata export -> result columns of search()
+metadataColumnDict = {
+    "Isolate_Id": "Isolate ID",
+    "Isolate_Name": "Name",
+    "Subtype": "Subtype",
+    "Lineage": "Lineage",
+    "Location": "Location",
+    "Host": "Host",
+    "Collection_Date": "Collection Date",
+    "Submission_Date": "Submission Date",
+    **{
+        f"{segment} Segment_Id": segment
+        for segment in ["PB2", "PB1", "PA", "HA", "NP", "NA", "MP", "NS"]
+    },
+}
+
+segmentColumns = ["PB2", "PB1", "PA", "HA", "NP", "NA", "MP", "NS"]
+
+
+def sniffFormat(head: bytes) -> str:
+    """
+    Return the real format of a metadata export from its first bytes: "ole2" (a BIFF .xls workbook), "xlsx", "html" (a table) or "tsv".
+
+    The export is named ".xls" whatever its format.
+    """
+    if head.startswith(ole2Magic):
+        return "ole2"
+    if head.startswith(zipMagic):
+        return "xlsx"
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<"):
+        return "html"
+    return "tsv"
+
+
+def decodeLines(chunks):
+    # utf-8 lines of bytes chunks, a character may be split between chunks
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + decoder.decode(chunk)).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    rest += decoder.decode(b"", final=True)
+    if rest:
+        yield rest
+
+
+def tsvRows(chunks):
+    for row in csv.reader(decodeLines(chunks), delimiter="\t"):
+        if row:
+            yield row
+
+
+class tableParser(HTMLParser):
+    # collect the cells of <tr> rows, fed incrementally
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.row = []
+        elif tag in ["td", "th"] and self.row is not None:
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if tag in ["td", "th"] and self.cell is not None:
+            self.row.append("".join(self.cell).strip())
+            self.cell = None
+        elif tag == "tr" and self.row is not None:
+            if self.cell is not None:
+                self.handle_endtag("td")
+            if self.row:
+                self.rows.append(self.row)
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+
+def htmlRows(chunks):
+    parser = tableParser()
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.rows
+        parser.rows = []
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.rows
+
+
+def importWorkbookEngine(exportFormat):
+    # the pandas engine of a real workbook, an optional dependency
+    module = "xlrd" if exportFormat == "ole2" else "openpyxl"
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        raise ImportError(
+            f"Reading a metadata export in {exportFormat} format requires {module}, "
+            'install it with "pip install gisflu[xls]"'
+        )
+    return module
+
+
+def workbookRows(chunks, exportFormat="xlsx"):
+    # a workbook can not be read before its end, spool it with bounded memory
+    importWorkbookEngine(exportFormat)
+    with tempfile.SpooledTemporaryFile(max_size=spoolSize) as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.seek(0)
+        df = pd.read_excel(f, dtype=str)
+
+    yield list(df.columns)
+    for row in df.itertuples(index=False):
+        yield [None if pd.isna(value) else value for value in row]
+
+
+def metadataRows(chunks):
+    """
+    Iterate over the rows of a metadata export given as bytes chunks, the header first.
+
+    TSV and HTML exports are parsed as the chunks arrive. A real workbook is only
+    read once complete, from a temporary file.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= sniffSize:
+            break
+
+    exportFormat = sniffFormat(head)
+    logger.debug(f"Parse metadata export as {exportFormat}")
+
+    chunks = itertools.chain([head], chunks)
+    if exportFormat == "tsv":
+        return tsvRows(chunks)
+    if exportFormat == "html":
+        return htmlRows(chunks)
+    return workbookRows(chunks, exportFormat)
+
+
+def metadataFrames(chunks, chunkSize: int = 10000):
+    """
+    Iterate over DataFrames of at most chunkSize rows of a metadata export given as bytes chunks, with its own column names.
+
+    Empty values are None. At least one DataFrame is returned, empty if the export has no rows.
+    """
+    assert chunkSize >= 1, "chunkSize must be at least 1"
+
+    rows = metadataRows(chunks)
+    header = next(rows, [])
+
+    def frameOf(batch):
+        # pad or cut rows to the header
+        width = len(header)
+        batch = [
+            [value if value != "" else None for value in row[:width]]
+            + [None] * (width - len(row))
+            for row in batch
+        ]
+        return pd.DataFrame(batch, columns=header, dtype=object)
+
+    empty = True
+    while True:
+        batch = list(itertools.islice(rows, chunkSize))
+        if not batch:
+            break
+        empty = False
+        yield frameOf(batch)
+
+    if empty:
+        yield frameOf([])
+
+
+def fileChunks(fileobj, size: int = 1 << 16):
+    # bytes chunks of a binary file object
+    return iter(lambda: fileobj.read(size), b"")
+
+
+def readMetadata(filename: str) -> pd.DataFrame:
+    # a metadata export of download(), optionally compressed, with its own column names
+    with openInput(filename) as f:
+        return parseMetadata(f)
+
+
+def parseMetadata(fileobj) -> pd.DataFrame:
+    # a metadata export in a binary file object, whatever its real format
+    return pd.concat(metadataFrames(fileChunks(fileobj)), ignore_index=True)
+
+
+def metadataToSearch(df: pd.DataFrame) -> pd.DataFrame:
+    # rename metadata columns to those of search(), keep the segment IDs only
+    df = df.rename(columns=metadataColumnDict)
+    for segment in segmentColumns:
+        if segment in df.columns:
+            df[segment] = df[segment].map(
+                lambda v: v.split("|")[0] if isinstance(v, str) else v
+            )
+
+    return df
+
+
+def metadataChunks(
+    source: str | Iterable[bytes], chunkSize: int = 10000
+) -> Iterator[pd.DataFrame]:
+    """
+    Parse a metadata export incrementally, as DataFrames with the columns of `search()`.
+
+    The real format of the export (TSV, HTML table or workbook) is detected from
+    its first bytes. TSV and HTML exports are parsed while they are read, so memory
+    is bounded by chunkSize whatever the size of the export. Reading a real workbook
+    requires `xlrd` (.xls) or `openpyxl` (.xlsx), installed with the `xls` extra.
+
+    Every value is kept as a string, dates included, as in the results of `search()`,
+    so the columns have the same types in every chunk.
+
+    Args:
+        source (str | Iterable[bytes]): A metadata file of `download()`, optionally compressed, or the bytes chunks of an export, such as a download in progress.
+        chunkSize (int, optional): The maximum number of rows per DataFrame. Defaults to 10000.
+
+    Return:
+        Iterator[pd.DataFrame]: The rows, empty values are missing.
+
+    Example:
+        ```
+        for df in gisflu.metadataChunks("metadata.xls", chunkSize=50000):
+            df[df["Host"] == "Human"].to_csv("human.csv", mode="a", header=False)
+        ```
+    """
+
+    if isinstance(source, str):
+        with openInput(source) as f:
+            yield from metadataChunks(fileChunks(f), chunkSize)
+        return None
+
+    for df in metadataFrames(source, chunkSize):
+        yield metadataToSearch(df)
+
+    return None
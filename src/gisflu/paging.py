@@ -0,0 +1,91 @@
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+
+class pageSizeTuner:
+    """
+    Chooses `rows_per_page` for successive `GetData` requests of one session.
+
+    Starting from the session's remembered page size, the size doubles while the
+    latency per row keeps improving by at least `minGain`. It settles on the best
+    size seen when the gain stops, when a request fails, or when the server returns
+    fewer rows than asked for (a server-side cap). The settled size is stored in
+    `cred.pageSize`, so later searches of the session start from it without probing.
+    Timings of every page size are accumulated in `cred.pageSizeStats`.
+
+    Args:
+        cred (credentials): The credentials object of the session.
+        pageSize (int, optional): A fixed page size, which disables tuning. Defaults to None.
+        maxPageSize (int, optional): The largest page size to probe. Defaults to 1000.
+        minGain (float, optional): The relative per-row latency improvement needed to keep growing. Defaults to 0.1.
+    """
+
+    def __init__(self, cred, pageSize=None, maxPageSize=1000, minGain=0.1):
+        self.cred = cred
+        self.maxPageSize = maxPageSize
+        self.minGain = minGain
+        self.tuning = pageSize is None and not cred.pageSizeTuned
+        self.size = pageSize or cred.pageSize
+        self.best = self.size
+        self.bestPerRow = None
+
+    def record(self, requested, rows, seconds):
+        stats = self.cred.pageSizeStats.setdefault(requested, [0, 0.0])
+        stats[0] += rows
+        stats[1] += seconds
+
+        if not self.tuning or rows == 0:
+            return None
+
+        if rows < requested and requested == self.size:
+            # the server capped the page
+            logger.debug(f"Server returned {rows} of {requested} rows per page")
+            self.best = rows
+            self.settle()
+            return None
+
+        if requested != self.size:
+            # the last, partial page says nothing about this size
+            return None
+
+        perRow = seconds / rows
+        if self.bestPerRow is None or perRow < self.bestPerRow * (1 - self.minGain):
+            self.best, self.bestPerRow = self.size, perRow
+            if self.size >= self.maxPageSize:
+                self.settle()
+            else:
+                self.size = min(self.size * 2, self.maxPageSize)
+        else:
+            self.settle()
+
+        return None
+
+    def fail(self, requested):
+        """
+        Handle a failed page request, return whether it can be retried with a smaller page.
+        """
+        if not self.tuning or requested <= self.best:
+            return False
+
+        logger.debug(f"Page size {requested} failed, fall back to {self.best}")
+        self.settle()
+        return True
+
+    def finish(self):
+        # remember progress, even if the result ended before tuning settled
+        if self.tuning and self.bestPerRow is not None:
+            self.cred.pageSize = self.best
+
+        return None
+
+    def settle(self):
+        self.size = self.best
+        self.tuning = False
+        self.cred.pageSize = self.best
+        self.cred.pageSizeTuned = True
+        logger.debug(f"Page size settled at {self.best}")
+
+        return None
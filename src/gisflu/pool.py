@@ -0,0 +1,83 @@
+import os
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from .login import login
+from .utils import newClient
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+
+class sessionPool:
+    """
+    A fixed-size pool of logged-in sessions, each with its own HTTP client.
+
+    A GISAID session keeps page state on the server side, so one session can only
+    serve one operation at a time. The pool hands out idle sessions and blocks when
+    all of them are busy.
+
+    Args:
+        size (int, optional): The number of sessions to log in. Defaults to 2.
+        username (str, optional): The username to log in with. If not provided, it will be fetched from the environment variable "GISAID_USERNAME".
+        password (str, optional): The password to log in with. If not provided, it will be fetched from the environment variable "GISAID_PASSWORD".
+        clientFactory (callable, optional): Returns a new `httpx.Client` for each session. Defaults to `utils.newClient`.
+
+    Example:
+        ```
+        pool = gisflu.sessionPool(size=4)
+        with pool.session() as cred:
+            gisflu.search(cred, type=["A"], HA=["3"])
+        ```
+    """
+
+    def __init__(self, size=2, username=None, password=None, clientFactory=None):
+        assert size >= 1, "size must be at least 1"
+
+        self.size = size
+        self.username = username or os.getenv("GISAID_USERNAME")
+        self.password = password or os.getenv("GISAID_PASSWORD")
+        self.clientFactory = clientFactory or newClient
+        self.idle = queue.Queue()
+        self.sessions = []
+
+        # log in all sessions concurrently
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            for cred in executor.map(lambda _: self.newSession(), range(size)):
+                self.sessions.append(cred)
+                self.idle.put(cred)
+
+        logger.debug(f"{size} sessions logged in")
+
+    def newSession(self):
+        return login(self.username, self.password, httpClient=self.clientFactory())
+
+    def acquire(self, timeout=None):
+        return self.idle.get(timeout=timeout)
+
+    def release(self, cred):
+        self.idle.put(cred)
+
+    @contextmanager
+    def session(self, timeout=None):
+        cred = self.acquire(timeout=timeout)
+        try:
+            yield cred
+        finally:
+            self.release(cred)
+
+    def close(self):
+        for cred in self.sessions:
+            if cred.client is not None:
+                cred.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"sessionPool(size={self.size}, idle={self.idle.qsize()})"
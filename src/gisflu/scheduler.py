@@ -0,0 +1,164 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from .pool import sessionPool
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+
+class scheduler:
+    """
+    Runs operations over a session pool by priority class, with a concurrency limit per class.
+
+    Jobs are queued in classes, listed from the highest priority to the lowest.
+    Whenever a session is free, the oldest job of the first class below its limit
+    runs on it. With the default limits, bulk jobs never take the last session,
+    so quick interactive calls only wait for another interactive call, while bulk
+    jobs fill the remaining sessions. A running job is never interrupted: a
+    session serves one operation at a time.
+
+    Args:
+        pool (sessionPool): The sessions to run the jobs on.
+        limits (dict, optional): The maximum number of running jobs per class, in priority order. Defaults to {"interactive": pool.size, "bulk": pool.size - 1}, and at least 1 bulk job.
+
+    Example:
+        ```
+        pool = gisflu.sessionPool(size=4)
+        with gisflu.scheduler(pool) as jobs:
+            nightly = jobs.submit(gisflu.download, isolateIds, filename="h3.fasta",
+                jobClass="bulk")
+            df = jobs.submit(gisflu.search, HA=["5"], recordLimit=100).result()
+        ```
+    """
+
+    def __init__(self, pool: sessionPool, limits: dict | None = None):
+        if limits is None:
+            limits = {"interactive": pool.size, "bulk": max(pool.size - 1, 1)}
+        assert len(limits) > 0, "limits must not be empty"
+        assert all(n >= 1 for n in limits.values()), "limits must be at least 1"
+
+        self.pool = pool
+        self.limits = dict(limits)
+        self.queues = {jobClass: deque() for jobClass in limits}
+        self.running = {jobClass: 0 for jobClass in limits}
+        self.started = {jobClass: 0 for jobClass in limits}
+        self.waited = {jobClass: 0.0 for jobClass in limits}
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # one worker per session, each takes a session from the pool for each job
+        self.workers = [
+            threading.Thread(target=self.work, daemon=True) for _ in range(pool.size)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, func, *args, jobClass: str = "interactive", **kwargs) -> Future:
+        """
+        Queue func(cred, *args, **kwargs), cred being a session of the pool.
+
+        Args:
+            func (callable): An operation taking the credentials first, such as `gisflu.search`.
+            jobClass (str, optional): The class of the job, a key of limits. Defaults to "interactive".
+
+        Return:
+            concurrent.futures.Future: The result of func. A job still queued can be cancelled with `Future.cancel()`.
+        """
+        assert jobClass in self.limits, f"Unknown job class: {jobClass}"
+
+        future = Future()
+        with self.condition:
+            assert not self.closed, "The scheduler is closed"
+            self.queues[jobClass].append(
+                (future, func, args, kwargs, time.perf_counter())
+            )
+            self.condition.notify()
+
+        return future
+
+    def nextJob(self):
+        # the oldest job of the first class below its limit
+        for jobClass, jobs in self.queues.items():
+            if jobs and self.running[jobClass] < self.limits[jobClass]:
+                return jobClass, jobs.popleft()
+        return None, None
+
+    def work(self):
+        while True:
+            with self.condition:
+                jobClass, job = self.nextJob()
+                while job is None:
+                    if self.closed:
+                        return None
+                    self.condition.wait()
+                    jobClass, job = self.nextJob()
+
+                future, func, args, kwargs, queuedAt = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.running[jobClass] += 1
+                self.started[jobClass] += 1
+                self.waited[jobClass] += time.perf_counter() - queuedAt
+
+            try:
+                with self.pool.session() as cred:
+                    result = func(cred, *args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                with self.condition:
+                    self.running[jobClass] -= 1
+                    # a job of a class at its limit may be runnable now
+                    self.condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Return the queued, running and started jobs, and the mean seconds waited before running, per class.
+        """
+        with self.condition:
+            return {
+                jobClass: {
+                    "queued": len(self.queues[jobClass]),
+                    "running": self.running[jobClass],
+                    "started": self.started[jobClass],
+                    "meanWait": (
+                        self.waited[jobClass] / self.started[jobClass]
+                        if self.started[jobClass]
+                        else None
+                    ),
+                }
+                for jobClass in self.limits
+            }
+
+    def close(self, wait: bool = True, cancelQueued: bool = False):
+        """
+        Stop accepting jobs. Queued jobs still run, unless cancelQueued.
+        """
+        with self.condition:
+            self.closed = True
+            if cancelQueued:
+                for jobs in self.queues.values():
+                    while jobs:
+                        jobs.popleft()[0].cancel()
+            self.condition.notify_all()
+
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"scheduler(limits={self.limits})"
@@ -0,0 +1,245 @@
+import re
+import hashlib
+import sqlite3
+import threading
+from .compress import openInput, openOutput
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# fields of the fasta header set by download()
+headerFields = ["Accession", "Segment", "Isolate name", "Isolate ID", "Type", "Date"]
+
+# rows read at a time by sequenceStore.records()
+fetchSize = 1000
+
+schema = """
+CREATE TABLE IF NOT EXISTS sequences (
+    hash TEXT PRIMARY KEY,
+    sequence TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    isolateId TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    header TEXT NOT NULL,
+    hash TEXT NOT NULL REFERENCES sequences (hash),
+    PRIMARY KEY (isolateId, segment, accession)
+);
+CREATE INDEX IF NOT EXISTS idxRefsHash ON refs (hash);
+"""
+
+
+def readFasta(fileobj):
+    """
+    Iterate over (header, sequence) of a text fasta file object, without the ">" of headers.
+    """
+    header, lines = None, []
+    for line in fileobj:
+        line = line.strip()
+        if line.startswith(">"):
+            if header is not None:
+                yield header, "".join(lines)
+            header, lines = line[1:], []
+        elif line:
+            lines.append(line)
+    if header is not None:
+        yield header, "".join(lines)
+
+
+def parseHeader(header: str) -> dict:
+    # "Accession|Segment|Isolate name|Isolate ID|Type@Collection date"
+    fields = header.split("|")
+    assert len(fields) >= 5, f"Unexpected fasta header: {header}"
+    typeDate = re.split(r"[|@]", "|".join(fields[4:]), maxsplit=1)
+    values = fields[:4] + typeDate + [None] * (2 - len(typeDate))
+
+    return dict(zip(headerFields, values))
+
+
+def hashOf(sequence: str) -> str:
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+
+class sequenceStore:
+    """
+    A local content-addressed store of downloaded sequences.
+
+    Each distinct sequence is kept once under its SHA-256 hash. Every fasta record
+    keeps only a reference (isolate ID, segment, accession and the original header)
+    to the hash, so sequences shared by many isolates cost their size only once.
+    `exportFasta()` rebuilds standard fasta files from the references.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to "gisflu-seq.db".
+
+    Example:
+        ```
+        seqs = gisflu.sequenceStore("gisflu-seq.db")
+        gisflu.download(cred, isolateIds, downloadType="protein", segments=["HA", "NA"],
+            filename="records.fasta", seqStore=seqs)
+        seqs.exportFasta("ha.fasta", segments=["HA"])
+        ```
+    """
+
+    def __init__(self, path="gisflu-seq.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript(schema)
+
+    def syncFasta(self, filename: str, batchSize: int = 5000) -> int:
+        """
+        Insert or update the records of a fasta file downloaded by `download()`.
+
+        Args:
+            filename (str): The fasta file, optionally compressed.
+            batchSize (int, optional): The number of records written per transaction. Defaults to 5000.
+
+        Return:
+            int: The number of synced records.
+        """
+
+        total = 0
+        with openInput(filename, "rt") as f:
+            batch = []
+            for header, sequence in readFasta(f):
+                batch.append((header, sequence))
+                if len(batch) >= batchSize:
+                    total += self.syncRecords(batch)
+                    batch = []
+            total += self.syncRecords(batch)
+
+        logger.debug(f"Synced {total} sequences of {filename} into {self.path}")
+
+        return total
+
+    def syncRecords(self, records) -> int:
+        sequences, refs = {}, []
+        for header, sequence in records:
+            fields = parseHeader(header)
+            digest = hashOf(sequence)
+            sequences[digest] = sequence
+            refs.append(
+                (
+                    fields["Isolate ID"],
+                    fields["Segment"],
+                    fields["Accession"],
+                    header,
+                    digest,
+                )
+            )
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO sequences (hash, sequence) VALUES (?, ?)",
+                sequences.items(),
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO refs (isolateId, segment, accession, header, hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                refs,
+            )
+
+        return len(refs)
+
+    def records(self, isolateIds=None, segments=None):
+        """
+        Iterate over (header, sequence) of stored records, ordered by isolate ID and segment.
+        """
+
+        where, params = [], []
+        for field, values in [("isolateId", isolateIds), ("segment", segments)]:
+            if values:
+                where.append(f"r.{field} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+
+        sql = "SELECT r.header, s.sequence FROM refs r JOIN sequences s USING (hash)"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.isolateId, r.segment, r.accession"
+
+        # fetched in batches, the lock is not held while the rows are consumed
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(fetchSize)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            with self.lock:
+                cursor.close()
+
+    def exportFasta(
+        self,
+        filename: str,
+        isolateIds: list[str] | None = None,
+        segments: list[str] | None = None,
+        lineWidth: int | None = None,
+    ) -> int:
+        """
+        Write stored records to a standard fasta file.
+
+        Args:
+            filename (str): The fasta file to write, compressed if it ends with ".gz", ".bgz" or ".zst".
+            isolateIds (list[str], optional): Only export these isolates. Defaults to None, all isolates.
+            segments (list[str], optional): Only export these segments. Defaults to None, all segments.
+            lineWidth (int, optional): Wrap sequences at this width. Defaults to None, one line per sequence.
+
+        Return:
+            int: The number of exported records.
+        """
+
+        n = 0
+        with openOutput(filename, "wt") as f:
+            for header, sequence in self.records(isolateIds, segments):
+                f.write(f">{header}\n")
+                if lineWidth:
+                    for i in range(0, len(sequence), lineWidth):
+                        f.write(sequence[i : i + lineWidth] + "\n")
+                else:
+                    f.write(sequence + "\n")
+                n += 1
+
+        logger.debug(f"Exported {n} sequences to {filename}")
+
+        return n
+
+    def stats(self) -> dict:
+        """
+        Return the numbers of records and distinct sequences, and the stored and expanded sequence bytes.
+        """
+
+        with self.lock:
+            records, expanded = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(s.sequence)), 0) "
+                "FROM refs r JOIN sequences s USING (hash)"
+            ).fetchone()
+            sequences, stored = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(sequence)), 0) FROM sequences"
+            ).fetchone()
+
+        return {
+            "records": records,
+            "sequences": sequences,
+            "storedBytes": stored,
+            "expandedBytes": expanded,
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"sequenceStore(path={self.path})"
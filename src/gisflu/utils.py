@@ -1,11 +1,20 @@
+import re
 import logging
 import httpx
 import json
 import time
 import stamina
+from contextlib import contextmanager
+from .deadline import currentToken, cancelToken, cancelledError
 
 timeout = httpx.Timeout(10.0, read=240.0, write=240.0)
-client = httpx.Client(timeout=timeout)
+
+
+def newClient():
+    return httpx.Client(timeout=timeout)
+
+
+client = newClient()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.NullHandler())
@@ -37,11 +46,12 @@ def buildRequestBody(sessionId, windowId, pageId, cmdPipe, mode="ajax"):
 
 def buildBrowseCommand(credentials, ident, value):
     # type check
-    if ident in ["type", "HA", "NA", "host", "requestSegments"]:
+    if ident in ["type", "HA", "NA", "lineage", "host", "requestSegments"]:
         assert isinstance(value, list), f"{ident} must be a list"
         value = [str(v) for v in value]
     elif ident in [
         "searchPattern",
+        "location",
         "collectDateFrom",
         "collectDateTo",
         "submitDateFrom",
@@ -86,39 +96,231 @@ def buildBrowseCommand(credentials, ident, value):
     return res
 
 
-def buildBatch(startIdx, endIdx, batchSize):
-    res = []
-    for i in range((endIdx - startIdx) // batchSize + 1):
-        start = i * batchSize
-        if i != (endIdx - startIdx) // batchSize:
-            end = i * batchSize + batchSize - 1
-        else:
-            end = endIdx
-        count = end - start + 1
-        res.append({"start": start, "end": end, "count": count})
+def buildSearchCommand(
+    credentials,
+    searchPattern=None,
+    type=None,
+    HA=None,
+    NA=None,
+    lineage=None,
+    host=None,
+    location=None,
+    collectDateFrom=None,
+    collectDateTo=None,
+    submitDateFrom=None,
+    submitDateTo=None,
+    requestSegments=None,
+    onlyComplete=False,
+):
+    cmdPipe = []
+    if searchPattern:
+        cmdPipe += buildBrowseCommand(credentials, "searchPattern", searchPattern)
+    if type:
+        cmdPipe += buildBrowseCommand(credentials, "type", type)
+    if HA:
+        cmdPipe += buildBrowseCommand(credentials, "HA", HA)
+    if NA:
+        cmdPipe += buildBrowseCommand(credentials, "NA", NA)
+    if lineage:
+        cmdPipe += buildBrowseCommand(credentials, "lineage", lineage)
+    if host:
+        cmdPipe += buildBrowseCommand(credentials, "host", host)
+    if location:
+        cmdPipe += buildBrowseCommand(credentials, "location", location)
+    if collectDateFrom:
+        cmdPipe += buildBrowseCommand(credentials, "collectDateFrom", collectDateFrom)
+    if collectDateTo:
+        cmdPipe += buildBrowseCommand(credentials, "collectDateTo", collectDateTo)
+    if submitDateFrom:
+        cmdPipe += buildBrowseCommand(credentials, "submitDateFrom", submitDateFrom)
+    if submitDateTo:
+        cmdPipe += buildBrowseCommand(credentials, "submitDateTo", submitDateTo)
+    if requestSegments:
+        cmdPipe += buildBrowseCommand(credentials, "requestSegments", requestSegments)
+        if onlyComplete is True:
+            cmdPipe += buildBrowseCommand(credentials, "onlyComplete", ["y"])
+
+    return cmdPipe
+
+
+def resetCommand(credentials):
+    # clear the filters of the browse page, the server answers the unfiltered total
+    return buildCommand(
+        CompId=credentials.browsePage["searchButtonCompId"], cmd="Reset"
+    )
 
-    return res
+
+def parseCount(text):
+    # records and sequences count in the browse page, the last one follows all filters
+    recordCount, recordSeqCount = [
+        int(i.replace(",", ""))
+        for i in re.findall(r"Total: ([\d,]+) viruses \(([\d,]+) sequences\)", text)[-1]
+    ]
+
+    return recordCount, recordSeqCount
 
 
 ################## requests ####################
 
 
+def checkToken(token=None):
+    # raise if the token of the running call is cancelled or expired
+    token = token or currentToken.get()
+    if token is not None:
+        token.check()
+
+    return token
+
+
+def requestTimeout(httpClient, token=None):
+    # checked before each attempt, so a cancelled call is not retried
+    token = checkToken(token)
+    if token is None:
+        return httpx.USE_CLIENT_DEFAULT
+
+    return token.timeout(httpClient.timeout)
+
+
+def pause(seconds):
+    token = currentToken.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+    return None
+
+
 @stamina.retry(on=httpx.HTTPError, attempts=3)
-def httpGet(url, headers):
-    res = client.get(url, headers=headers, follow_redirects=True)
+def httpGet(url, headers, httpClient=None):
+    httpClient = httpClient or client
+    res = httpClient.get(
+        url,
+        headers=headers,
+        follow_redirects=True,
+        timeout=requestTimeout(httpClient),
+    )
     return res
 
 
 @stamina.retry(on=httpx.HTTPError, attempts=3)
-def httpPost(url, data, headers):
-    res = client.post(url, data=data, headers=headers, follow_redirects=True)
+def httpPost(url, data, headers, httpClient=None):
+    httpClient = httpClient or client
+    res = httpClient.post(
+        url,
+        data=data,
+        headers=headers,
+        follow_redirects=True,
+        timeout=requestTimeout(httpClient),
+    )
     return res
 
 
+def httpStream(url, headers, httpClient=None, lines=True, token=None):
+    # yield the body by lines or bytes chunks, a failure while streaming is not retried
+    # the token is given explicitly, as the generator runs after the call returned
+    httpClient = httpClient or client
+    with httpClient.stream(
+        "GET",
+        url,
+        headers=headers,
+        follow_redirects=True,
+        timeout=requestTimeout(httpClient, token),
+    ) as res:
+        res.raise_for_status()
+        for item in res.iter_lines() if lines else res.iter_bytes():
+            checkToken(token)
+            yield item
+
+
+@stamina.retry(on=httpx.HTTPError, attempts=3)
+def httpDownload(url, headers, fileobj, httpClient=None):
+    # stream the body into fileobj, restarting it on retry
+    httpClient = httpClient or client
+    if fileobj.tell() > 0:
+        fileobj.seek(0)
+        fileobj.truncate()
+    size = 0
+    with httpClient.stream(
+        "GET",
+        url,
+        headers=headers,
+        follow_redirects=True,
+        timeout=requestTimeout(httpClient),
+    ) as res:
+        res.raise_for_status()
+        for chunk in res.iter_bytes():
+            checkToken()
+            fileobj.write(chunk)
+            size += len(chunk)
+    return size
+
+
 ################## page ####################
 
 
-def resultToBrowsePage(credentials):
+def browseToResultPage(credentials, cmdPipe=[]):
+    """
+    Leave the previous result page, then reset the browse page, run cmdPipe and search in one request, and go to the new result page.
+
+    Return the texts of the search response and of the result page.
+    """
+    # the Reset of the browse page goes with the search request
+    resultToBrowsePage(credentials, reset=False)
+
+    # filters left by count() are reset first
+    cmdPipe = (
+        [resetCommand(credentials)]
+        + cmdPipe
+        + [
+            buildCommand(
+                CompId=credentials.browsePage["searchButtonCompId"], cmd="search"
+            )
+        ]
+    )
+    body = buildRequestBody(
+        credentials.sessionId,
+        credentials.windowId,
+        credentials.browsePage["pid"],
+        cmdPipe,
+    )
+    res = httpPost(
+        credentials.url,
+        data=body,
+        headers=credentials.headers,
+        httpClient=credentials.client,
+    )
+    searchText = res.text
+
+    resultPagePid = re.search(r"sys.goPage\(\'(.+?)\'\)", searchText).group(1)
+    credentials.resultPage["pid"] = resultPagePid
+    credentials.currentPage = "result"
+
+    res = httpGet(
+        f"{credentials.url}?sid={credentials.sessionId}&pid={resultPagePid}",
+        headers=credentials.headers,
+        httpClient=credentials.client,
+    )
+
+    return searchText, res.text
+
+
+def resultToBrowsePage(credentials, reset=True):
+    """
+    Bring a session left on the result page back to a reset browse page.
+
+    Operations leave their session on the result page, the next one calls this first.
+    A download page left open is closed first. With reset=False the browse page is
+    not reset, for a caller whose next request starts with the Reset command.
+    """
+    if (
+        credentials.currentPage == "download"
+        and credentials.downloadPage["resultDownloadCompId"] is not None
+    ):
+        downloadToResultPage(credentials)
+    if credentials.currentPage not in ["result", "download"]:
+        return None
+
     cmdPipe = [
         buildCommand(CompId=credentials.resultPage["downloadCompId"], cmd="GoBack")
     ]
@@ -128,25 +330,37 @@ def resultToBrowsePage(credentials):
         credentials.resultPage["pid"],
         cmdPipe,
     )
-
-    httpPost(credentials.url, data=body, headers=credentials.headers)
+    httpPost(
+        credentials.url,
+        data=body,
+        headers=credentials.headers,
+        httpClient=credentials.client,
+    )
 
     browsePagePid = credentials.browsePage["pid"]
     httpGet(
         f"{credentials.url}?sid={credentials.sessionId}&pid={browsePagePid}",
         headers=credentials.headers,
+        httpClient=credentials.client,
     )
+    credentials.currentPage = "browse"
 
-    cmdPipe = [
-        buildCommand(CompId=credentials.browsePage["searchButtonCompId"], cmd="Reset")
-    ]
+    if not reset:
+        return None
+
+    cmdPipe = [resetCommand(credentials)]
     body = buildRequestBody(
         credentials.sessionId,
         credentials.windowId,
-        credentials.browsePage["pid"],
+        browsePagePid,
         cmdPipe,
     )
-    httpPost(credentials.url, data=body, headers=credentials.headers)
+    httpPost(
+        credentials.url,
+        data=body,
+        headers=credentials.headers,
+        httpClient=credentials.client,
+    )
 
     return None
 
@@ -165,16 +379,58 @@ def downloadToResultPage(credentials):
         cmdPipe,
     )
 
-    httpPost(credentials.url, data=body, headers=credentials.headers)
-    resultPagePid = credentials.resultPage["pid"]
-    httpGet(
-        f"{credentials.url}?sid={credentials.sessionId}&pid={resultPagePid}",
+    httpPost(
+        credentials.url,
+        data=body,
         headers=credentials.headers,
+        httpClient=credentials.client,
     )
+    credentials.currentPage = "result"
 
     return None
 
 
+# time allowed to bring an aborted session back to the browse page
+leaveSeconds = 30
+
+
+def leaveSession(credentials):
+    """
+    Bring the session of an aborted call back to the browse page, closing the download page if it is open.
+    """
+    if credentials is None:
+        return None
+
+    reset = currentToken.set(cancelToken(leaveSeconds))
+    try:
+        resultToBrowsePage(credentials)
+    except Exception as e:
+        logger.warning(f"Failed to reset the aborted session: {e!r}")
+    finally:
+        currentToken.reset(reset)
+
+    return None
+
+
+@contextmanager
+def tokenScope(credentials, token=None):
+    """
+    Run a call under token, and leave the session clean if the call is aborted.
+
+    Without token, the token of an enclosing call stays in use.
+    """
+    reset = currentToken.set(token) if token is not None else None
+    try:
+        yield currentToken.get()
+    except cancelledError:
+        logger.debug("Call aborted, reset the session...")
+        leaveSession(credentials)
+        raise
+    finally:
+        if reset is not None:
+            currentToken.reset(reset)
+
+
 ################## logger ####################
 def log(level=logging.DEBUG):
     logger = logging.getLogger(__package__)
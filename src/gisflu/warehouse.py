@@ -0,0 +1,512 @@
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+from .metadata import segmentColumns, metadataChunks
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+# result columns of search() -> warehouse fields
+searchColumnDict = {
+    "Isolate ID": "isolateId",
+    "Name": "name",
+    "Subtype": "subtype",
+    "Lineage": "lineage",
+    "Location": "location",
+    "Host": "host",
+    "Collection Date": "collectDate",
+    "Submission Date": "submitDate",
+}
+
+# result columns of search() covered by the record hash
+hashColumns = list(searchColumnDict) + segmentColumns
+
+schema = """
+CREATE TABLE IF NOT EXISTS isolates (
+    isolateId TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    HA TEXT,
+    NA TEXT,
+    subtype TEXT,
+    lineage TEXT,
+    location TEXT,
+    host TEXT,
+    collectDate TEXT,
+    submitDate TEXT,
+    segments TEXT,
+    record TEXT NOT NULL,
+    hash TEXT,
+    syncedAt TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idxSubtype ON isolates (type, HA, NA);
+CREATE INDEX IF NOT EXISTS idxLineage ON isolates (lineage);
+CREATE INDEX IF NOT EXISTS idxHost ON isolates (host COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idxLocation ON isolates (location COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idxCollectDate ON isolates (collectDate);
+CREATE INDEX IF NOT EXISTS idxSubmitDate ON isolates (submitDate);
+"""
+
+fields = [
+    "isolateId",
+    "name",
+    "type",
+    "HA",
+    "NA",
+    "subtype",
+    "lineage",
+    "location",
+    "host",
+    "collectDate",
+    "submitDate",
+    "segments",
+    "record",
+    "hash",
+    "syncedAt",
+]
+
+
+def parseSubtype(subtype):
+    # "A / H3N2" -> ("A", "3", "2"), "B" -> ("B", None, None)
+    match = re.match(r"^\s*([ABCD])(?:\s*/\s*H(\d+)N(\d+))?", subtype or "")
+    if match is None:
+        return None, None, None
+    return match.group(1, 2, 3)
+
+
+def recordHash(record: dict) -> str:
+    """
+    Return a stable content hash of a record over the normalized result columns of `search()`.
+
+    Missing and empty values are equal, other values are compared as stripped strings.
+    """
+    values = []
+    for column in hashColumns:
+        value = emptyToNone(record.get(column))
+        values.append(None if value is None else str(value).strip())
+
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def emptyToNone(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, str) and value.strip() == "":
+        return None
+    return value
+
+
+class warehouse:
+    """
+    A local SQLite store of isolate records, filled from `search()` results and metadata exports, queried with `localSearch()`.
+
+    Records are keyed by isolate ID. Syncing the same isolate again updates the fields
+    present in the new data and keeps the others. The content hash used by `diff()`
+    is that of the last `search()` result synced, not of the merged record.
+
+    Args:
+        path (str, optional): The SQLite database file. Defaults to "gisflu.db".
+
+    Example:
+        ```
+        store = gisflu.warehouse("gisflu.db")
+        store.sync(gisflu.search(cred, type=["A"], HA=["3"], recordLimit=100000))
+        gisflu.localSearch(store, HA=["3"], host=["human"], collectDateFrom="2024-01-01")
+        ```
+    """
+
+    def __init__(self, path="gisflu.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript(schema)
+            columns = [r[1] for r in self.conn.execute("PRAGMA table_info(isolates)")]
+            if "hash" not in columns:
+                # a warehouse of an older version
+                self.conn.execute("ALTER TABLE isolates ADD COLUMN hash TEXT")
+            self.updateHashes()
+
+    def updateHashes(self):
+        # hash the records stored by an older version
+        rows = self.conn.execute(
+            "SELECT isolateId, record FROM isolates WHERE hash IS NULL"
+        ).fetchall()
+
+        self.conn.executemany(
+            "UPDATE isolates SET hash = ? WHERE isolateId = ?",
+            [(recordHash(json.loads(record)), id) for id, record in rows],
+        )
+
+        return None
+
+    def selectRecords(self, isolateIds):
+        rows = []
+        for i in range(0, len(isolateIds), 500):
+            chunk = isolateIds[i : i + 500]
+            rows += self.conn.execute(
+                "SELECT isolateId, record, hash FROM isolates "
+                f"WHERE isolateId IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+
+        return rows
+
+    def rowOf(self, record, hash, syncedAt):
+        row = {field: record.get(label) for label, field in searchColumnDict.items()}
+        row["type"], row["HA"], row["NA"] = parseSubtype(row["subtype"])
+        present = [s for s in segmentColumns if record.get(s) is not None]
+        row["segments"] = "," + ",".join(present) + "," if present else None
+        row["record"] = json.dumps(record, default=str)
+        row["hash"] = hash
+        row["syncedAt"] = syncedAt
+
+        return row
+
+    def sync(self, df: pd.DataFrame) -> int:
+        """
+        Insert or update records from a `search()` result.
+
+        A missing or empty value of a stored record keeps the stored value. The
+        content hash is that of the synced result, so a field cleared by GISAID is
+        not reported as changed by `diff()` once synced.
+
+        Args:
+            df (pd.DataFrame): A DataFrame with the columns of `search()`.
+
+        Return:
+            int: The number of synced records.
+        """
+
+        return self.merge(df, snapshot=True)
+
+    def merge(self, df, snapshot):
+        # a metadata export (not a snapshot) keeps the hash of the last search() result
+        if df.shape[0] == 0:
+            return 0
+
+        assert "Isolate ID" in df.columns, 'The DataFrame needs an "Isolate ID" column'
+
+        syncedAt = datetime.now().isoformat(timespec="seconds")
+        records = [
+            {k: emptyToNone(v) for k, v in r.items()}
+            for r in df.to_dict(orient="records")
+        ]
+        updates = ", ".join(f"{f} = excluded.{f}" for f in fields if f != "isolateId")
+        sql = (
+            f"INSERT INTO isolates ({', '.join(fields)}) "
+            f"VALUES ({', '.join(':' + f for f in fields)}) "
+            f"ON CONFLICT(isolateId) DO UPDATE SET {updates}"
+        )
+
+        with self.lock, self.conn:
+            # merge into the stored records, the indexed columns follow the merged record
+            stored = {}
+            hashes = {}
+            for id, record, hash in self.selectRecords(
+                list({r["Isolate ID"] for r in records})
+            ):
+                stored[id] = json.loads(record)
+                hashes[id] = hash
+            merged = {}
+            for record in records:
+                id = record["Isolate ID"]
+                base = merged.setdefault(id, stored.get(id, {}))
+                for k, v in record.items():
+                    if v is not None or k not in base:
+                        base[k] = v
+                if snapshot:
+                    hashes[id] = recordHash(record)
+
+            self.conn.executemany(
+                sql,
+                [
+                    self.rowOf(record, hashes.get(id) or recordHash(record), syncedAt)
+                    for id, record in merged.items()
+                ],
+            )
+
+        logger.debug(f"Synced {len(records)} records into {self.path}")
+
+        return len(records)
+
+    def syncMetadata(self, filename: str) -> int:
+        """
+        Insert or update records from a metadata export of `download()`.
+
+        Args:
+            filename (str): The downloaded metadata file, optionally compressed.
+
+        Return:
+            int: The number of synced records.
+        """
+
+        # synced chunk by chunk, a big export is never read as a whole
+        return sum(self.merge(df, snapshot=False) for df in metadataChunks(filename))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM isolates").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"warehouse(path={self.path})"
+
+
+def filterOf(
+    searchPattern=None,
+    type=None,
+    HA=None,
+    NA=None,
+    lineage=None,
+    host=None,
+    location=None,
+    collectDateFrom=None,
+    collectDateTo=None,
+    submitDateFrom=None,
+    submitDateTo=None,
+    requestSegments=None,
+    onlyComplete=False,
+):
+    # SQL conditions and parameters of the search() criteria
+    where = []
+    params = []
+
+    def isIn(field, values, nocase=False):
+        collate = " COLLATE NOCASE" if nocase else ""
+        where.append(f"{field}{collate} IN ({', '.join('?' * len(values))})")
+        params.extend(str(v) for v in values)
+
+    if searchPattern:
+        where.append("(isolateId LIKE ? OR name LIKE ?)")
+        params += [f"%{searchPattern}%"] * 2
+    if type:
+        isIn("type", type)
+    if HA:
+        isIn("HA", HA)
+    if NA:
+        isIn("NA", NA)
+    if lineage:
+        isIn("lineage", lineage)
+    if host:
+        isIn("host", host, nocase=True)
+    if location:
+        where.append("location LIKE ?")
+        params.append(f"{location}%")
+    for field, op, value in [
+        ("collectDate", ">=", collectDateFrom),
+        ("collectDate", "<=", collectDateTo),
+        ("submitDate", ">=", submitDateFrom),
+        ("submitDate", "<=", submitDateTo),
+    ]:
+        if value:
+            where.append(f"{field} {op} ?")
+            params.append(value)
+    if requestSegments:
+        joiner = " AND " if onlyComplete else " OR "
+        where.append(
+            "(" + joiner.join("segments LIKE ?" for _ in requestSegments) + ")"
+        )
+        params += [f"%,{segment},%" for segment in requestSegments]
+
+    return where, params
+
+
+def localSearch(
+    store: warehouse,
+    searchPattern: str | None = None,
+    type: list[str] | None = None,
+    HA: list[str] | None = None,
+    NA: list[str] | None = None,
+    lineage: list[str] | None = None,
+    host: list[str] | None = None,
+    location: str | None = None,
+    collectDateFrom: str | None = None,
+    collectDateTo: str | None = None,
+    submitDateFrom: str | None = None,
+    submitDateTo: str | None = None,
+    requestSegments: list[str] | None = None,
+    onlyComplete: bool = False,
+    recordLimit: int | None = None,
+) -> pd.DataFrame:
+    """
+    Search for records in a local warehouse, with the same criteria as `search()`.
+
+    Except host: `search()` filters by host category (Human, Animal, Avian or
+    Mammals), while the warehouse only has the Host column of each record, such as
+    "Human", "Chicken" or "Swine". Locally, host matches that column, ignoring case,
+    so host=["human"] gives the same records but host=["avian"] does not.
+
+    Args:
+        store (warehouse): The local warehouse.
+        searchPattern (str, optional): The search pattern, matched against isolate id and isolate name. Defaults to None.
+        type (list[str], optional): A list of virus types to filter the search results. Defaults to None.
+        HA (list[str], optional): A list of hemagglutinin (HA) subtypes to filter the search results. Defaults to None.
+        NA (list[str], optional): A list of neuraminidase (NA) subtypes to filter the search results. Defaults to None.
+        lineage (list[str], optional): A list of lineages to filter the search results. Defaults to None.
+        host (list[str], optional): A list of values of the Host column, such as "Human" or "Chicken", not host categories. Defaults to None.
+        location (str, optional): A location to filter the search results, matched as a prefix such as "Asia / China". Defaults to None.
+        collectDateFrom (str, optional): The starting date for the collection date filter. Defaults to None.
+        collectDateTo (str, optional): The ending date for the collection date filter. Defaults to None.
+        submitDateFrom (str, optional): The starting date for the submission date filter. Defaults to None.
+        submitDateTo (str, optional): The ending date for the submission date filter. Defaults to None.
+        requestSegments (list[str], optional): A list of requested segments, records with any of them are returned. Defaults to None.
+        onlyComplete (bool, optional): Whether to only return records with all requested segments. Defaults to False.
+        recordLimit (int, optional): The maximum number of records to return. Defaults to None, no limit.
+
+    Return:
+        pd.DataFrame: A DataFrame with the columns of `search()`.
+
+    Example:
+        ```
+        store = gisflu.warehouse("gisflu.db")
+        gisflu.localSearch(store, type=["A"], HA=["3"], NA=["2"],
+            collectDateFrom="2020-01-01", recordLimit=10)
+        ```
+    """
+
+    where, params = filterOf(
+        searchPattern=searchPattern,
+        type=type,
+        HA=HA,
+        NA=NA,
+        lineage=lineage,
+        host=host,
+        location=location,
+        collectDateFrom=collectDateFrom,
+        collectDateTo=collectDateTo,
+        submitDateFrom=submitDateFrom,
+        submitDateTo=submitDateTo,
+        requestSegments=requestSegments,
+        onlyComplete=onlyComplete,
+    )
+
+    sql = "SELECT record FROM isolates"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY isolateId"
+    if recordLimit is not None:
+        sql += " LIMIT ?"
+        params.append(recordLimit)
+
+    with store.lock:
+        rows = store.conn.execute(sql, params).fetchall()
+
+    reslutDF = pd.DataFrame([json.loads(r[0]) for r in rows])
+
+    nrow = reslutDF.shape[0]
+    logger.debug(f"Local search completed: return {nrow} rows")
+
+    return reslutDF
+
+
+def diff(
+    store: warehouse,
+    df: pd.DataFrame,
+    searchPattern: str | None = None,
+    type: list[str] | None = None,
+    HA: list[str] | None = None,
+    NA: list[str] | None = None,
+    lineage: list[str] | None = None,
+    host: list[str] | None = None,
+    location: str | None = None,
+    collectDateFrom: str | None = None,
+    collectDateTo: str | None = None,
+    submitDateFrom: str | None = None,
+    submitDateTo: str | None = None,
+    requestSegments: list[str] | None = None,
+    onlyComplete: bool = False,
+) -> dict:
+    """
+    Compare a fresh `search()` result with the records stored in a warehouse, by their content hashes.
+
+    The criteria give the scope of the stored snapshot, and should be those of the
+    fresh search. The search must return its whole result (a large `recordLimit`),
+    otherwise records beyond the limit are reported as removed. As in `localSearch()`,
+    host matches the stored Host column, not a host category: for a search by an
+    animal category, give the Host values of that category.
+
+    Args:
+        store (warehouse): The local warehouse.
+        df (pd.DataFrame): The fresh `search()` result.
+        searchPattern (str, optional): The search pattern, matched against isolate id and isolate name. Defaults to None.
+        type (list[str], optional): A list of virus types. Defaults to None.
+        HA (list[str], optional): A list of hemagglutinin (HA) subtypes. Defaults to None.
+        NA (list[str], optional): A list of neuraminidase (NA) subtypes. Defaults to None.
+        lineage (list[str], optional): A list of lineages. Defaults to None.
+        host (list[str], optional): A list of values of the Host column, not host categories. Defaults to None.
+        location (str, optional): A location prefix such as "Asia / China". Defaults to None.
+        collectDateFrom (str, optional): The starting collection date. Defaults to None.
+        collectDateTo (str, optional): The ending collection date. Defaults to None.
+        submitDateFrom (str, optional): The starting submission date. Defaults to None.
+        submitDateTo (str, optional): The ending submission date. Defaults to None.
+        requestSegments (list[str], optional): A list of requested segments. Defaults to None.
+        onlyComplete (bool, optional): Whether the scope only has records with all requested segments. Defaults to False.
+
+    Return:
+        dict: Isolate IDs that are "added", "removed" or "changed", and the number of "unchanged" records.
+
+    Example:
+        ```
+        store = gisflu.warehouse("gisflu.db")
+        df = gisflu.search(cred, type=["A"], HA=["3"], recordLimit=1000000)
+        changes = gisflu.diff(store, df, type=["A"], HA=["3"])
+        gisflu.download(cred, changes["added"] + changes["changed"], filename="update.fasta")
+        store.sync(df)
+        ```
+    """
+
+    where, params = filterOf(
+        searchPattern=searchPattern,
+        type=type,
+        HA=HA,
+        NA=NA,
+        lineage=lineage,
+        host=host,
+        location=location,
+        collectDateFrom=collectDateFrom,
+        collectDateTo=collectDateTo,
+        submitDateFrom=submitDateFrom,
+        submitDateTo=submitDateTo,
+        requestSegments=requestSegments,
+        onlyComplete=onlyComplete,
+    )
+
+    sql = "SELECT isolateId, hash FROM isolates"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    with store.lock:
+        stored = dict(store.conn.execute(sql, params).fetchall())
+
+    fresh = {r["Isolate ID"]: recordHash(r) for r in df.to_dict(orient="records")}
+
+    changes = {
+        "added": sorted(set(fresh) - set(stored)),
+        "removed": sorted(set(stored) - set(fresh)),
+        "changed": sorted(
+            id for id in set(fresh) & set(stored) if fresh[id] != stored[id]
+        ),
+    }
+    changes["unchanged"] = len(set(fresh) & set(stored)) - len(changes["changed"])
+
+    logger.debug(
+        f"{len(changes['added'])} added, {len(changes['removed'])} removed, "
+        f"{len(changes['changed'])} changed, {changes['unchanged']} unchanged"
+    )
+
+    return changes
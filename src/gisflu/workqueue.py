@@ -0,0 +1,478 @@
+import os
+import json
+import time
+import socket
+import threading
+from datetime import date, timedelta
+import pandas as pd
+from .login import login
+from .browse import search
+from .download import download
+from .sequences import readFasta
+from .metadata import metadataFrames, fileChunks
+from .compress import openInput, openOutput
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.NullHandler())
+
+actions = ["search", "download"]
+
+
+def splitByDate(
+    params: dict,
+    dateFrom: str,
+    dateTo: str,
+    days: int = 30,
+    field: str = "collectDate",
+) -> list[dict]:
+    """
+    Split the parameters of one query into consecutive, non-overlapping date ranges.
+
+    Args:
+        params (dict): The keyword arguments of `search()`.
+        dateFrom (str): The first date, such as "2024-01-01".
+        dateTo (str): The last date.
+        days (int, optional): The number of days per slice. Defaults to 30.
+        field (str, optional): "collectDate" or "submitDate". Defaults to "collectDate".
+
+    Return:
+        list[dict]: The parameters of each slice.
+    """
+    assert field in [
+        "collectDate",
+        "submitDate",
+    ], "field must be collectDate|submitDate"
+    assert days >= 1, "days must be at least 1"
+
+    start, end = date.fromisoformat(dateFrom), date.fromisoformat(dateTo)
+    assert start <= end, "dateFrom must not be after dateTo"
+
+    slices = []
+    while start <= end:
+        sliceEnd = min(start + timedelta(days=days - 1), end)
+        slices.append(
+            {
+                **params,
+                f"{field}From": start.isoformat(),
+                f"{field}To": sliceEnd.isoformat(),
+            }
+        )
+        start = sliceEnd + timedelta(days=1)
+
+    return slices
+
+
+def splitByIds(
+    params: dict, isolateIds: list[str], chunkSize: int = 1000
+) -> list[dict]:
+    """
+    Split the parameters of one `download()` into chunks of isolate IDs.
+    """
+    assert chunkSize >= 1, "chunkSize must be at least 1"
+
+    return [
+        {**params, "isolateIds": isolateIds[i : i + chunkSize]}
+        for i in range(0, len(isolateIds), chunkSize)
+    ]
+
+
+def tableChunks(output, isSearch, chunkSize=10000):
+    # the rows of a slice output, chunk by chunk, as strings
+    with openInput(output) as f:
+        if isSearch:
+            yield from pd.read_csv(f, dtype=str, chunksize=chunkSize)
+        else:
+            yield from metadataFrames(fileChunks(f), chunkSize)
+
+
+def mergeTables(outputs, filename, isSearch):
+    """
+    Stream search results (CSV) or metadata exports (TSV) into one file, keeping the last row of each isolate ID.
+
+    The outputs are read twice, chunk by chunk: first to find the last row of each
+    isolate, then to write the kept rows, so only the isolate IDs are held in memory.
+    """
+    key = "Isolate ID" if isSearch else "Isolate_Id"
+    sep = "," if isSearch else "\t"
+
+    last = {}
+    for i, output in enumerate(outputs):
+        start = 0
+        for df in tableChunks(output, isSearch):
+            if key in df.columns:
+                for j, isolateId in enumerate(df[key], start):
+                    if not pd.isna(isolateId):
+                        last[isolateId] = (i, j)
+            start += df.shape[0]
+
+    n = 0
+    columns = None
+    with openOutput(filename, "wt") as out:
+        for i, output in enumerate(outputs):
+            start = 0
+            for df in tableChunks(output, isSearch):
+                if columns is None:
+                    columns = list(df.columns)
+                    df.iloc[:0].to_csv(out, index=False, sep=sep)
+                rows = range(start, start + df.shape[0])
+                start += df.shape[0]
+                if key in df.columns:
+                    kept = [
+                        pd.isna(id) or last[id] == (i, j)
+                        for id, j in zip(df[key], rows)
+                    ]
+                    df = df[kept]
+                df = df.reindex(columns=columns)
+                df.to_csv(out, index=False, header=False, sep=sep)
+                n += df.shape[0]
+
+    return n
+
+
+def createFile(path, content):
+    """
+    Create a file with its content, atomically and only if it does not exist yet. Return whether it was created.
+
+    The content is written to a temporary file, then hard-linked to path. `link()`
+    fails if path exists, also on NFS, so two workers never both create it, and a
+    reader never sees a partial file. The link count is checked rather than the
+    result of `link()`, which NFS may report wrongly when a reply is lost.
+    """
+    temp = f"{path}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp, "w") as f:
+        f.write(content)
+    try:
+        try:
+            os.link(temp, path)
+        except OSError:
+            pass
+        return os.stat(temp).st_nlink == 2
+    finally:
+        os.remove(temp)
+
+
+def replaceFile(path, content):
+    # write a whole file, readers see the old or the new content
+    temp = f"{path}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp, "w") as f:
+        f.write(content)
+    os.replace(temp, path)
+
+
+class workQueue:
+    """
+    A queue of query slices in a directory, shared by a coordinator and workers on several machines.
+
+    The coordinator splits a large search or download into slices with `submit()`.
+    Workers, each logged in with their own account, `lease()` one slice at a time
+    and report it with `complete()` or `fail()`. A lease that is not renewed in time
+    expires and the slice is handed out again, so every slice runs at least once;
+    `merge()` drops the duplicated records.
+
+    Every state change creates a file atomically (see `createFile()`): one file per
+    slice, per lease attempt, per failed attempt and per completed slice. Only hard
+    links and renames are relied on, no file locks, so the directory can be on
+    shared storage such as NFS. Lease times are compared between machines, their
+    clocks should be synchronized (NTP). The slice outputs must also be readable by
+    the coordinator, for the merge.
+
+    Args:
+        path (str, optional): The queue directory, created if needed. Defaults to "gisflu-queue".
+        maxAttempts (int, optional): Slices failing this many times are not retried. Defaults to 3.
+
+    Example:
+        ```
+        # coordinator
+        queue = gisflu.workQueue("/shared/h3-queue")
+        queue.submit("search", gisflu.splitByDate(
+            {"HA": ["3"], "recordLimit": 1000000}, "2020-01-01", "2024-12-31", days=90))
+
+        # on every worker machine
+        gisflu.runWorker(gisflu.workQueue("/shared/h3-queue"), gisflu.login(), "/shared/out")
+
+        # coordinator
+        queue.merge("search", "h3.csv.gz")
+        ```
+    """
+
+    def __init__(self, path="gisflu-queue", maxAttempts=3):
+        self.path = path
+        self.maxAttempts = maxAttempts
+        for folder in ["slices", "leases", "failures", "done"]:
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+    def file(self, folder, sliceId, attempt=None):
+        name = f"{sliceId:08d}" if attempt is None else f"{sliceId:08d}-{attempt}"
+        return os.path.join(self.path, folder, f"{name}.json")
+
+    def read(self, folder, sliceId, attempt=None):
+        with open(self.file(folder, sliceId, attempt)) as f:
+            return json.load(f)
+
+    def names(self, folder):
+        return [
+            n[:-5]
+            for n in os.listdir(os.path.join(self.path, folder))
+            if n.endswith(".json")
+        ]
+
+    def states(self) -> dict:
+        """
+        Return the state of every slice: (status, attempt), status being pending, leased, done or failed.
+        """
+        now = time.time()
+        done = {int(n) for n in self.names("done")}
+        failures = set(self.names("failures"))
+        attempts = {}
+        for name in self.names("leases"):
+            sliceId, attempt = map(int, name.split("-"))
+            attempts[sliceId] = max(attempts.get(sliceId, 0), attempt)
+
+        states = {}
+        for sliceId in sorted(int(n) for n in self.names("slices")):
+            attempt = attempts.get(sliceId, 0)
+            if sliceId in done:
+                status = "done"
+            elif attempt == 0:
+                status = "pending"
+            elif f"{sliceId:08d}-{attempt}" in failures:
+                status = "failed" if attempt >= self.maxAttempts else "pending"
+            elif self.read("leases", sliceId, attempt)["leaseUntil"] >= now:
+                status = "leased"
+            else:
+                # an expired lease out of attempts is given up
+                status = "failed" if attempt >= self.maxAttempts else "pending"
+            states[sliceId] = (status, attempt)
+
+        return states
+
+    def submit(self, action: str, slices: list[dict]) -> list[int]:
+        """
+        Add slices of one action ("search" or "download") to the queue, return their ids.
+        """
+        assert action in actions, "action must be search|download"
+
+        ids = []
+        sliceId = max((int(n) for n in self.names("slices")), default=0)
+        for params in slices:
+            content = json.dumps({"action": action, "params": params})
+            sliceId += 1
+            # another coordinator may take the same id
+            while not createFile(self.file("slices", sliceId), content):
+                sliceId += 1
+            ids.append(sliceId)
+
+        logger.debug(f"Submitted {len(ids)} {action} slices to {self.path}")
+
+        return ids
+
+    def lease(self, worker: str, leaseSeconds: float = 600) -> dict | None:
+        """
+        Lease the next pending or expired slice to worker, return None if there is none.
+        """
+        for sliceId, (status, attempt) in self.states().items():
+            if status != "pending":
+                continue
+            lease = {"worker": worker, "leaseUntil": time.time() + leaseSeconds}
+            # only one worker creates the lease of the next attempt
+            if createFile(self.file("leases", sliceId, attempt + 1), json.dumps(lease)):
+                logger.debug(
+                    f"Slice {sliceId} leased to {worker}, attempt {attempt + 1}"
+                )
+                task = self.read("slices", sliceId)
+                return {"id": sliceId, **task}
+
+        return None
+
+    def currentLease(self, sliceId, worker):
+        # the attempt of the latest lease of the slice, if worker holds it and it is running
+        status, attempt = self.states()[sliceId]
+        if status != "leased" and not (status == "pending" and attempt > 0):
+            return None
+        if os.path.exists(self.file("failures", sliceId, attempt)):
+            return None
+        if self.read("leases", sliceId, attempt)["worker"] != worker:
+            return None
+        return attempt
+
+    def renew(self, sliceId: int, worker: str, leaseSeconds: float = 600) -> bool:
+        """
+        Extend the lease of a running slice, return False if the lease was lost.
+        """
+        attempt = self.currentLease(sliceId, worker)
+        if attempt is None:
+            return False
+        lease = {"worker": worker, "leaseUntil": time.time() + leaseSeconds}
+        replaceFile(self.file("leases", sliceId, attempt), json.dumps(lease))
+        return True
+
+    def complete(self, sliceId: int, worker: str, output: str, rows: int) -> bool:
+        """
+        Mark a slice done with its output file, return False if another worker completed it first.
+        """
+        result = {"worker": worker, "output": output, "rows": rows}
+        return createFile(self.file("done", sliceId), json.dumps(result))
+
+    def fail(self, sliceId: int, worker: str, error: str) -> None:
+        attempt = self.currentLease(sliceId, worker)
+        if attempt is not None:
+            failure = {"worker": worker, "error": error}
+            createFile(self.file("failures", sliceId, attempt), json.dumps(failure))
+        return None
+
+    def progress(self) -> dict:
+        """
+        Return the number of slices by status: pending, leased, done and failed.
+        """
+        progress = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, _ in self.states().values():
+            progress[status] += 1
+
+        return progress
+
+    def outputs(self, action: str) -> list[str]:
+        # slices without records may leave empty files
+        outputs = []
+        for sliceId in sorted(int(n) for n in self.names("done")):
+            result = self.read("done", sliceId)
+            if self.read("slices", sliceId)["action"] == action and result["rows"] > 0:
+                outputs.append(result["output"])
+        return outputs
+
+    def merge(self, action: str, filename: str) -> int:
+        """
+        Merge the outputs of the done slices of one action into one file, without duplicated records.
+
+        Search results are deduplicated by isolate ID, fasta records by header and
+        metadata rows by isolate ID. The outputs are streamed, never read as a whole.
+
+        Args:
+            action (str): "search" or "download".
+            filename (str): The merged file, compressed if it ends with ".gz", ".bgz" or ".zst".
+
+        Return:
+            int: The number of merged records.
+        """
+
+        progress = self.progress()
+        if progress["pending"] or progress["leased"]:
+            logger.warning(f"Merging an unfinished queue: {progress}")
+
+        outputs = self.outputs(action)
+        fastaOutputs = [o for o in outputs if ".fasta" in os.path.basename(o)]
+
+        if outputs and len(fastaOutputs) == len(outputs):
+            seen = set()
+            with openOutput(filename, "wt") as out:
+                for output in outputs:
+                    with openInput(output, "rt") as f:
+                        for header, sequence in readFasta(f):
+                            if header not in seen:
+                                seen.add(header)
+                                out.write(f">{header}\n{sequence}\n")
+            n = len(seen)
+        else:
+            n = mergeTables(outputs, filename, action == "search")
+
+        logger.debug(f"Merged {len(outputs)} outputs into {filename}: {n} records")
+
+        return n
+
+    def close(self):
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"workQueue(path={self.path})"
+
+
+def runSlice(cred, task: dict, outdir: str, worker: str) -> tuple[str, int]:
+    params = dict(task["params"])
+    stem = os.path.join(os.path.abspath(outdir), f"slice{task['id']}-{worker}")
+
+    if task["action"] == "search":
+        df = search(cred, **params)
+        filename = f"{stem}.csv"
+        df.to_csv(filename, index=False)
+        return filename, df.shape[0]
+
+    extension = "xls" if params.get("downloadType") == "metadata" else "fasta"
+    filename = f"{stem}.{extension}"
+    download(cred, filename=filename, **params)
+    rows = len(params["isolateIds"])
+
+    return filename, rows
+
+
+def runWorker(
+    queue: workQueue,
+    cred=None,
+    outdir: str = ".",
+    worker: str | None = None,
+    leaseSeconds: float = 600,
+    waitSeconds: float = 10,
+) -> dict:
+    """
+    Lease and run slices of a work queue until none is left.
+
+    The lease of the running slice is renewed in the background. The worker exits
+    when no slice is pending and no other worker holds a lease that may expire.
+
+    Args:
+        queue (workQueue): The shared queue.
+        cred (credentials, optional): The session of this worker. Defaults to None, log in with the environment variables.
+        outdir (str, optional): Directory of the slice outputs, visible to the coordinator. Defaults to ".".
+        worker (str, optional): The worker name. Defaults to "<hostname>-<pid>".
+        leaseSeconds (float, optional): The lease duration. Defaults to 600.
+        waitSeconds (float, optional): Seconds to wait before looking again while other leases are active. Defaults to 10.
+
+    Return:
+        dict: The numbers of completed and failed slices of this worker.
+    """
+
+    cred = cred or login()
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    os.makedirs(outdir, exist_ok=True)
+    summary = {"completed": 0, "failed": 0}
+
+    while True:
+        task = queue.lease(worker, leaseSeconds)
+        if task is None:
+            if queue.progress()["leased"] == 0:
+                break
+            time.sleep(waitSeconds)
+            continue
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(leaseSeconds / 3):
+                if not queue.renew(task["id"], worker, leaseSeconds):
+                    logger.warning(f"Lost the lease of slice {task['id']}")
+                    return None
+
+        renewer = threading.Thread(target=heartbeat, daemon=True)
+        renewer.start()
+        try:
+            output, rows = runSlice(cred, task, outdir, worker)
+        except Exception as e:
+            logger.error(f"Slice {task['id']} failed on {worker}: {e!r}")
+            queue.fail(task["id"], worker, repr(e))
+            summary["failed"] += 1
+        else:
+            queue.complete(task["id"], worker, output, rows)
+            summary["completed"] += 1
+        finally:
+            stop.set()
+            renewer.join()
+
+    logger.debug(f"Worker {worker} finished: {summary}")
+
+    return summary
@@ -0,0 +1,129 @@
+"""
+Offline benchmarks against the mock GISAID frontend.
+
+Usage:
+    python -m tests.benchmark pagination [--records 2000] [--latency 0.05] [--row-latency 0.0002]
+    python -m tests.benchmark roundtrips
+"""
+
+import os
+import time
+import tempfile
+import logging
+import argparse
+import gisflu
+from gisflu.download import downloadQuery
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+
+def benchPagination(args):
+    print(
+        f"{args.records} records, {args.latency * 1000:.0f} ms/request, "
+        f"{args.rowLatency * 1000:.2f} ms/row"
+    )
+    print(f"{'page size':>10} {'requests':>9} {'seconds':>8} {'rows/s':>9}")
+
+    for pageSize in args.pageSizes + [None]:
+        server = mockServer(
+            recordCount=args.records,
+            latency=args.latency,
+            rowLatency=args.rowLatency,
+        )
+        cred = gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+        before = len(server.requests)
+
+        start = time.perf_counter()
+        df = gisflu.search(
+            cred,
+            host=["human", "avian"],
+            recordLimit=args.records,
+            pageSize=pageSize,
+        )
+        elapsed = time.perf_counter() - start
+
+        label = pageSize or f"auto:{cred.pageSize}"
+        requests = len(server.requests) - before
+        print(
+            f"{label:>10} {requests:>9} {elapsed:>8.2f} {df.shape[0] / elapsed:>9.0f}"
+        )
+        if pageSize is None:
+            for size, (rows, seconds) in sorted(cred.pageSizeStats.items()):
+                print(f"{'':>10} probe {size:>5}: {rows / seconds:>9.0f} rows/s")
+
+    return None
+
+
+def benchRoundtrips(args):
+    server = mockServer(recordCount=args.records)
+    cred = None
+
+    def doLogin():
+        nonlocal cred
+        cred = gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+
+    isolateIds = [r["a"] for r in server.records[:10]]
+    operations = [
+        ("login", doLogin),
+        ("search", lambda: gisflu.search(cred, HA=["3"], recordLimit=20)),
+        ("search again", lambda: gisflu.search(cred, HA=["1"], recordLimit=20)),
+        ("count", lambda: gisflu.count(cred, HA=["3"])),
+        ("download", lambda: gisflu.download(cred, isolateIds, filename=args.output)),
+        (
+            "download again",
+            lambda: gisflu.download(cred, isolateIds, filename=args.output),
+        ),
+        (
+            "downloadQuery",
+            lambda: downloadQuery(cred, HA=["3"], filename=args.output),
+        ),
+        ("search after", lambda: gisflu.search(cred, HA=["3"], recordLimit=20)),
+    ]
+
+    print(f"{'operation':<16} {'requests':>9} {'GET':>5} {'POST':>5}")
+    for name, operation in operations:
+        before = len(server.requests)
+        operation()
+        requests = server.requests[before:]
+        gets = sum(r.method == "GET" for r in requests)
+        print(f"{name:<16} {len(requests):>9} {gets:>5} {len(requests) - gets:>5}")
+
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pagination = subparsers.add_parser("pagination", help="rows/s per page size")
+    pagination.add_argument("--records", type=int, default=2000)
+    pagination.add_argument("--latency", type=float, default=0.05)
+    pagination.add_argument(
+        "--row-latency", dest="rowLatency", type=float, default=0.0002
+    )
+    pagination.add_argument(
+        "--page-sizes",
+        dest="pageSizes",
+        type=int,
+        nargs="+",
+        default=[27, 54, 108, 216, 432, 864],
+    )
+
+    roundtrips = subparsers.add_parser(
+        "roundtrips", help="requests per operation, with 20 records per page"
+    )
+    roundtrips.add_argument("--records", type=int, default=60)
+    roundtrips.add_argument(
+        "--output", default=os.path.join(tempfile.gettempdir(), "gisflu-bench.fasta")
+    )
+
+    args = parser.parse_args(argv)
+    logging.getLogger("gisflu").setLevel(logging.WARNING)
+
+    if args.command == "pagination":
+        benchPagination(args)
+    elif args.command == "roundtrips":
+        benchRoundtrips(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import pytest
+import gisflu
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+
+@pytest.fixture
+def server():
+    return mockServer(recordCount=60)
+
+
+@pytest.fixture
+def cred(server):
+    return gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+
+
+@pytest.fixture
+def pool(server):
+    pool = gisflu.sessionPool(
+        size=2, username=USERNAME, password=PASSWORD, clientFactory=server.client
+    )
+    yield pool
+    pool.close()
@@ -0,0 +1,456 @@
+"""
+A minimal in-process imitation of the GISAID epi3 frontend.
+
+It answers the same GET/POST sequence as the real service with just enough
+HTML/JSON for the regexes in `gisflu` to match, so that the client can be
+exercised offline through `httpx.MockTransport`.
+
+Like the web page, a session is on one page at a time: a command that moves to
+another page (`sys.goPage`) only lands there after the GET of that page, and
+commands of any other page than the current one or an open overlay are
+rejected with HTTP 409.
+"""
+
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+import httpx
+
+USERNAME = "mockuser"
+PASSWORD = "mockpassword"
+
+BROWSE_ITEMS = {
+    "search_pattern": "ce_sp",
+    "isl_type": "ce_type",
+    "isl_subtype_h": "ce_ha",
+    "isl_subtype_n": "ce_na",
+    "isl_lineage": "ce_lin",
+    "isl_host": "ce_host",
+    "isl_location": "ce_loc",
+    "isl_collect_date_from": "ce_cdf",
+    "isl_collect_date_to": "ce_cdt",
+    "isl_submission_date_from": "ce_sdf",
+    "isl_submission_date_to": "ce_sdt",
+    "isl_req_segments": "ce_seg",
+    "isl_only_complete": "ce_oc",
+}
+
+RESULT_HEADER = {
+    "__toggle__": "__toggle__",
+    "edit": "edit",
+    "a": "Isolate ID",
+    "d": "Name",
+    "e": "Subtype",
+    "g": "Lineage",
+    "i": "Location",
+    "j": "Host",
+    "k": "Collection Date",
+    "l": "Submission Date",
+    "s1": "PB2",
+    "s2": "PB1",
+    "s3": "PA",
+    "s4": "HA",
+    "s5": "NP",
+    "s6": "NA",
+    "s7": "MP",
+    "s8": "NS",
+    "s9": "HE",
+    "s10": "P3",
+}
+
+SEGMENTS = ["PB2", "PB1", "PA", "HA", "NP", "NA", "MP", "NS"]
+HOSTS = {"101": "Human", "102": "Animal", "103": "Avian", "790": "Mammals"}
+
+
+def makeRecord(i):
+    subtype = ["H3N2", "H1N1", "H5N1"][i % 3]
+    lineage = ["", "pdm09", ""][i % 3]
+    location = ["Asia / China", "Europe / France", "North America / United States"][
+        i % 3
+    ]
+    host = ["Human", "Human", "Avian"][i % 3]
+    rowId = str(19000000 + i)
+    record = {
+        "b": rowId,
+        "__toggle__": "",
+        "edit": "",
+        "a": f"EPI_ISL_{rowId}",
+        "d": f'<b class="x">A/Mock/{i}/2024</b>',
+        "e": f"A / {subtype}",
+        "g": lineage,
+        "i": location,
+        "j": host,
+        "k": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "l": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "s9": "",
+        "s10": "",
+        "z_unused": "x" * 20,
+    }
+    for n, seg in enumerate(SEGMENTS, start=1):
+        record[f"s{n}"] = f'<a href="#">EPI{3000000 + i * 8 + n}</a>'
+
+    return record
+
+
+def sequenceOf(isolateId, segment, downloadType):
+    # a handful of distinct sequences, so that duplicates are common
+    digest = hashlib.md5(f"{segment}{int(isolateId[8:]) % 4}".encode()).hexdigest()
+    alphabet = "ACGT" if downloadType == "dna" else "ACDEFGHIKLMNPQRSTVWY"
+    seq = "".join(alphabet[int(c, 16) % len(alphabet)] for c in digest * 4)
+    return seq
+
+
+class mockServer:
+    """
+    Stateful fake of the GISAID frontend.
+
+    Args:
+        recordCount: number of records the unfiltered database holds.
+        latency: seconds added to every request.
+        rowLatency: seconds added per row returned by `GetData`.
+        maxRowsPerPage: `GetData` requests above this size fail with HTTP 500.
+        pageCap: `GetData` silently returns at most this many rows.
+        metadataWait: metadata exports open the wait page, and their link is sent
+            after this many `PingerPing`.
+    """
+
+    def __init__(
+        self,
+        recordCount=100,
+        latency=0.0,
+        rowLatency=0.0,
+        maxRowsPerPage=None,
+        pageCap=None,
+        metadataWait=None,
+    ):
+        self.records = [makeRecord(i) for i in range(recordCount)]
+        self.latency = latency
+        self.rowLatency = rowLatency
+        self.maxRowsPerPage = maxRowsPerPage
+        self.pageCap = pageCap
+        self.metadataWait = metadataWait
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.downloads = {}
+        self.requests = []
+        self.cookies = []
+        self.sessionCount = 0
+
+    # ---------------- helpers ----------------
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def client(self):
+        return httpx.Client(transport=self.transport())
+
+    def filtered(self, state):
+        records = self.records
+        filters = state["filters"]
+        if "ce_ha" in filters:
+            records = [
+                r for r in records if any(f"H{h}N" in r["e"] for h in filters["ce_ha"])
+            ]
+        if "ce_na" in filters:
+            records = [
+                r
+                for r in records
+                if any(r["e"].endswith(f"N{n}") for n in filters["ce_na"])
+            ]
+        if "ce_host" in filters:
+            hosts = [HOSTS[h] for h in filters["ce_host"]]
+            records = [r for r in records if r["j"] in hosts]
+        if "ce_loc" in filters:
+            records = [r for r in records if r["i"].startswith(filters["ce_loc"])]
+        if "ce_lin" in filters:
+            records = [r for r in records if r["g"] in filters["ce_lin"]]
+        if "ce_cdf" in filters:
+            records = [r for r in records if r["k"] >= filters["ce_cdf"]]
+        if "ce_cdt" in filters:
+            records = [r for r in records if r["k"] <= filters["ce_cdt"]]
+        if "ce_sdf" in filters:
+            records = [r for r in records if r["l"] >= filters["ce_sdf"]]
+        if "ce_sdt" in filters:
+            records = [r for r in records if r["l"] <= filters["ce_sdt"]]
+        if "ce_sp" in filters:
+            records = [r for r in records if filters["ce_sp"] in r["a"]]
+        return records
+
+    def totalText(self, state):
+        records = self.filtered(state)
+        seqs = len(records) * 8
+        return f"Total: {len(records):,} viruses ({seqs:,} sequences)"
+
+    def newPid(self, state, prefix):
+        state["counter"] += 1
+        return f"pid_{prefix}_{state['counter']}"
+
+    # ---------------- handler ----------------
+
+    def handle(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests.append(request)
+        url = request.url
+        params = dict(url.params)
+
+        if url.path.startswith("/dl/"):
+            return self.handleFile(url.path)
+
+        if request.method == "GET":
+            return self.handleGet(request, params)
+
+        form = dict(urllib.parse.parse_qsl(request.content.decode()))
+        return self.handlePost(form)
+
+    def handleFile(self, path):
+        token = path.split("/")[-1].split(".")[0]
+        content = self.downloads[token]
+        return httpx.Response(200, content=content)
+
+    def handleGet(self, request, params):
+        sid = params.get("sid")
+        if sid is None:
+            with self.lock:
+                self.sessionCount += 1
+                sid = f"SID{self.sessionCount}"
+            self.sessions[sid] = {
+                "logged": False,
+                "counter": 0,
+                "filters": {},
+                "selected": set(),
+                "selectAll": False,
+                "downloadType": "metadata",
+                "segments": [],
+                "at": None,
+                "overlays": set(),
+            }
+            return httpx.Response(
+                200,
+                text=f"<input name=\"sid\" value='{sid}'>",
+                headers={
+                    "set-cookie": f"session={sid}; Path=/; Domain=platform.epicov.org"
+                },
+            )
+
+        state = self.sessions[sid]
+        pid = params.get("pid")
+        self.cookies.append(request.headers.get("cookie"))
+
+        # the GET of a page lands on it, overlays open on top of the current page
+        if pid is None:
+            state["at"] = "pid_first" if state["logged"] else "pid_login"
+        elif pid.startswith(("pid_download", "pid_wait")):
+            state["overlays"].add(pid)
+        else:
+            state["at"] = pid
+
+        if pid is None and not state["logged"]:
+            html = (
+                'sys["WID"] = "wid_main";\n'
+                'sys["PID"] = "pid_login";\n'
+                "<a onclick=\"sys.getC('c_login').call('doLogin',{})\">"
+            )
+            return httpx.Response(200, text=html)
+
+        if pid is None:
+            html = (
+                'sys["PID"] = "pid_first";\n' "<a onclick=\"sys.call('c_db','Go',{})\">"
+            )
+            return httpx.Response(200, text=html)
+
+        if pid.startswith("pid_home"):
+            html = (
+                '<div class="sys-actionbar-action-ni" '
+                "onclick=\"sys.getC('c_home').call('Browse')\">"
+            )
+            return httpx.Response(200, text=html)
+
+        if pid.startswith("pid_browse"):
+            html = (
+                "sys.createComponent('c_form','IsolateBrowseFormComponent',{});\n"
+                "sys.createComponent('c_search','IsolateSearchButtonsComponent',{});\n"
+            )
+            html += "\n".join(
+                f"createFI('{ceid}','EntryWidget','{ident}',function(){{}})"
+                for ident, ceid in BROWSE_ITEMS.items()
+            )
+            return httpx.Response(200, text=html)
+
+        if pid.startswith("pid_result"):
+            html = (
+                "sys.createComponent('c_result','IsolateResultListComponent',{});\n"
+                "sys.createComponent('c_dl','IsolateDownloadButtonComponent',{});\n"
+            )
+            html += "\n".join(
+                f"new Object({{'label':'{label}','key':'{key}','width':10,'cid'"
+                for key, label in RESULT_HEADER.items()
+            )
+            return httpx.Response(200, text=html)
+
+        if pid.startswith("pid_download"):
+            html = (
+                "sys.createComponent('c_rdl','IsolateResultDownloadComponent',{});\n"
+                "createFI('ce_fmt','RadioWidget','format',function(){})\n"
+                "createFI('ce_dlc','ButtonWidget','download',function(){})\n"
+            )
+            return httpx.Response(200, text=html)
+
+        if pid.startswith("pid_wait"):
+            html = (
+                "sys.createComponent('c_wait','XLSDownloadWaitFormComponent',{});\n"
+                "createFI('ce_ping','PingerWidget','ping',function(){})\n"
+            )
+            return httpx.Response(200, text=html)
+
+        return httpx.Response(404, text="unknown page")
+
+    def handlePost(self, form):
+        sid = form["sid"]
+        state = self.sessions[sid]
+        queue = json.loads(form["data"])["queue"]
+        out = []
+        records = None
+
+        for command in queue:
+            cmd = command["cmd"]
+            params = command.get("params", {})
+
+            if (
+                command["pid"] != state["at"]
+                and command["pid"] not in state["overlays"]
+            ):
+                return httpx.Response(409, text=f"{cmd} is not on the current page")
+
+            if cmd == "doLogin":
+                passwordMd5 = hashlib.md5(PASSWORD.encode()).hexdigest()
+                if params["login"] != USERNAME or params["hash"] != passwordMd5:
+                    return httpx.Response(200, text="Username or password wrong")
+                state["logged"] = True
+            elif cmd == "Go":
+                state["at"] = None
+                out.append(f"sys.goPage('{self.newPid(state, 'home')}')")
+            elif cmd == "Browse":
+                state["at"] = None
+                state["browsePid"] = self.newPid(state, "browse")
+                out.append(f"sys.goPage('{state['browsePid']}')")
+            elif cmd == "GoBack":
+                # back to the browse page, after its GET
+                state["at"] = None
+            elif cmd == "ChangeValue" and "ceid" in params:
+                ceid = params["ceid"]
+                if ceid in BROWSE_ITEMS.values():
+                    state["filters"][ceid] = params["cvalue"]
+                elif ceid == "ce_fmt":
+                    state["downloadType"] = params["cvalue"]
+                elif ceid in ["ce_prot", "ce_dna"]:
+                    state["segments"] = params["cvalue"]
+            elif cmd in ["OnlyCount", "TypeChanged", "LineageChanged", "ReqSegChanged"]:
+                out.append(self.totalText(state))
+            elif cmd == "search":
+                state["at"] = None
+                state["resultPid"] = self.newPid(state, "result")
+                state["selected"] = set()
+                state["selectAll"] = False
+                out.append(self.totalText(state))
+                out.append(f"sys.goPage('{state['resultPid']}')")
+            elif cmd == "SetPaginating":
+                state["page"] = (params["start_index"], params["rows_per_page"])
+            elif cmd == "GetData":
+                start, rows = state.get("page", (0, 27))
+                if self.maxRowsPerPage is not None and rows > self.maxRowsPerPage:
+                    return httpx.Response(500, text="too many rows")
+                if self.pageCap is not None:
+                    rows = min(rows, self.pageCap)
+                if self.rowLatency:
+                    time.sleep(self.rowLatency * rows)
+                records = self.filtered(state)[start : start + rows]
+            elif cmd == "ChangeValue" and "row_id" in params:
+                state["selected"].add(params["row_id"])
+            elif cmd == "SelectAll":
+                state["selectAll"] = True
+            elif cmd == "Download":
+                state["downloadType"] = "metadata"
+                wid = f"wid_dl_{state['counter']}"
+                out.append(
+                    f"sys.openOverlay('{wid}','{self.newPid(state, 'download')}',new Object({{}}))"
+                )
+            elif cmd == "ShowProteins":
+                if state["downloadType"] == "proteins":
+                    out.append(
+                        "createFI('ce_prot','CheckboxWidget','proteins',function(){})"
+                    )
+                else:
+                    out.append("createFI('ce_dna','CheckboxWidget','dna',function(){})")
+                    out.append("createFI('ce_hdr','EntryWidget','header',function(){})")
+            elif cmd == "download":
+                if state["downloadType"] == "metadata" and self.metadataWait:
+                    state["pings"] = 0
+                    state["pending"] = self.prepareDownload(state)
+                    out.append(
+                        f"sys.openOverlay('wid_wait_{state['counter']}',"
+                        f"'{self.newPid(state, 'wait')}',new Object({{}}))"
+                    )
+                else:
+                    out.append(self.prepareDownload(state))
+            elif cmd == "PingerPing":
+                state["pings"] += 1
+                if state["pings"] >= self.metadataWait:
+                    out.append(state["pending"])
+            elif cmd == "Cancel":
+                state["overlays"].discard(command["pid"])
+            elif cmd == "Reset":
+                state["filters"] = {}
+                out.append(self.totalText(state))
+
+        if records is not None:
+            return httpx.Response(200, json={"records": records})
+
+        return httpx.Response(200, text="\n".join(out))
+
+    def selectedRecords(self, state):
+        if state["selectAll"]:
+            return self.filtered(state)
+        return [r for r in self.records if r["b"] in state["selected"]]
+
+    def prepareDownload(self, state):
+        records = self.selectedRecords(state)
+        if state["downloadType"] in ["proteins", "dna"]:
+            downloadType = "dna" if state["downloadType"] == "dna" else "protein"
+            lines = []
+            for r in records:
+                for segment in state["segments"]:
+                    acc = (
+                        "EPI"
+                        + hashlib.md5(f"{r['a']}{segment}".encode()).hexdigest()[:7]
+                    )
+                    header = (
+                        f">{acc}|{segment}|{r['d'][13:-4]}|{r['a']}|A_/_H3N2|{r['k']}"
+                    )
+                    lines.append(header)
+                    lines.append(sequenceOf(r["a"], segment, downloadType))
+            content = ("\n".join(lines) + "\n").encode()
+            extension = "fasta"
+        else:
+            columns = [
+                "Isolate_Id",
+                "Isolate_Name",
+                "Subtype",
+                "Location",
+                "Host",
+                "Collection_Date",
+            ]
+            rows = ["\t".join(columns)]
+            for r in records:
+                rows.append(
+                    "\t".join([r["a"], r["d"][13:-4], r["e"], r["i"], r["j"], r["k"]])
+                )
+            content = ("\n".join(rows) + "\n").encode()
+            extension = "xls"
+
+        token = hashlib.md5(content).hexdigest()[:12]
+        self.downloads[token] = content
+        return f'sys.downloadFile(\\"/dl/{token}.{extension}\\")'
@@ -0,0 +1,155 @@
+"""
+Performance regression checks on recorded sessions, without network.
+
+A cassette records every HTTP exchange of a fixed scenario. Replaying it measures
+requests, bytes and CPU time of each operation, which are compared with the
+baseline stored next to the cassette.
+
+Usage:
+    python -m tests.regression record [--live]
+    python -m tests.regression check
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import argparse
+import gisflu
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+cassetteDir = os.path.join(os.path.dirname(__file__), "cassettes")
+cassettePath = os.path.join(cassetteDir, "session.json")
+baselinePath = os.path.join(cassetteDir, "session.baseline.json")
+
+# allowed growth over the baseline
+tolerance = {"requests": 0, "bytesSent": 0.05, "bytesReceived": 0.05}
+cpuTolerance = 2.0
+cpuSlack = 0.1
+
+
+def scenario(httpClient, username, password, output):
+    state = {}
+
+    def doLogin():
+        state["cred"] = gisflu.login(username, password, httpClient=httpClient)
+
+    def doSearch():
+        state["df"] = gisflu.search(state["cred"], HA=["3"], recordLimit=50)
+
+    def doDownload(downloadType):
+        isolateIds = list(state["df"]["Isolate ID"][:10])
+        gisflu.download(
+            state["cred"], isolateIds, downloadType=downloadType, filename=output
+        )
+
+    return [
+        ("login", doLogin),
+        ("search", doSearch),
+        ("count", lambda: gisflu.count(state["cred"], HA=["3"])),
+        ("download protein", lambda: doDownload("protein")),
+        ("download metadata", lambda: doDownload("metadata")),
+    ]
+
+
+def measure(tape, username=USERNAME, password=PASSWORD):
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, "output")
+        for name, operation in scenario(tape.client(), username, password, output):
+            before = (tape.requests, tape.bytesSent, tape.bytesReceived)
+            cpuStart = time.process_time()
+            operation()
+            metrics[name] = {
+                "requests": tape.requests - before[0],
+                "bytesSent": tape.bytesSent - before[1],
+                "bytesReceived": tape.bytesReceived - before[2],
+                "cpuSeconds": time.process_time() - cpuStart,
+            }
+
+    return metrics
+
+
+def compare(metrics, baseline):
+    """
+    Return the regressions of metrics over the baseline, as messages.
+    """
+    failures = []
+    for name, base in baseline.items():
+        current = metrics[name]
+        for key, allowed in tolerance.items():
+            if current[key] > base[key] * (1 + allowed):
+                failures.append(f"{name}: {key} {base[key]} -> {current[key]}")
+        if current["cpuSeconds"] > base["cpuSeconds"] * cpuTolerance + cpuSlack:
+            failures.append(
+                f"{name}: cpuSeconds {base['cpuSeconds']:.3f} -> "
+                f"{current['cpuSeconds']:.3f}"
+            )
+
+    return failures
+
+
+def record(live=False):
+    os.makedirs(cassetteDir, exist_ok=True)
+    if live:
+        transport, username, password = None, None, None
+    else:
+        server = mockServer(recordCount=60)
+        transport, username, password = server.transport(), USERNAME, PASSWORD
+
+    with gisflu.cassette(cassettePath, mode="record", transport=transport) as tape:
+        measure(tape, username, password)
+
+    # the baseline is measured on replay, like the checks
+    baseline = measure(gisflu.cassette(cassettePath, timeScale=0))
+    with open(baselinePath, "w") as f:
+        json.dump(baseline, f, indent=1)
+
+    return baseline
+
+
+def check():
+    with open(baselinePath) as f:
+        baseline = json.load(f)
+    metrics = measure(gisflu.cassette(cassettePath, timeScale=0))
+
+    return metrics, compare(metrics, baseline)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m tests.regression")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    recordParser = subparsers.add_parser("record", help="record cassette and baseline")
+    recordParser.add_argument(
+        "--live",
+        action="store_true",
+        help="record from GISAID with GISAID_USERNAME/GISAID_PASSWORD",
+    )
+    subparsers.add_parser("check", help="replay cassette against the baseline")
+
+    args = parser.parse_args(argv)
+    logging.getLogger("gisflu").setLevel(logging.WARNING)
+
+    if args.command == "record":
+        metrics, failures = record(args.live), []
+    else:
+        metrics, failures = check()
+
+    print(
+        f"{'operation':<18} {'requests':>9} {'sent':>9} {'received':>10} {'cpu s':>7}"
+    )
+    for name, m in metrics.items():
+        print(
+            f"{name:<18} {m['requests']:>9} {m['bytesSent']:>9} "
+            f"{m['bytesReceived']:>10} {m['cpuSeconds']:>7.3f}"
+        )
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
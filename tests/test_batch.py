@@ -0,0 +1,55 @@
+import os
+import json
+import pytest
+import gisflu
+from gisflu.cli import main
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+
+def test_loadJobs(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text(
+        json.dumps(
+            {"jobs": [{"search": {"HA": ["3"]}}, {"download": {"isolateIds": []}}]}
+        )
+    )
+    config = gisflu.loadJobs(str(path))
+    assert [job["name"] for job in config["jobs"]] == ["job1", "job2"]
+
+    path.write_text(json.dumps({"jobs": [{"search": {}, "download": {}}]}))
+    with pytest.raises(AssertionError):
+        gisflu.loadJobs(str(path))
+
+
+def test_runBatch(pool, tmp_path):
+    jobs = [
+        {"name": "h3", "search": {"HA": ["3"], "recordLimit": 100}},
+        {"name": "h1", "search": {"HA": ["1"], "recordLimit": 5}},
+        {"name": "seqs", "download": {"isolateIds": ["EPI_ISL_19000000"]}},
+        {"name": "bad", "download": {"isolateIds": ["19000000"]}},
+    ]
+    summary = gisflu.runBatch(pool, jobs, str(tmp_path))
+
+    assert summary["succeeded"] == 3
+    assert summary["failed"] == 1
+    results = {r["name"]: r for r in summary["jobs"]}
+    assert results["h3"]["rows"] == 20
+    assert results["h1"]["rows"] == 5
+    assert os.path.exists(tmp_path / "seqs.fasta")
+    assert results["bad"]["status"] == "failed"
+
+
+def test_cli(tmp_path, monkeypatch):
+    server = mockServer(recordCount=30)
+    monkeypatch.setattr("gisflu.pool.newClient", server.client)
+    monkeypatch.setenv("GISAID_USERNAME", USERNAME)
+    monkeypatch.setenv("GISAID_PASSWORD", PASSWORD)
+
+    path = tmp_path / "jobs.json"
+    path.write_text(
+        json.dumps({"jobs": [{"name": "all", "search": {"host": ["human"]}}]})
+    )
+    code = main(["batch", str(path), "-o", str(tmp_path / "out"), "-j", "3"])
+
+    assert code == 0
+    assert os.path.exists(tmp_path / "out" / "all.csv")
@@ -0,0 +1,223 @@
+import pytest
+import gisflu
+from gisflu.credentials import credentials
+from gisflu.paging import pageSizeTuner
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+
+def login(server):
+    return gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+
+
+def test_search(cred):
+    df = gisflu.search(cred, HA=["3"], recordLimit=100)
+    assert df.shape == (20, 16)
+    assert df["Name"][0] == "A/Mock/0/2024"
+    assert df["HA"][0] == "EPI3000004"
+    assert "HE" not in df.columns
+
+
+def test_parseCount():
+    # one total per filter, and one for the Reset
+    text = "\n".join(
+        [
+            "Total: 60 viruses (480 sequences)",
+            "Total: 20 viruses (160 sequences)",
+            "Total: 1,234 viruses (9,872 sequences)",
+        ]
+    )
+    assert gisflu.utils.parseCount(text) == (1234, 9872)
+
+
+def test_search_filters(cred):
+    # the count follows all filters, not the first one
+    df = gisflu.search(cred, HA=["1"], host=["human"], location="Europe")
+    assert df.shape[0] == 20
+    assert set(df["Subtype"]) == {"A / H1N1"}
+
+    # the filters of a count do not stay for the next search
+    assert gisflu.count(cred, HA=["5"])["records"] == 20
+    df = gisflu.search(cred, host=["human"], recordLimit=100)
+    assert df.shape[0] == 40
+
+
+def test_search_location_lineage(cred):
+    df = gisflu.search(cred, location="Europe", lineage=["pdm09"], recordLimit=100)
+    assert df.shape[0] == 20
+    assert set(df["Location"]) == {"Europe / France"}
+    assert set(df["Lineage"]) == {"pdm09"}
+
+
+def test_count(cred, server):
+    before = len(server.requests)
+    assert gisflu.count(cred, HA=["5"], location="North America") == {
+        "records": 20,
+        "sequences": 160,
+    }
+    # back from the result page left by login: GoBack, GET browse page, the
+    # Reset goes with the filters
+    assert len(server.requests) - before == 3
+
+    # from the browse page, the page is reset, filtered and counted in one request
+    before = len(server.requests)
+    assert gisflu.count(cred, HA=["5"])["records"] == 20
+    assert len(server.requests) - before == 1
+
+    # the filters of the previous count are reset
+    assert gisflu.count(cred, host=["human", "avian"])["records"] == 60
+    assert gisflu.count(cred)["records"] == 60
+
+    # the count follows filters set after the subtype
+    expected = [
+        r for r in server.records if r["e"] == "A / H1N1" and r["k"] >= "2024-06-01"
+    ]
+    count = gisflu.count(cred, HA=["1"], collectDateFrom="2024-06-01")
+    assert count["records"] == len(expected)
+
+
+def tune(cred, pageSize=None, total=1000, perRequest=0.01, perRow=0.0):
+    # drive a tuner with synthetic timings
+    tuner = pageSizeTuner(cred, pageSize)
+    start = 0
+    while start < total:
+        count = min(tuner.size, total - start)
+        tuner.record(count, count, perRequest + perRow * count)
+        start += count
+    tuner.finish()
+    return tuner
+
+
+def test_pageSize_grows():
+    cred = credentials()
+    tune(cred, total=500)
+
+    assert not cred.pageSizeTuned
+    assert cred.pageSize == 216
+    assert set(cred.pageSizeStats) == {27, 54, 108, 216, 95}
+
+
+def test_pageSize_settles():
+    cred = credentials()
+    tune(cred, total=400, perRow=0.001)
+
+    assert cred.pageSizeTuned
+    assert cred.pageSize == 54
+
+    # the settled size is reused without probing
+    cred.pageSizeStats = {}
+    tune(cred, total=100, perRow=0.001)
+    assert list(cred.pageSizeStats) == [54, 46]
+
+
+def test_pageSize_search(server):
+    server.records = server.records * 20
+    cred = login(server)
+    df = gisflu.search(cred, host=["human"], recordLimit=500)
+
+    assert df.shape[0] == 500
+    humans = [r["a"] for r in server.records if r["j"] == "Human"]
+    assert df["Isolate ID"].tolist() == humans[:500]
+    assert sum(rows for rows, _ in cred.pageSizeStats.values()) == 500
+
+
+def test_pageSize_fixed(cred):
+    gisflu.search(cred, host=["human"], recordLimit=40, pageSize=10)
+    assert list(cred.pageSizeStats) == [10]
+    assert not cred.pageSizeTuned
+
+
+def test_pageSize_error():
+    server = mockServer(recordCount=600, maxRowsPerPage=100)
+    cred = login(server)
+    df = gisflu.search(cred, host=["human"], recordLimit=400)
+
+    assert df.shape[0] == 400
+    assert cred.pageSize <= 100
+
+
+def test_pageSize_cap():
+    server = mockServer(recordCount=200, pageCap=40)
+    cred = login(server)
+    df = gisflu.search(cred, host=["human", "avian"], recordLimit=200)
+
+    assert df.shape[0] == 200
+    assert df["Isolate ID"].is_unique
+    assert cred.pageSize == 40
+
+
+def test_projectRecords(cred):
+    from gisflu.browse import resultColumnsOf, projectRecords
+    from .mockserver import makeRecord
+
+    resultColumns, htmlKeys = resultColumnsOf(cred)
+    projectRecords([makeRecord(0), makeRecord(1)], resultColumns, htmlKeys)
+
+    assert "z_unused" not in resultColumns
+    assert "__toggle__" not in resultColumns
+    assert resultColumns["d"] == ["A/Mock/0/2024", "A/Mock/1/2024"]
+    assert resultColumns["s1"] == ["EPI3000001", "EPI3000009"]
+
+
+def test_search_roundtrips(cred, server):
+    before = len(server.requests)
+    gisflu.search(cred, HA=["3"], recordLimit=20)
+    # back to the browse page, reset, filter and search, result page, records
+    assert [r.method for r in server.requests[before:]] == [
+        "POST",
+        "GET",
+        "POST",
+        "GET",
+        "POST",
+    ]
+    assert cred.currentPage == "result"
+
+    # from the browse page, the search starts with the filters
+    gisflu.count(cred, HA=["1"])
+    before = len(server.requests)
+    df = gisflu.search(cred, HA=["1"], recordLimit=100)
+    assert len(server.requests) - before == 3
+    assert set(df["Subtype"]) == {"A / H1N1"}
+
+
+def test_search_parseWorkers(cred):
+    df = gisflu.search(cred, host=["human", "avian"], recordLimit=60, pageSize=7)
+    parallel = gisflu.search(
+        cred, host=["human", "avian"], recordLimit=60, pageSize=7, parseWorkers=2
+    )
+    assert df.shape[0] == 60
+    assert df.equals(parallel)
+
+
+def test_search_fetchError(cred, server, monkeypatch):
+    monkeypatch.setattr(server, "maxRowsPerPage", 0)
+    with pytest.raises(AssertionError, match="Failed to fetch"):
+        gisflu.search(cred, HA=["3"], recordLimit=20, pageSize=5)
+
+
+def test_search_fewerRecords(cred, server, monkeypatch):
+    # the count is ahead of the result list, an empty page ends the results
+    monkeypatch.setattr(
+        server, "totalText", lambda state: "Total: 70 viruses (0 sequences)"
+    )
+    df = gisflu.search(cred, recordLimit=100, pageSize=25)
+    assert df.shape[0] == 60
+
+
+def test_pageState(cred, server):
+    # login leaves the session on the result page, browse page commands are rejected
+    body = gisflu.utils.buildRequestBody(
+        cred.sessionId,
+        cred.windowId,
+        cred.browsePage["pid"],
+        [gisflu.utils.buildCommand(cred.browsePage["searchButtonCompId"], "Reset")],
+    )
+    res = gisflu.utils.httpPost(
+        cred.url, data=body, headers=cred.headers, httpClient=cred.client
+    )
+    assert res.status_code == 409
+
+    gisflu.utils.resultToBrowsePage(cred)
+    res = gisflu.utils.httpPost(
+        cred.url, data=body, headers=cred.headers, httpClient=cred.client
+    )
+    assert res.status_code == 200
@@ -0,0 +1,46 @@
+import gisflu
+from .mockserver import mockServer, USERNAME, PASSWORD
+from . import regression, mockserver
+
+
+def test_cassette(tmp_path):
+    path = str(tmp_path / "session.json")
+    server = mockServer(recordCount=30)
+    with gisflu.cassette(path, mode="record", transport=server.transport()) as tape:
+        cred = gisflu.login(USERNAME, PASSWORD, httpClient=tape.client())
+        df = gisflu.search(cred, HA=["3"], recordLimit=10)
+
+    with open(path) as f:
+        content = f.read()
+    assert USERNAME not in content
+    assert cred.sessionId not in content
+
+    tape = gisflu.cassette(path, timeScale=0)
+    cred = gisflu.login("user", "password", httpClient=tape.client())
+    assert df.equals(gisflu.search(cred, HA=["3"], recordLimit=10))
+    assert tape.requests == len(server.requests)
+
+
+def test_shortSecret(tmp_path, monkeypatch):
+    # a short username is redacted too, without touching the words containing it
+    monkeypatch.setattr(mockserver, "USERNAME", "ab")
+    path = str(tmp_path / "session.json")
+    server = mockserver.mockServer(recordCount=30)
+    with gisflu.cassette(path, mode="record", transport=server.transport()) as tape:
+        cred = gisflu.login("ab", PASSWORD, httpClient=tape.client())
+        count = gisflu.count(cred, HA=["3"])
+
+    with open(path) as f:
+        content = f.read()
+    assert '"ab"' not in content and "%22ab%22" not in content
+
+    tape = gisflu.cassette(path, timeScale=0)
+    cred = gisflu.login("user", "password", httpClient=tape.client())
+    assert gisflu.count(cred, HA=["3"]) == count
+
+
+def test_regression():
+    metrics, failures = regression.check()
+    assert failures == []
+    # return to the browse page (2), reset and search, result page and records
+    assert metrics["search"]["requests"] == 5
@@ -0,0 +1,74 @@
+import gzip
+import importlib.util
+import pytest
+import pandas as pd
+import gisflu
+from gisflu.compress import openOutput, openInput, readBgzf, splitExtension
+
+
+@pytest.mark.parametrize("extension", ["gz", "bgz"])
+def test_download_compressed(cred, server, tmp_path, extension):
+    isolateIds = [r["a"] for r in server.records[:12]]
+    plain = str(tmp_path / "records.fasta")
+    gisflu.download(cred, isolateIds, filename=plain)
+    filename = f"{plain}.{extension}"
+    gisflu.download(cred, isolateIds, filename=filename)
+
+    with open(plain, "rb") as f, gzip.open(filename) as g:
+        assert f.read() == g.read()
+
+
+def test_bgzip(tmp_path):
+    filename = str(tmp_path / "lines.txt.bgz")
+    data = "".join(f"line {i}\n" for i in range(30000)).encode()
+    with openOutput(filename) as f:
+        # a retried download restarts the file
+        f.write(b"partial")
+        f.seek(0)
+        f.truncate()
+        for i in range(0, len(data), 4096):
+            f.write(data[i : i + 4096])
+
+    with openInput(filename) as f:
+        assert f.read() == data
+    for offset in [0, 65279, 65280, 150000, len(data) - 3]:
+        assert readBgzf(filename, offset, 100) == data[offset : offset + 100]
+
+
+def test_zstd(tmp_path):
+    pytest.importorskip("zstandard")
+    filename = str(tmp_path / "lines.txt.zst")
+    data = "".join(f"line {i}\n" for i in range(30000)).encode()
+    with openOutput(filename) as f:
+        f.write(b"partial")
+        f.seek(0)
+        f.truncate()
+        f.write(data)
+
+    with openInput(filename) as f:
+        assert f.read() == data
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("zstandard") is not None,
+    reason="zstandard is installed",
+)
+def test_zstdMissing(tmp_path):
+    filename = tmp_path / "lines.txt.zst"
+    with pytest.raises(ImportError, match="zstandard"):
+        openOutput(str(filename))
+    assert not filename.exists()
+
+
+def test_splitExtension():
+    assert splitExtension("out/records.fasta") == ("out/records", ".fasta")
+    assert splitExtension("out/records.fasta.bgz") == ("out/records", ".fasta.bgz")
+    assert splitExtension("records.zst") == ("records", ".zst")
+    assert splitExtension("run.v1/records") == ("run.v1/records", "")
+
+
+def test_search_output(pool, tmp_path):
+    jobs = [{"name": "h3", "search": {"HA": ["3"]}, "output": "h3.csv.gz"}]
+    summary = gisflu.runBatch(pool, jobs, str(tmp_path))
+    assert summary["succeeded"] == 1
+    assert pd.read_csv(tmp_path / "h3.csv.gz").shape[0] == 20
@@ -0,0 +1,31 @@
+import json
+import pickle
+import gisflu
+
+
+def test_toDict(cred, server):
+    gisflu.search(cred, HA=["3"], recordLimit=20, pageSize=10)
+    state = json.loads(json.dumps(cred.toDict()))
+
+    assert state["sessionId"] == cred.sessionId
+    assert state["currentPage"] == "result"
+    assert state["cookies"][0]["value"] == cred.sessionId
+
+    attached = gisflu.credentials.fromDict(state, httpClient=server.client())
+    assert attached.sessionId == cred.sessionId
+    assert attached.pageSizeStats == cred.pageSizeStats
+    assert attached.client is not cred.client
+
+    # the attached session continues where the original left off, with its cookies
+    before = len(server.requests)
+    df = gisflu.search(attached, HA=["1"], recordLimit=100)
+    assert set(df["Subtype"]) == {"A / H1N1"}
+    assert len(server.requests) - before == 5
+    assert server.cookies[-1] == f"session={cred.sessionId}"
+
+
+def test_pickle(cred):
+    restored = pickle.loads(pickle.dumps(cred))
+    assert restored.browseParamsCeid == cred.browseParamsCeid
+    assert restored.client is not None
+    assert restored.client.cookies.get("session") == cred.sessionId
@@ -0,0 +1,124 @@
+import json
+import time
+import threading
+import importlib
+import urllib.parse
+import pytest
+import gisflu
+from .mockserver import USERNAME, PASSWORD
+
+downloadModule = importlib.import_module("gisflu.download")
+
+
+def sentCommands(server, since=0):
+    commands = []
+    for request in server.requests[since:]:
+        if request.method == "POST":
+            form = dict(urllib.parse.parse_qsl(request.content.decode()))
+            commands += [c["cmd"] for c in json.loads(form["data"])["queue"]]
+    return commands
+
+
+def test_cancelToken():
+    token = gisflu.cancelToken(60)
+    token.check()
+    assert 59 < token.remaining() <= 60
+    assert token.timeout(gisflu.utils.timeout).read <= 60
+
+    token.cancel()
+    assert token.cancelled
+    with pytest.raises(gisflu.cancelledError):
+        token.check()
+
+    token = gisflu.cancelToken(0.05)
+    start = time.monotonic()
+    with pytest.raises(gisflu.cancelledError):
+        token.sleep(10)
+    assert time.monotonic() - start < 1
+
+    assert gisflu.cancelToken().remaining() is None
+
+    # a child token follows the cancellation and the deadline of its parent
+    parent = gisflu.cancelToken(60)
+    child = gisflu.cancelToken(parent=parent)
+    assert 59 < child.remaining() <= 60
+    parent.cancel()
+    assert child.cancelled
+    assert not gisflu.cancelToken(parent=gisflu.cancelToken()).cancelled
+
+
+def test_loginDeadline(server):
+    with pytest.raises(gisflu.cancelledError):
+        gisflu.login(
+            USERNAME,
+            PASSWORD,
+            httpClient=server.client(),
+            token=gisflu.cancelToken(0),
+        )
+    assert len(server.requests) == 0
+
+
+def test_searchDeadline(cred, server):
+    server.rowLatency = 0.01
+    with pytest.raises(gisflu.cancelledError):
+        gisflu.search(cred, recordLimit=60, pageSize=5, token=gisflu.cancelToken(0.2))
+
+    # the session is back on the browse page, and usable
+    assert cred.currentPage == "browse"
+    assert sentCommands(server)[-2:] == ["GoBack", "Reset"]
+    server.rowLatency = 0
+    df = gisflu.search(cred, recordLimit=60)
+    assert df.shape[0] == 60
+
+
+def test_cancelSearch(cred, server):
+    server.rowLatency = 0.01
+    token = gisflu.cancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    with pytest.raises(gisflu.cancelledError, match="Cancelled"):
+        gisflu.search(cred, recordLimit=60, pageSize=5, token=token)
+    assert cred.currentPage == "browse"
+
+
+def test_metadataWait(cred, server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloadModule, "metadataPollSeconds", 0.01)
+    server.metadataWait = 3
+    isolateIds = list(gisflu.search(cred, recordLimit=5)["Isolate ID"])
+
+    output = tmp_path / "metadata.xls"
+    gisflu.download(cred, isolateIds, downloadType="metadata", filename=str(output))
+    assert sentCommands(server).count("PingerPing") == 3
+    assert output.read_text().count("EPI_ISL_") == 5
+
+    # the link never comes, the deadline stops the wait and closes the download page
+    server.metadataWait = 10**6
+    since = len(server.requests)
+    with pytest.raises(gisflu.cancelledError):
+        gisflu.download(
+            cred,
+            isolateIds,
+            downloadType="metadata",
+            filename=str(output),
+            token=gisflu.cancelToken(0.3),
+        )
+    assert sentCommands(server, since)[-3:] == ["Cancel", "GoBack", "Reset"]
+    assert cred.currentPage == "browse"
+
+    # without token, the wait is still bounded
+    monkeypatch.setattr(downloadModule, "metadataWaitSeconds", 0.1)
+    with pytest.raises(gisflu.cancelledError):
+        gisflu.download(cred, isolateIds, downloadType="metadata", filename=str(output))
+    assert cred.currentPage == "browse"
+
+
+def test_parallelDownloadCancelled(pool, tmp_path):
+    token = gisflu.cancelToken()
+    token.cancel()
+    with pytest.raises(gisflu.cancelledError):
+        gisflu.parallelDownload(
+            pool,
+            ["EPI_ISL_1", "EPI_ISL_2"],
+            filename=str(tmp_path / "records.fasta"),
+            token=token,
+        )
+    assert all(cred.currentPage == "result" for cred in pool.sessions)
@@ -0,0 +1,174 @@
+import importlib
+import pytest
+import gisflu
+from .mockserver import USERNAME, PASSWORD
+
+downloadModule = importlib.import_module("gisflu.download")
+
+
+def readFasta(filename):
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    return list(zip(lines[::2], lines[1::2]))
+
+
+def test_download(cred, tmp_path):
+    filename = tmp_path / "records.fasta"
+    gisflu.download(cred, ["EPI_ISL_19000000", "EPI_ISL_19000001"], filename=filename)
+    records = readFasta(filename)
+    assert len(records) == 4
+    assert records[0][0].split("|")[3] == "EPI_ISL_19000000"
+
+
+def test_parallelDownload(cred, pool, tmp_path):
+    isolateIds = [f"EPI_ISL_{19000000 + i}" for i in range(10)]
+    segments = ["HA", "NA", "PB2"]
+
+    expected = tmp_path / "single.fasta"
+    gisflu.download(cred, isolateIds, segments=segments, filename=expected)
+    expected = readFasta(expected)
+
+    combined = gisflu.parallelDownload(
+        pool,
+        isolateIds,
+        segments=segments,
+        chunkSize=3,
+        filename=str(tmp_path / "all.fa"),
+    )
+    assert combined == [str(tmp_path / "all.fa")]
+    assert sorted(readFasta(combined[0])) == sorted(expected)
+
+    perSegment = gisflu.parallelDownload(
+        pool,
+        isolateIds,
+        segments=segments,
+        chunkSize=4,
+        merge="segment",
+        filename=str(tmp_path / "seqs.fa"),
+    )
+    assert perSegment == [str(tmp_path / f"seqs-{s}.fa") for s in segments]
+    for segment, output in zip(segments, perSegment):
+        records = readFasta(output)
+        assert [h.split("|")[3] for h, _ in records] == isolateIds
+        assert all(h.split("|")[1] == segment for h, _ in records)
+    assert list(tmp_path.glob("gisflu-*")) == []
+
+    # the segment goes before the compressed extension
+    compressed = gisflu.parallelDownload(
+        pool,
+        isolateIds,
+        segments=["HA"],
+        merge="segment",
+        filename=str(tmp_path / "seqs.fa.gz"),
+    )
+    assert compressed == [str(tmp_path / "seqs-HA.fa.gz")]
+
+
+def test_parallelDownloadFailure(pool, server, tmp_path, monkeypatch):
+    isolateIds = [f"EPI_ISL_{19000000 + i}" for i in range(10)]
+    download = downloadModule.download
+    calls = []
+
+    def failing(cred, chunk, *args, **kwargs):
+        calls.append(chunk)
+        if chunk == isolateIds[2:4]:
+            raise RuntimeError("part failed")
+        return download(cred, chunk, *args, **kwargs)
+
+    monkeypatch.setattr(downloadModule, "download", failing)
+    server.latency = 0.02
+    with pytest.raises(RuntimeError, match="part failed"):
+        gisflu.parallelDownload(
+            pool,
+            isolateIds,
+            segments=["HA", "NA"],
+            chunkSize=2,
+            merge="segment",
+            filename=str(tmp_path / "seqs.fa"),
+        )
+
+    # the queued parts are skipped, the partial outputs and parts removed
+    assert len(calls) < 10
+    assert list(tmp_path.iterdir()) == []
+
+    # the sessions stopped by the failure can be used again
+    server.latency = 0
+    monkeypatch.setattr(downloadModule, "download", download)
+    output = gisflu.parallelDownload(
+        pool, isolateIds, segments=["HA"], filename=str(tmp_path / "seqs.fa")
+    )
+    assert len(readFasta(output[0])) == 10
+
+
+def test_downloadQuery(cred, server, tmp_path):
+    filename = tmp_path / "query.fasta"
+    count = downloadModule.downloadQuery(
+        cred, HA=["3"], location="Asia", segments=["HA"], filename=str(filename)
+    )
+    assert count == 20
+
+    records = readFasta(filename)
+    isolateIds = gisflu.search(cred, HA=["3"], recordLimit=100)["Isolate ID"]
+    assert [h.split("|")[3] for h, _ in records] == isolateIds.tolist()
+
+    # one short selection command, whatever the number of records
+    selection = [r for r in server.requests if b"Download%22" in r.content][-1]
+    assert b"SelectAll" in selection.content
+    assert b"row_id" not in selection.content
+
+    assert downloadModule.downloadQuery(cred, HA=["7"], filename=str(filename)) == 0
+
+
+def test_lazyDownloadPage(server, tmp_path):
+    cred = gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+    assert cred.downloadParamsCeid == {}
+    assert not any("pid_download" in str(r.url) for r in server.requests)
+
+    filename = tmp_path / "records.fasta"
+    isolateIds = ["EPI_ISL_19000000"]
+    # the fasta header field is only shown for dna, so the first protein
+    # download discovers the fields of both formats
+    for downloadType, more in [("protein", 1), ("protein", 0), ("dna", 0)]:
+        before = len(server.requests)
+        gisflu.download(cred, isolateIds, downloadType, filename=filename)
+        assert len(server.requests) - before == 9 + more
+    assert {"proteinSegment", "dnaSegment", "fastaHeader"} <= set(
+        cred.downloadParamsCeid
+    )
+
+
+def test_downloadRecords(cred, server, tmp_path):
+    isolateIds = [f"EPI_ISL_{19000000 + i}" for i in range(6)]
+    filename = tmp_path / "records.fasta"
+    gisflu.download(cred, isolateIds, downloadType="dna", filename=filename)
+
+    records = list(gisflu.downloadRecords(cred, isolateIds, downloadType="dna"))
+    assert [
+        (">" + "|".join([r["Accession"], r["Segment"]]), r["Sequence"]) for r in records
+    ] == [("|".join(h.split("|")[:2]), s) for h, s in readFasta(filename)]
+    assert records[0]["Isolate ID"] == "EPI_ISL_19000000"
+
+    df = gisflu.downloadRecords(cred, isolateIds, segments=["HA"], asDataFrame=True)
+    joined = df.merge(gisflu.search(cred, HA=["3"], recordLimit=100), on="Isolate ID")
+    assert joined.shape[0] == 2
+
+    metadata = gisflu.downloadRecords(
+        cred, isolateIds, downloadType="metadata", asDataFrame=True
+    )
+    assert metadata["Isolate ID"].tolist() == isolateIds
+    assert "Collection Date" in metadata.columns
+
+
+def test_leaveDownloadPage(cred, server, monkeypatch):
+    # a failed export leaves the download page open
+    monkeypatch.setattr(server, "prepareDownload", lambda state: "")
+    with pytest.raises(Exception):
+        gisflu.download(cred, ["EPI_ISL_19000000"])
+    assert cred.currentPage == "download"
+
+    # the next operation closes it before going back to the browse page
+    since = len(server.requests)
+    assert gisflu.count(cred, HA=["3"])["records"] == 20
+    commands = [r.content for r in server.requests[since:] if r.method == "POST"]
+    assert b"Cancel" in commands[0] and b"GoBack" in commands[1]
+    assert cred.currentPage == "browse"
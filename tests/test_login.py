@@ -11,6 +11,5 @@ def test_login():
     cred = gisflu.login()
     assert cred.sessionId is not None, "Failed to fetch GISAID"
     assert cred.browseParamsCeid["type"] is not None, "Failed to parse browse page"
-    assert (
-        cred.downloadParamsCeid["downloadConfirm"] is not None
-    ), "Failed to parse download page"
+    # the download page is parsed by the first download
+    assert cred.downloadParamsCeid == {}
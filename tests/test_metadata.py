@@ -0,0 +1,139 @@
+import io
+import importlib.util
+import pytest
+import pandas as pd
+import gisflu
+from gisflu.metadata import (
+    sniffFormat,
+    metadataRows,
+    metadataFrames,
+    metadataToSearch,
+    parseMetadata,
+)
+
+tsv = (
+    "Isolate_Id\tIsolate_Name\tSubtype\tHA Segment_Id\tCollection_Date\n"
+    "EPI_ISL_1\tA/Mock/1/2024\tA / H3N2\tEPI1|A/Mock/1/2024\t2024-01-02\n"
+    "EPI_ISL_2\tA/Café/2/2024\tA / H1N1\t\t2024-02-03\n"
+    "EPI_ISL_3\tA/Mock/3/2024\tA / H5N1\tEPI3|A/Mock/3/2024\t2024-03-04\n"
+).encode()
+
+html = (
+    "<html><body><table>"
+    "<tr><th>Isolate_Id</th><th>Isolate_Name</th><th>Host</th></tr>"
+    "<tr><td>EPI_ISL_1</td><td>A/Mock/1/2024</td><td>Human</td></tr>"
+    "<tr><td>EPI_ISL_2</td><td>A/Mock &amp; 2/2024</td><td></td></tr>"
+    "</table></body></html>"
+).encode()
+
+
+def byteChunks(content, size):
+    return (content[i : i + size] for i in range(0, len(content), size))
+
+
+def test_sniffFormat():
+    assert sniffFormat(bytes.fromhex("d0cf11e0a1b11ae1") + b"\0" * 8) == "ole2"
+    assert sniffFormat(b"PK\x03\x04rest") == "xlsx"
+    assert sniffFormat(b"\xef\xbb\xbf\n <html>") == "html"
+    assert sniffFormat(b"Isolate_Id\tIsolate_Name\n") == "tsv"
+
+
+def test_metadataRows():
+    # single bytes chunks split multi-byte characters and lines
+    rows = list(metadataRows(byteChunks(tsv, 1)))
+    assert len(rows) == 4
+    assert rows[2][1] == "A/Café/2/2024"
+
+    rows = list(metadataRows(byteChunks(html, 7)))
+    assert rows == [
+        ["Isolate_Id", "Isolate_Name", "Host"],
+        ["EPI_ISL_1", "A/Mock/1/2024", "Human"],
+        ["EPI_ISL_2", "A/Mock & 2/2024", ""],
+    ]
+
+
+def test_metadataChunks():
+    frames = list(gisflu.metadataChunks(byteChunks(tsv, 10), chunkSize=2))
+    assert [len(df) for df in frames] == [2, 1]
+
+    df = pd.concat(frames, ignore_index=True)
+    assert list(df.columns) == [
+        "Isolate ID",
+        "Name",
+        "Subtype",
+        "HA",
+        "Collection Date",
+    ]
+    assert df["HA"][0] == "EPI1" and pd.isna(df["HA"][1])
+    assert df["Collection Date"][0] == "2024-01-02"
+
+    # the same records as reading the whole export
+    whole = metadataToSearch(parseMetadata(io.BytesIO(tsv)))
+    assert df.equals(whole)
+    strings = metadataToSearch(pd.read_csv(io.BytesIO(tsv), sep="\t", dtype=str))
+    frames = gisflu.metadataChunks(byteChunks(tsv, 10))
+    assert (
+        pd.concat(frames).fillna("").values.tolist()
+        == strings.fillna("").values.tolist()
+    )
+
+    # an export without rows keeps its columns
+    frames = list(metadataFrames([tsv.split(b"\n")[0]]))
+    assert len(frames) == 1 and frames[0].shape == (0, 5)
+
+
+def test_metadataWorkbook(monkeypatch):
+    # a real workbook is spooled, then read as a whole
+    read = []
+
+    def readExcel(fileobj, dtype):
+        read.append(fileobj.read())
+        return pd.DataFrame({"Isolate_Id": ["EPI_ISL_1"], "Host": [float("nan")]})
+
+    monkeypatch.setattr(pd, "read_excel", readExcel)
+    monkeypatch.setattr(gisflu.metadata, "importWorkbookEngine", lambda f: "xlrd")
+    workbook = bytes.fromhex("d0cf11e0a1b11ae1") + b"\0" * 10000
+    frames = list(gisflu.metadataChunks(byteChunks(workbook, 1000)))
+
+    assert read == [workbook]
+    assert frames[0].to_dict(orient="records") == [
+        {"Isolate ID": "EPI_ISL_1", "Host": None}
+    ]
+
+
+def test_metadataTypes():
+    content = (
+        "Isolate_Id\tLineage\tCollection_Date\n"
+        "EPI_ISL_1\t1\t2024-03\n"
+        "EPI_ISL_2\t1\t2024-01-02\n"
+        "EPI_ISL_3\tpdm09\t2024-01-03\n"
+    ).encode()
+
+    # the types do not depend on the values of a chunk
+    frames = list(gisflu.metadataChunks([content], chunkSize=2))
+    assert [df["Lineage"].tolist() for df in frames] == [["1", "1"], ["pdm09"]]
+    assert frames[0]["Collection Date"].tolist() == ["2024-03", "2024-01-02"]
+    assert {str(df[c].dtype) for df in frames for c in df.columns} == {"object"}
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("xlrd") is not None, reason="xlrd is installed"
+)
+def test_workbookEngine():
+    workbook = bytes.fromhex("d0cf11e0a1b11ae1") + b"\0" * 100
+    with pytest.raises(ImportError, match=r"gisflu\[xls\]"):
+        list(gisflu.metadataChunks([workbook]))
+
+
+def test_syncMetadataChunks(cred, tmp_path):
+    isolateIds = list(gisflu.search(cred, recordLimit=30)["Isolate ID"])
+    output = str(tmp_path / "metadata.xls.gz")
+    gisflu.download(cred, isolateIds, downloadType="metadata", filename=output)
+
+    frames = list(gisflu.metadataChunks(output, chunkSize=7))
+    assert [len(df) for df in frames] == [7, 7, 7, 7, 2]
+    assert "Collection Date" in frames[0].columns
+
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    assert store.syncMetadata(output) == 30
+    assert store.count() == 30
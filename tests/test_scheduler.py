@@ -0,0 +1,72 @@
+import time
+import threading
+import pytest
+import gisflu
+
+
+def test_schedulerLimits(pool):
+    lock = threading.Lock()
+    running = {"bulk": 0, "interactive": 0}
+    peak = {"bulk": 0, "interactive": 0}
+    finished = []
+
+    def job(cred, jobClass, seconds):
+        with lock:
+            running[jobClass] += 1
+            peak[jobClass] = max(peak[jobClass], running[jobClass])
+        time.sleep(seconds)
+        with lock:
+            running[jobClass] -= 1
+            finished.append(jobClass)
+        return cred.sessionId
+
+    with gisflu.scheduler(pool) as jobs:
+        bulk = [jobs.submit(job, "bulk", 0.3, jobClass="bulk") for _ in range(3)]
+        time.sleep(0.05)
+        interactive = [
+            jobs.submit(job, "interactive", 0.01, jobClass="interactive")
+            for _ in range(3)
+        ]
+        # served by the session bulk jobs leave free
+        for future in interactive:
+            assert future.result(timeout=0.25) in [c.sessionId for c in pool.sessions]
+        assert jobs.stats()["bulk"]["running"] == 1
+
+    assert all(future.done() for future in bulk)
+    assert peak["bulk"] == 1
+    assert finished[:3] == ["interactive"] * 3
+    assert jobs.stats()["interactive"]["started"] == 3
+
+
+def test_schedulerOperations(pool):
+    with gisflu.scheduler(pool, limits={"interactive": 2, "bulk": 1}) as jobs:
+        counted = jobs.submit(gisflu.count, HA=["3"])
+        searched = jobs.submit(gisflu.search, HA=["3"], recordLimit=100)
+        assert counted.result()["records"] == 20
+        assert searched.result().shape[0] == 20
+
+        failed = jobs.submit(gisflu.download, ["EPI_ISL_1"], downloadType="xls")
+        with pytest.raises(AssertionError):
+            failed.result()
+
+    with pytest.raises(AssertionError):
+        jobs.submit(gisflu.count, HA=["3"])
+
+
+def test_schedulerCancelQueued(pool):
+    jobs = gisflu.scheduler(pool, limits={"bulk": 1})
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(cred):
+        started.set()
+        release.wait()
+
+    first = jobs.submit(block, jobClass="bulk")
+    queued = jobs.submit(block, jobClass="bulk")
+    started.wait()
+    threading.Timer(0.1, release.set).start()
+    jobs.close(cancelQueued=True)
+
+    assert first.result() is None
+    assert queued.cancelled()
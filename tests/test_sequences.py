@@ -0,0 +1,59 @@
+import threading
+import gisflu
+from gisflu.sequences import readFasta, parseHeader
+
+
+def test_sequenceStore(cred, server, tmp_path):
+    seqs = gisflu.sequenceStore(str(tmp_path / "seq.db"))
+    isolateIds = [r["a"] for r in server.records[:12]]
+    filename = str(tmp_path / "records.fasta")
+    gisflu.download(cred, isolateIds, filename=filename, seqStore=seqs)
+
+    # the mock frontend serves 4 distinct sequences per segment
+    stats = seqs.stats()
+    assert stats["records"] == 24
+    assert stats["sequences"] == 8
+    assert stats["storedBytes"] * 3 == stats["expandedBytes"]
+
+    # syncing again adds nothing
+    seqs.syncFasta(filename)
+    assert seqs.stats() == stats
+
+    exported = str(tmp_path / "export.fasta")
+    assert seqs.exportFasta(exported) == 24
+    with open(filename) as f, open(exported) as g:
+        assert sorted(readFasta(f)) == sorted(readFasta(g))
+
+    assert seqs.exportFasta(exported, isolateIds=isolateIds[:2], segments=["HA"]) == 2
+
+
+def test_parseHeader():
+    fields = parseHeader("EPI1|HA|A/Mock/1/2024|EPI_ISL_1|A_/_H3N2|2024-01-01")
+    assert fields["Isolate ID"] == "EPI_ISL_1"
+    assert fields["Date"] == "2024-01-01"
+    fields = parseHeader("EPI1|HA|A/Mock/1/2024|EPI_ISL_1|A_/_H3N2@2024-01-01")
+    assert fields["Type"] == "A_/_H3N2"
+
+
+def test_recordsBatches(tmp_path, monkeypatch):
+    monkeypatch.setattr(gisflu.sequences, "fetchSize", 3)
+    seqs = gisflu.sequenceStore(str(tmp_path / "seq.db"))
+    seqs.syncRecords(
+        [
+            (f"EPI{i}|HA|A/Mock/{i}/2024|EPI_ISL_{i:02}|A_/_H3N2|2024", "ACGT")
+            for i in range(10)
+        ]
+    )
+
+    # the store can be written from another thread while the records are consumed
+    records = seqs.records()
+    assert next(records)[0].startswith("EPI0|")
+    writer = threading.Thread(
+        target=seqs.syncRecords,
+        args=([("EPI99|NA|A/Mock/99/2024|EPI_ISL_99|A_/_H3N2|2024", "ACGG")],),
+    )
+    writer.start()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+    assert len(list(records)) >= 9
+    assert seqs.stats()["records"] == 11
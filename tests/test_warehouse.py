@@ -0,0 +1,104 @@
+import pandas as pd
+import gisflu
+
+
+def test_localSearch(cred, tmp_path):
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    df = gisflu.search(cred, host=["human", "avian"], recordLimit=100, store=store)
+    assert store.count() == 60
+
+    local = gisflu.localSearch(store, HA=["3"])
+    live = gisflu.search(cred, HA=["3"], recordLimit=100)
+    assert local["Isolate ID"].tolist() == live["Isolate ID"].tolist()
+    assert local.columns.tolist() == df.columns.tolist()
+
+    local = gisflu.localSearch(
+        store, type=["A"], NA=["1"], host=["HUMAN"], collectDateFrom="2024-06-01"
+    )
+    assert set(local["Subtype"]) == {"A / H1N1"}
+    assert set(local["Host"]) == {"Human"}
+    assert (local["Collection Date"] >= "2024-06-01").all()
+
+    local = gisflu.localSearch(store, location="europe", lineage=["pdm09"])
+    assert local.shape[0] == 20
+    assert set(local["Location"]) == {"Europe / France"}
+
+    assert gisflu.localSearch(store, searchPattern="Mock/7/").shape[0] == 1
+    assert gisflu.localSearch(store, recordLimit=5).shape[0] == 5
+    assert gisflu.localSearch(store, requestSegments=["HA", "NA"]).shape[0] == 60
+
+
+def test_syncMetadata(cred, tmp_path):
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    isolateIds = ["EPI_ISL_19000000", "EPI_ISL_19000001"]
+    gisflu.download(
+        cred,
+        isolateIds,
+        downloadType="metadata",
+        filename=str(tmp_path / "meta.xls"),
+        store=store,
+    )
+
+    local = gisflu.localSearch(store, HA=["1"])
+    assert local["Isolate ID"].tolist() == ["EPI_ISL_19000001"]
+    assert local["Name"].tolist() == ["A/Mock/1/2024"]
+
+
+def test_diff(cred, tmp_path):
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    store.sync(gisflu.search(cred, host=["human", "avian"], recordLimit=100))
+
+    df = gisflu.search(cred, HA=["3"], recordLimit=100)
+    changes = gisflu.diff(store, df, HA=["3"])
+    assert changes["unchanged"] == 20
+    assert changes["added"] == changes["removed"] == changes["changed"] == []
+
+    revised = df.copy()
+    revised.loc[0, "Host"] = "Swine"
+    new = revised.iloc[[1]].assign(**{"Isolate ID": "EPI_ISL_1"})
+    revised = pd.concat([revised.iloc[:-1], new])
+    changes = gisflu.diff(store, revised, HA=["3"])
+    assert changes["changed"] == [df.loc[0, "Isolate ID"]]
+    assert changes["added"] == ["EPI_ISL_1"]
+    assert changes["removed"] == [df["Isolate ID"].iloc[-1]]
+
+    # syncing keeps removed records in the store
+    store.sync(revised)
+    changes = gisflu.diff(store, revised, HA=["3"])
+    assert changes["unchanged"] == 20
+    assert changes["removed"] == [df["Isolate ID"].iloc[-1]]
+
+
+def test_syncMerge(tmp_path):
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    record = {
+        "Isolate ID": "EPI_ISL_1",
+        "Subtype": "A / H1N1",
+        "Lineage": "pdm09",
+        "HA": "EPI1",
+    }
+    store.sync(pd.DataFrame([record]))
+
+    # an empty value keeps the stored one, in the record and in the indexed columns
+    store.sync(pd.DataFrame([{**record, "Lineage": "", "HA": None, "NA": "EPI2"}]))
+    local = gisflu.localSearch(store, lineage=["pdm09"], requestSegments=["HA"])
+    assert local.shape[0] == 1
+    assert local["Lineage"][0] == "pdm09"
+    assert local["HA"][0] == "EPI1" and local["NA"][0] == "EPI2"
+    assert store.conn.execute("SELECT segments FROM isolates").fetchone() == (
+        ",HA,NA,",
+    )
+
+
+def test_diffClearedField(tmp_path):
+    store = gisflu.warehouse(str(tmp_path / "gisflu.db"))
+    record = {"Isolate ID": "EPI_ISL_1", "Subtype": "A / H1N1", "Lineage": "L1"}
+    store.sync(pd.DataFrame([record]))
+
+    # a field cleared by GISAID is changed once, the stored record keeps its value
+    cleared = pd.DataFrame([{**record, "Lineage": None}])
+    assert gisflu.diff(store, cleared)["changed"] == ["EPI_ISL_1"]
+    store.sync(cleared)
+    changes = gisflu.diff(store, cleared)
+    assert changes["changed"] == [] and changes["unchanged"] == 1
+    assert gisflu.localSearch(store)["Lineage"][0] == "L1"
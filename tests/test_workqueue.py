@@ -0,0 +1,145 @@
+import gzip
+import importlib
+import threading
+from functools import partial
+import pandas as pd
+import gisflu
+from gisflu.cli import main
+from gisflu.sequences import readFasta
+from .mockserver import mockServer, USERNAME, PASSWORD
+
+workqueueModule = importlib.import_module("gisflu.workqueue")
+
+
+def test_splitByDate():
+    slices = gisflu.splitByDate({"HA": ["3"]}, "2024-01-01", "2024-03-01", days=30)
+    assert [(s["collectDateFrom"], s["collectDateTo"]) for s in slices] == [
+        ("2024-01-01", "2024-01-30"),
+        ("2024-01-31", "2024-02-29"),
+        ("2024-03-01", "2024-03-01"),
+    ]
+    assert len(gisflu.splitByIds({}, [str(i) for i in range(5)], chunkSize=2)) == 3
+
+
+def test_lease(tmp_path):
+    queue = gisflu.workQueue(str(tmp_path / "queue"), maxAttempts=2)
+    queue.submit("search", [{"HA": ["3"]}])
+
+    # an expired lease is handed out again, the first completion wins
+    first = queue.lease("a", leaseSeconds=-1)
+    second = queue.lease("b")
+    assert first["id"] == second["id"]
+    assert queue.lease("c") is None
+    assert not queue.renew(first["id"], "a")
+    assert queue.complete(second["id"], "b", "out.csv", 1)
+    assert not queue.complete(first["id"], "a", "out.csv", 1)
+    assert queue.progress()["done"] == 1
+
+
+def test_leaseOnce(tmp_path):
+    path = str(tmp_path / "queue")
+    gisflu.workQueue(path).submit("search", [{"HA": [str(i)]} for i in range(20)])
+
+    # concurrent workers, each with its own queue object, never share a slice
+    leased = []
+
+    def work(name):
+        queue = gisflu.workQueue(path)
+        while (task := queue.lease(name)) is not None:
+            leased.append(task["id"])
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(leased) == list(range(1, 21))
+    assert gisflu.workQueue(path).progress()["leased"] == 20
+
+
+def test_runWorker(tmp_path):
+    server = mockServer(recordCount=60)
+    path = str(tmp_path / "queue")
+    coordinator = gisflu.workQueue(path)
+    params = {"host": ["human", "avian"], "recordLimit": 1000}
+    coordinator.submit(
+        "search", gisflu.splitByDate(params, "2024-01-01", "2024-12-31", 60)
+    )
+    # an overlapping slice, its records are merged once
+    coordinator.submit("search", [{**params, "collectDateFrom": "2024-06-01"}])
+    isolateIds = [r["a"] for r in server.records if r["e"] == "A / H3N2"]
+    coordinator.submit(
+        "download", gisflu.splitByIds({"segments": ["HA"]}, isolateIds, chunkSize=7)
+    )
+    # an overlapping slice, its records are merged once
+    coordinator.submit("download", [{"segments": ["HA"], "isolateIds": isolateIds[:5]}])
+
+    def work(name):
+        cred = gisflu.login(USERNAME, PASSWORD, httpClient=server.client())
+        gisflu.runWorker(
+            gisflu.workQueue(path), cred, str(tmp_path / "out"), name, waitSeconds=0.1
+        )
+
+    workers = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert coordinator.progress() == {
+        "pending": 0,
+        "leased": 0,
+        "done": 12,
+        "failed": 0,
+    }
+    assert coordinator.merge("search", str(tmp_path / "all.csv")) == 60
+    df = pd.read_csv(tmp_path / "all.csv")
+    assert df["Isolate ID"].is_unique
+
+    assert coordinator.merge("download", str(tmp_path / "h3.fasta")) == 20
+    with open(tmp_path / "h3.fasta") as f:
+        assert len(list(readFasta(f))) == 20
+
+
+def test_cli_queue(tmp_path, monkeypatch, capsys):
+    server = mockServer(recordCount=30)
+    monkeypatch.setattr(
+        "gisflu.workqueue.login",
+        lambda: gisflu.login(USERNAME, PASSWORD, httpClient=server.client()),
+    )
+    path = str(tmp_path / "queue")
+    params = '{"HA": ["1"], "recordLimit": 100}'
+    args = ["queue", "plan", path, "search", "--params", params]
+    assert (
+        main(args + ["--date-range", "2024-01-01", "2024-12-31", "--days", "120"]) == 0
+    )
+    assert main(["queue", "work", path, "-o", str(tmp_path / "out")]) == 0
+    assert main(["queue", "status", path]) == 0
+    assert main(["queue", "merge", path, "search", str(tmp_path / "h1.csv.gz")]) == 0
+    assert "10 records merged" in capsys.readouterr().out
+
+
+def test_mergeTables(tmp_path, monkeypatch):
+    # the parts are streamed chunk by chunk, the last row of an isolate is kept
+    monkeypatch.setattr(
+        workqueueModule,
+        "tableChunks",
+        partial(workqueueModule.tableChunks, chunkSize=1),
+    )
+    first = tmp_path / "part1.xls"
+    first.write_text(
+        "Isolate_Id\tHost\tCollection_Date\n"
+        "EPI_ISL_1\tHuman\t2024-01-02\n"
+        "EPI_ISL_2\t\t2024-02\n"
+    )
+    second = tmp_path / "part2.xls.gz"
+    with gzip.open(second, "wt") as f:
+        f.write("Isolate_Id\tHost\tCollection_Date\nEPI_ISL_1\tAvian\t2024-01-02\n")
+
+    merged = str(tmp_path / "metadata.tsv")
+    assert workqueueModule.mergeTables([str(first), str(second)], merged, False) == 2
+    df = pd.read_csv(merged, sep="\t", dtype=str)
+    assert df["Isolate_Id"].tolist() == ["EPI_ISL_2", "EPI_ISL_1"]
+    assert df["Host"].fillna("").tolist() == ["", "Avian"]
+    assert df["Collection_Date"].tolist() == ["2024-02", "2024-01-02"]